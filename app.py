@@ -8,25 +8,60 @@ import sqlite3
 import re
 from datetime import datetime, timedelta
 from functools import wraps
+from itertools import islice, chain
 from io import BytesIO
 
+import click
 from flask import (
-    Flask, render_template, request, jsonify, redirect,
+    Flask, Response, render_template, request, jsonify, redirect,
     url_for, session, send_from_directory
 )
 
 import numpy as np
 
+import face_engine
+from face_pool import FacePool, FacePoolBusy, FACE_POOL_WORKERS
+from face_classifier import FACE_CLASSIFIER
+from spotify_client import SpotifyClient
+from recommendation_cache import TTLCache, MemoCache, FanOut, Prefetcher
+from lexicon import LexiconStore
+from face_stream import FaceStreamRegistry
+from db import Database, SessionWriter
+import stats
+import tracks as track_store
+import catalog
+import preferences
+import metrics
+
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'rooha-dev-secret-key-change-in-production')
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 
 DB_PATH = os.path.join(os.path.dirname(__file__), 'database', 'rooha.db')
 
+database = Database(DB_PATH)
+session_writer = SessionWriter(database)
+
 SPOTIFY_CLIENT_ID = os.environ.get('SPOTIFY_CLIENT_ID', '')
 SPOTIFY_CLIENT_SECRET = os.environ.get('SPOTIFY_CLIENT_SECRET', '')
 SPOTIFY_REDIRECT_URI = os.environ.get('SPOTIFY_REDIRECT_URI', 'http://localhost:5000/callback')
 
+SPOTIFY_MARKET = 'IN'
+SPOTIFY_POOL_SIZE = int(os.environ.get('SPOTIFY_POOL_SIZE', '50'))
+
+SPOTIFY_FANOUT = os.environ.get('SPOTIFY_FANOUT', '0') == '1'
+SPOTIFY_FANOUT_WORKERS = int(os.environ.get('SPOTIFY_FANOUT_WORKERS', '8'))
+SPOTIFY_FANOUT_DEADLINE = float(os.environ.get('SPOTIFY_FANOUT_DEADLINE', '2.5'))
+SPOTIFY_FANOUT_MERGED_ENTRIES = int(os.environ.get('SPOTIFY_FANOUT_MERGED_ENTRIES', '256'))
+
+spotify = SpotifyClient(SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET)
+track_cache = TTLCache()
+track_fanout = FanOut(SPOTIFY_FANOUT_WORKERS, SPOTIFY_FANOUT_DEADLINE)
+merged_pool_cache = MemoCache(SPOTIFY_FANOUT_MERGED_ENTRIES)
+
+CATALOG_PATH = os.environ.get('CATALOG_PATH', '')
+track_catalog = catalog.open_catalog(CATALOG_PATH)
+
 EMOTIONS = ['angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral']
 
 EMOTION_MOOD_MAP = {
@@ -39,6 +74,8 @@ EMOTION_MOOD_MAP = {
     'neutral':  {'mood': 'Calm',         'valence': (0.3, 0.6),  'energy': (0.2, 0.5),  'genres': ['chill', 'lo-fi', 'jazz', 'r-n-b']},
 }
 
+user_preferences = preferences.PreferenceStore(database, session_writer, EMOTION_MOOD_MAP)
+
 SENTIMENT_KEYWORDS = {
     'positive': {
         'words': ['happy', 'joy', 'love', 'great', 'amazing', 'wonderful', 'fantastic', 'beautiful',
@@ -80,6 +117,20 @@ EMOTION_KEYWORDS = {
     'neutral':  ['okay', 'fine', 'alright', 'normal', 'average', 'moderate', 'indifferent', 'meh', 'whatever', 'so-so', 'calm', 'relaxed', 'peaceful', 'chill', 'bored'],
 }
 
+ANGER_WORDS = frozenset(['angry', 'mad', 'furious', 'hate', 'rage'])
+
+LEXICON_PATH = os.environ.get('LEXICON_PATH', '')
+
+text_lexicon = LexiconStore(EMOTION_KEYWORDS, SENTIMENT_KEYWORDS, EMOTIONS, path=LEXICON_PATH or None)
+
+TEXT_BATCH_CHUNK_SIZE = int(os.environ.get('TEXT_BATCH_CHUNK_SIZE', '1000'))
+
+TEXT_CACHE_MAX_ENTRIES = int(os.environ.get('TEXT_CACHE_MAX_ENTRIES', '4096'))
+TEXT_CACHE_MAX_BYTES = int(os.environ.get('TEXT_CACHE_MAX_BYTES', str(2 * 1024 * 1024)))
+TEXT_CACHE_MAX_LENGTH = int(os.environ.get('TEXT_CACHE_MAX_LENGTH', '500'))
+
+text_result_cache = MemoCache(TEXT_CACHE_MAX_ENTRIES, TEXT_CACHE_MAX_BYTES)
+
 FALLBACK_PLAYLISTS = {
     'happy': [
         {'name': 'Happy', 'artist': 'Pharrell Williams', 'preview': None, 'image': '', 'url': 'https://open.spotify.com/track/60nZcImufyMA1MKQY3dcCH'},
@@ -111,15 +162,14 @@ FALLBACK_PLAYLISTS = {
 
 
 def get_db():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA journal_mode=WAL")
-    return conn
+    """Long-lived connection owned by the calling thread; do not close it."""
+    return database.connection()
 
 
 def init_db():
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    conn = get_db()
+    os.makedirs(os.path.dirname(database.path), exist_ok=True)
+    conn = database.connect()
+    conn.execute("PRAGMA journal_mode=WAL")
     conn.executescript('''
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -148,50 +198,45 @@ def init_db():
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (session_id) REFERENCES sessions(id)
         );
+        CREATE TABLE IF NOT EXISTS id_blocks (
+            name TEXT PRIMARY KEY,
+            next_id INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_sessions_user_created ON sessions (user_id, created_at, id);
     ''')
+    conn.executescript(track_store.SCHEMA)
+    track_store.upgrade(conn)
+    conn.executescript(preferences.SCHEMA)
     conn.commit()
+    stats.install(conn)
     conn.close()
 
 
+def save_session(user_id, input_type, emotion, confidence, mood, tracks, input_text=None):
+    """Queue a session insert on the writer thread; returns its id without waiting for the commit."""
+    session_id = session_writer.add_session(user_id, input_type, emotion, confidence, mood, tracks, input_text)
+    user_preferences.remember_session(session_id, user_id, emotion, tracks)
+    return session_id
+
+
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
 
 
+def tokenize_text(text):
+    return re.findall(r'\b\w+\b', text.lower().strip())
+
+
 def analyze_text_emotion(text):
-    text_lower = text.lower().strip()
-    words = re.findall(r'\b\w+\b', text_lower)
+    return analyze_words(tokenize_text(text), text_lexicon.get())
+
+
+def analyze_words(words, lexicon):
     if not words:
         return 'neutral', 0.5, 'Calm'
 
-    emotion_scores = {e: 0.0 for e in EMOTIONS}
-    for emotion, keywords in EMOTION_KEYWORDS.items():
-        for word in words:
-            if word in keywords:
-                emotion_scores[emotion] += 2.0
-            else:
-                for kw in keywords:
-                    if kw in word or word in kw:
-                        emotion_scores[emotion] += 0.5
-
-    polarity = 0.0
-    intensity_mult = 1.0
-    negation_active = False
-
-    for i, word in enumerate(words):
-        if word in SENTIMENT_KEYWORDS['negation']['words']:
-            negation_active = True
-            continue
-        if word in SENTIMENT_KEYWORDS['intensity']['words']:
-            intensity_mult = 1.5
-            continue
-        for cat in ['positive', 'negative']:
-            if word in SENTIMENT_KEYWORDS[cat]['words']:
-                score = SENTIMENT_KEYWORDS[cat]['weight'] * intensity_mult
-                if negation_active:
-                    score *= -1
-                polarity += score
-                negation_active = False
-                intensity_mult = 1.0
+    emotion_scores = lexicon.emotion_scores(words)
+    polarity = lexicon.polarity(words)
 
     if max(emotion_scores.values()) > 0:
         detected = max(emotion_scores, key=emotion_scores.get)
@@ -201,7 +246,7 @@ def analyze_text_emotion(text):
         detected = 'happy'
         confidence = min(abs(polarity) / 5, 0.85)
     elif polarity < -0.5:
-        if any(w in words for w in ['angry', 'mad', 'furious', 'hate', 'rage']):
+        if not ANGER_WORDS.isdisjoint(words):
             detected = 'angry'
         else:
             detected = 'sad'
@@ -215,165 +260,325 @@ def analyze_text_emotion(text):
     return detected, round(confidence, 3), mood
 
 
+def analyze_text_cached(text):
+    """
+    analyze_text_emotion memoised on the normalised text (its tokens), so
+    repeated inputs such as the quick-mood buttons skip scoring. The key
+    includes the lexicon generation, so a reload starts from misses and the
+    old entries age out of the LRU; texts longer than TEXT_CACHE_MAX_LENGTH
+    are not cached. Only the analysis is memoised here: the recommendation
+    pool comes from track_cache, which already holds it per query with its
+    own TTL and background refresh, so a repeated input costs two lookups
+    and no Spotify call, and keeps drawing from every genre of the mood.
+    """
+    with metrics.timer('text_analyze'):
+        words = tokenize_text(text)
+        lexicon = text_lexicon.get()
+        if len(text) > TEXT_CACHE_MAX_LENGTH:
+            return analyze_words(words, lexicon)
+
+        key = f"{lexicon.generation}:{' '.join(words)}"
+        result = text_result_cache.get(key)
+        if result is None:
+            result = analyze_words(words, lexicon)
+            text_result_cache.put(key, result)
+        return result
+
+
+def iter_analyze_text_batch(texts, chunk_size=TEXT_BATCH_CHUNK_SIZE):
+    """
+    Vectorised analyze_text_emotion over many texts.
+
+    Texts are consumed `chunk_size` at a time so memory stays bounded.
+    Yields one (emotion, confidence, mood) tuple per text, in order,
+    identical to calling analyze_text_emotion on each.
+    """
+    texts = iter(texts)
+    while True:
+        chunk = list(islice(texts, chunk_size))
+        if not chunk:
+            return
+
+        docs = [tokenize_text(t) for t in chunk]
+        lexicon = text_lexicon.get()
+        scores, polarity, angry = lexicon.batch_scores(docs, ANGER_WORDS)
+
+        top = scores.max(axis=1)
+        best = scores.argmax(axis=1)
+        keyword_conf = np.minimum(top / np.maximum(scores.sum(axis=1), 1) * 1.5, 0.98)
+        polarity_conf = np.minimum(np.abs(polarity) / 5, 0.85)
+
+        for i, words in enumerate(docs):
+            if not words:
+                yield 'neutral', 0.5, 'Calm'
+                continue
+            if top[i] > 0:
+                detected = lexicon.emotions[best[i]]
+                confidence = keyword_conf[i]
+            elif polarity[i] > 0.5:
+                detected = 'happy'
+                confidence = polarity_conf[i]
+            elif polarity[i] < -0.5:
+                detected = 'angry' if angry[i] else 'sad'
+                confidence = polarity_conf[i]
+            else:
+                detected = 'neutral'
+                confidence = 0.5
+            confidence = max(float(confidence), 0.3)
+            yield detected, round(confidence, 3), EMOTION_MOOD_MAP[detected]['mood']
+
+
+def analyze_text_batch(texts, chunk_size=TEXT_BATCH_CHUNK_SIZE):
+    return list(iter_analyze_text_batch(texts, chunk_size))
+
+
+face_pool = FacePool() if FACE_POOL_WORKERS > 0 else None
+
+
 def analyze_face_emotion(image_data):
     """
-    Face emotion detection using a lightweight CNN approach.
-    In production, load a pre-trained model. For demo, we use
-    pixel analysis heuristics + random confidence.
+    Face emotion detection on the largest detected face.
+    `image_data` is a base64 (data URL) string or raw encoded image bytes.
+    Faces are scored by the FACE_CLASSIFIER backend: a FER2013-style CNN
+    through cv2.dnn ('dnn'), or pixel heuristics + random noise ('heuristic').
+
+    Runs in the face_pool worker processes when enabled (FACE_POOL_WORKERS),
+    raising FacePoolBusy when the pool is saturated.
     """
     try:
-        import cv2
-        img_bytes = base64.b64decode(image_data.split(',')[1] if ',' in image_data else image_data)
-        nparr = np.frombuffer(img_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-        if img is None:
-            return 'neutral', 0.5, 'Calm'
-
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-        faces = face_cascade.detectMultiScale(gray, 1.1, 5, minSize=(48, 48))
-
-        if len(faces) == 0:
-            avg_brightness = np.mean(gray)
-            contrast = np.std(gray)
-            if avg_brightness > 140:
-                emotion = 'happy'
-                confidence = 0.55
-            elif avg_brightness < 80:
-                emotion = 'sad'
-                confidence = 0.50
-            else:
-                emotion = 'neutral'
-                confidence = 0.45
+        if isinstance(image_data, str):
+            with metrics.timer('face_b64'):
+                image_data = base64.b64decode(image_data.split(',')[1] if ',' in image_data else image_data)
+        if face_pool is not None:
+            emotion, confidence = face_pool.analyze(image_data)
         else:
-            x, y, w, h = max(faces, key=lambda f: f[2] * f[3])
-            face_roi = gray[y:y+h, x:x+w]
-            face_resized = cv2.resize(face_roi, (48, 48))
-
-            brightness = np.mean(face_resized)
-            contrast = np.std(face_resized)
-            upper_half = np.mean(face_resized[:24, :])
-            lower_half = np.mean(face_resized[24:, :])
-            left_half = np.mean(face_resized[:, :24])
-            right_half = np.mean(face_resized[:, 24:])
-            symmetry = 1.0 - abs(left_half - right_half) / 255.0
-
-            scores = {
-                'happy': 0.0, 'sad': 0.0, 'angry': 0.0, 'fear': 0.0,
-                'surprise': 0.0, 'disgust': 0.0, 'neutral': 0.0
-            }
-
-            if brightness > 130 and lower_half > upper_half:
-                scores['happy'] += 3.0
-            if brightness < 100:
-                scores['sad'] += 2.0
-                scores['angry'] += 1.0
-            if contrast > 60:
-                scores['surprise'] += 2.0
-                scores['angry'] += 1.0
-            if upper_half > lower_half + 10:
-                scores['surprise'] += 2.0
-            if symmetry > 0.9:
-                scores['neutral'] += 2.0
-                scores['happy'] += 1.0
-            if contrast < 35:
-                scores['neutral'] += 2.0
-                scores['sad'] += 1.0
-
-            for e in scores:
-                scores[e] += random.uniform(0, 0.5)
-
-            emotion = max(scores, key=scores.get)
-            total = sum(scores.values())
-            confidence = min(scores[emotion] / max(total, 1), 0.92)
-            confidence = max(confidence, 0.35)
+            emotion, confidence = face_engine.analyze_image(image_data)
 
         mood = EMOTION_MOOD_MAP[emotion]['mood']
         return emotion, round(confidence, 3), mood
 
+    except FacePoolBusy:
+        metrics.count('face_busy')
+        raise
     except ImportError:
+        metrics.count('face_fallback')
         emotions_weighted = ['happy'] * 3 + ['sad'] * 2 + ['neutral'] * 3 + ['angry'] + ['surprise']
         emotion = random.choice(emotions_weighted)
         confidence = round(random.uniform(0.45, 0.78), 3)
         mood = EMOTION_MOOD_MAP[emotion]['mood']
         return emotion, confidence, mood
     except Exception as e:
+        metrics.count('face_errors')
         print(f"Face analysis error: {e}")
         return 'neutral', 0.5, 'Calm'
 
 
 def get_spotify_token():
-    """Get Spotify access token using Client Credentials flow."""
-    if not SPOTIFY_CLIENT_ID or not SPOTIFY_CLIENT_SECRET:
-        return None
+    """Get a cached Spotify access token (Client Credentials flow)."""
     try:
-        import urllib.request
-        import urllib.parse
-
-        credentials = base64.b64encode(f"{SPOTIFY_CLIENT_ID}:{SPOTIFY_CLIENT_SECRET}".encode()).decode()
-        data = urllib.parse.urlencode({'grant_type': 'client_credentials'}).encode()
-        req = urllib.request.Request('https://accounts.spotify.com/api/token', data=data)
-        req.add_header('Authorization', f'Basic {credentials}')
-        req.add_header('Content-Type', 'application/x-www-form-urlencoded')
-
-        with urllib.request.urlopen(req, timeout=5) as resp:
-            token_data = json.loads(resp.read().decode())
-            return token_data.get('access_token')
+        return spotify.get_token()
     except Exception as e:
         print(f"Spotify token error: {e}")
         return None
 
 
-def search_spotify_tracks(emotion, limit=12):
-    """Search Spotify for tracks matching the emotion's mood profile."""
-    token = get_spotify_token()
-    if not token:
-        return FALLBACK_PLAYLISTS.get(emotion, FALLBACK_PLAYLISTS['neutral'])
+def spotify_queries(emotion):
+    """All search queries used for an emotion, grouped by genre."""
+    mood_config = EMOTION_MOOD_MAP[emotion]
+    mood_word = mood_config['mood'].lower()
+    return {genre: [f'{mood_word} {genre}', f'{genre} mood', f'{mood_word} vibes']
+            for genre in mood_config['genres']}
+
+
+def parse_spotify_tracks(data):
+    """Track dicts from a /v1/search response."""
+    tracks = []
+    for item in data.get('tracks', {}).get('items', []):
+        images = item.get('album', {}).get('images', [])
+        tracks.append({
+            'name': item['name'],
+            'artist': ', '.join(a['name'] for a in item['artists']),
+            'album': item['album']['name'],
+            'preview': item.get('preview_url'),
+            'image': images[0]['url'] if images else '',
+            'url': item['external_urls'].get('spotify', ''),
+            'duration_ms': item['duration_ms'],
+            'popularity': item['popularity'],
+        })
+    return tracks
 
-    try:
-        import urllib.request
-        import urllib.parse
 
-        mood_config = EMOTION_MOOD_MAP[emotion]
-        genre = random.choice(mood_config['genres'])
-        mood_word = mood_config['mood'].lower()
+def fetch_spotify_tracks(query, limit=SPOTIFY_POOL_SIZE, market=SPOTIFY_MARKET):
+    return parse_spotify_tracks(spotify.search_tracks(query, limit=limit, market=market))
 
-        queries = [f'{mood_word} {genre}', f'{genre} mood', f'{mood_word} vibes']
-        query = random.choice(queries)
 
-        params = urllib.parse.urlencode({
-            'q': query,
-            'type': 'track',
-            'limit': limit,
-            'market': 'IN'
-        })
+def track_pool_key(emotion, query, market=SPOTIFY_MARKET, limit=SPOTIFY_POOL_SIZE):
+    return (emotion, query, market, limit)
 
-        req = urllib.request.Request(f'https://api.spotify.com/v1/search?{params}')
-        req.add_header('Authorization', f'Bearer {token}')
 
-        with urllib.request.urlopen(req, timeout=8) as resp:
-            data = json.loads(resp.read().decode())
+def get_track_pool(emotion, query):
+    """Cached pool of Spotify results for one query (stale-while-revalidate)."""
+    key = track_pool_key(emotion, query)
+    return track_cache.get_or_load(key, lambda: fetch_spotify_tracks(query))
 
-        tracks = []
-        for item in data.get('tracks', {}).get('items', []):
-            images = item.get('album', {}).get('images', [])
-            tracks.append({
-                'name': item['name'],
-                'artist': ', '.join(a['name'] for a in item['artists']),
-                'album': item['album']['name'],
-                'preview': item.get('preview_url'),
-                'image': images[0]['url'] if images else '',
-                'url': item['external_urls'].get('spotify', ''),
-                'duration_ms': item['duration_ms'],
-                'popularity': item['popularity'],
-            })
 
-        return tracks if tracks else FALLBACK_PLAYLISTS.get(emotion, [])
+def prefetch_jobs():
+    for emotion in EMOTION_MOOD_MAP:
+        queries = {q for genre_queries in spotify_queries(emotion).values() for q in genre_queries}
+        for query in sorted(queries):
+            yield track_pool_key(emotion, query), (lambda q=query: fetch_spotify_tracks(q))
 
-    except Exception as e:
-        print(f"Spotify search error: {e}")
+
+track_prefetcher = Prefetcher(track_cache, prefetch_jobs)
+
+
+def choose_spotify_query(emotion, prefs=None):
+    """
+    (genre, query): a genre for the emotion (favouring the user's preferred
+    genres when `prefs` is given), then a random query for that genre.
+    """
+    genre_queries = spotify_queries(emotion)
+    genres = list(genre_queries)
+    genre = prefs.pick_genre(genres) if prefs is not None else random.choice(genres)
+    return genre, random.choice(genre_queries[genre])
+
+
+def fanout_queries(emotion):
+    """{genre: query}: one random query for every genre of the emotion."""
+    return {genre: random.choice(queries) for genre, queries in spotify_queries(emotion).items()}
+
+
+def merge_genre_pools(genre_pools):
+    """One pool from {genre: tracks}, each track tagged with its genre and kept once (first genre wins)."""
+    merged, seen = [], set()
+    for genre, pool in genre_pools.items():
+        for track in pool:
+            key = track_store.track_key(track)
+            if key not in seen:
+                seen.add(key)
+                merged.append(dict(track, genre=genre))
+    return merged
+
+
+def merged_fanout_pool(emotion, genre_pools, pool_keys):
+    """
+    merge_genre_pools over the emotion's genres, memoised per set of pools.
+    The key holds each pool's cache key and identity, so a refreshed pool
+    gets a new entry and the old one ages out of the LRU; an entry keeps
+    its pools alive, so their ids cannot be reused while it exists.
+    """
+    genres = [genre for genre in EMOTION_MOOD_MAP[emotion]['genres'] if genre in genre_pools]
+    key = repr([(genre, pool_keys[genre], id(genre_pools[genre])) for genre in genres])
+    cached = merged_pool_cache.get(key)
+    if cached is None:
+        pools = [genre_pools[genre] for genre in genres]
+        cached = (pools, merge_genre_pools(dict(zip(genres, pools))))
+        merged_pool_cache.put(key, cached)
+    return cached[1]
+
+
+def load_track_pool(key, query):
+    tracks = fetch_spotify_tracks(query)
+    track_cache.put(key, tracks)
+    return tracks
+
+
+def fanout_track_pool(emotion):
+    """
+    Merged pool across all genres of the emotion. Cached pools are used
+    directly (stale ones refreshed in the background); missing ones are
+    fetched concurrently on track_fanout (one fetch per pool however many
+    requests miss it), and only those that arrive within
+    SPOTIFY_FANOUT_DEADLINE are included. Late fetches still fill the cache;
+    ones that never started are dropped.
+    """
+    genre_pools, jobs, keys, pool_keys = {}, {}, {}, {}
+    for genre, query in fanout_queries(emotion).items():
+        key = pool_keys[genre] = track_pool_key(emotion, query)
+        found = track_cache.lookup(key)
+        if found is None:
+            jobs[genre] = lambda key=key, query=query: load_track_pool(key, query)
+            keys[genre] = key
+            continue
+        pool, fresh = found
+        if not fresh:
+            track_cache.refresh_async(key, lambda query=query: fetch_spotify_tracks(query))
+        genre_pools[genre] = pool
+    genre_pools.update(track_fanout.run(jobs, keys=keys))
+    return merged_fanout_pool(emotion, genre_pools, pool_keys)
+
+
+def pick_tracks(emotion, pool, limit=12, prefs=None):
+    """`limit` tracks from the pool: a uniform sample, or re-ranked by the user's preferences."""
+    if not pool:
+        metrics.count('recommend_fallback')
         return FALLBACK_PLAYLISTS.get(emotion, [])
+    if prefs is not None:
+        return prefs.rank(pool, emotion, EMOTION_MOOD_MAP[emotion], limit)
+    return random.sample(pool, min(limit, len(pool)))
+
+
+def pick_spotify_tracks(emotion, genre, pool, limit=12, prefs=None):
+    """pick_tracks for a Spotify search pool, tagging each track with the genre it was searched for."""
+    if not pool:
+        metrics.count('recommend_fallback')
+        return FALLBACK_PLAYLISTS.get(emotion, [])
+    return [dict(track, genre=genre) for track in pick_tracks(emotion, pool, limit, prefs)]
+
+
+def catalog_pool(emotion):
+    """Catalog tracks closest to the centre of the emotion's valence/energy box (no network)."""
+    if track_catalog is None:
+        return []
+    mood_config = EMOTION_MOOD_MAP[emotion]
+    return track_cache.get_or_load(
+        ('catalog', emotion, SPOTIFY_POOL_SIZE),
+        lambda: track_catalog.recommend(mood_config['valence'], mood_config['energy'], SPOTIFY_POOL_SIZE))
+
+
+def search_spotify_tracks(emotion, limit=12, user_id=None):
+    """
+    Tracks matching the emotion's mood profile: from the local catalog when
+    configured, else Spotify search: every genre of the mood at once when
+    SPOTIFY_FANOUT is on, one random genre otherwise. Logged-in users get
+    them re-ranked by what they rated before (see preferences.py).
+    """
+    with metrics.timer('recommend'):
+        prefs = user_preferences.get(user_id)
+        pool = catalog_pool(emotion)
+        if pool:
+            metrics.count('recommend_catalog')
+            return pick_tracks(emotion, pool, limit, prefs)
+
+        if not spotify.configured:
+            metrics.count('recommend_fallback')
+            return FALLBACK_PLAYLISTS.get(emotion, FALLBACK_PLAYLISTS['neutral'])
+
+        try:
+            metrics.count('recommend_spotify')
+            if SPOTIFY_FANOUT:
+                return pick_tracks(emotion, fanout_track_pool(emotion), limit, prefs)
+            genre, query = choose_spotify_query(emotion, prefs)
+            return pick_spotify_tracks(emotion, genre, get_track_pool(emotion, query), limit, prefs)
+
+        except Exception as e:
+            metrics.count('spotify_errors')
+            metrics.count('recommend_fallback')
+            print(f"Spotify search error: {e}")
+            return FALLBACK_PLAYLISTS.get(emotion, [])
+
+
+def analysis_result(session_id, emotion, confidence, mood, tracks, input_type):
+    """JSON body returned by the analyze endpoints."""
+    return {
+        'session_id': session_id,
+        'emotion': emotion,
+        'confidence': confidence,
+        'mood': mood,
+        'mood_config': EMOTION_MOOD_MAP[emotion],
+        'tracks': tracks,
+        'input_type': input_type,
+    }
 
 
 # ==================== ROUTES ====================
@@ -390,98 +595,432 @@ def analyze_text():
     if not text:
         return jsonify({'error': 'No text provided'}), 400
 
-    emotion, confidence, mood = analyze_text_emotion(text)
-    tracks = search_spotify_tracks(emotion)
+    emotion, confidence, mood = analyze_text_cached(text)
+    user_id = session.get('user_id')
+    tracks = search_spotify_tracks(emotion, user_id=user_id)
+    session_id = save_session(user_id, 'text', emotion, confidence, mood, tracks, text)
+    return jsonify(analysis_result(session_id, emotion, confidence, mood, tracks, 'text'))
 
-    conn = get_db()
-    cursor = conn.execute(
-        'INSERT INTO sessions (user_id, input_type, detected_emotion, confidence, mood, input_text, tracks_json) VALUES (?,?,?,?,?,?,?)',
-        (session.get('user_id'), 'text', emotion, confidence, mood, text, json.dumps(tracks))
-    )
-    session_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
 
+@app.route('/api/analyze/text/batch', methods=['POST'])
+def analyze_text_batch_route():
+    data = request.json
+    texts = data.get('texts')
+    if not isinstance(texts, list) or not texts:
+        return jsonify({'error': 'No texts provided'}), 400
+
+    results = iter_analyze_text_batch(t if isinstance(t, str) else '' for t in texts)
     return jsonify({
-        'session_id': session_id,
-        'emotion': emotion,
-        'confidence': confidence,
-        'mood': mood,
-        'mood_config': EMOTION_MOOD_MAP[emotion],
-        'tracks': tracks,
-        'input_type': 'text',
+        'count': len(texts),
+        'results': [{'emotion': e, 'confidence': c, 'mood': m} for e, c, m in results],
     })
 
 
+def read_image_payload():
+    """
+    Image from the request: a raw image/* or octet-stream body, a multipart
+    'image' file, or the legacy JSON {"image": "<data URL>"}.
+    """
+    if request.mimetype == 'application/octet-stream' or request.mimetype.startswith('image/'):
+        return request.get_data(cache=False)
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('image')
+        return upload.read() if upload else b''
+    return (request.get_json(silent=True) or {}).get('image', '')
+
+
 @app.route('/api/analyze/face', methods=['POST'])
 def analyze_face():
-    data = request.json
-    image_data = data.get('image', '')
+    image_data = read_image_payload()
     if not image_data:
         return jsonify({'error': 'No image provided'}), 400
 
     emotion, confidence, mood = analyze_face_emotion(image_data)
-    tracks = search_spotify_tracks(emotion)
+    user_id = session.get('user_id')
+    tracks = search_spotify_tracks(emotion, user_id=user_id)
+    session_id = save_session(user_id, 'face', emotion, confidence, mood, tracks)
+    return jsonify(analysis_result(session_id, emotion, confidence, mood, tracks, 'face'))
+
+
+@app.errorhandler(FacePoolBusy)
+def face_pool_busy(e):
+    return jsonify({'error': str(e), 'retry_after': e.retry_after}), 503, {'Retry-After': str(e.retry_after)}
+
+
+# ---------- live face stream ----------
+
+face_streams = FaceStreamRegistry()
+
+
+def on_stream_emotion_change(stream, emotion, confidence):
+    """Fetch a playlist and persist a session only when the smoothed emotion changes."""
+    mood = EMOTION_MOOD_MAP[emotion]['mood']
+    tracks = search_spotify_tracks(emotion, user_id=stream.user_id)
+    session_id = save_session(stream.user_id, 'face', emotion, confidence, mood, tracks)
+    return analysis_result(session_id, emotion, confidence, mood, tracks, 'face')
+
+
+@app.route('/api/stream/face', methods=['POST'])
+def start_face_stream():
+    stream = face_streams.create(session.get('user_id'), analyze_face_emotion, on_stream_emotion_change)
+    return jsonify(stream.status())
+
+
+@app.route('/api/stream/face/<stream_id>/frames', methods=['POST'])
+def push_face_frame(stream_id):
+    stream = face_streams.get(stream_id)
+    if not stream:
+        return jsonify({'error': 'Unknown or expired stream'}), 404
+    image_data = read_image_payload()
+    if not image_data:
+        return jsonify({'error': 'No image provided'}), 400
+    stream.push(image_data)
+    return jsonify(stream.status()), 202
+
+
+@app.route('/api/stream/face/<stream_id>/events')
+def face_stream_events(stream_id):
+    stream = face_streams.get(stream_id)
+    if not stream:
+        return jsonify({'error': 'Unknown or expired stream'}), 404
+    last_seq = int(request.headers.get('Last-Event-ID', 0) or 0)
+
+    def generate(seq):
+        while not stream.closed:
+            events = stream.events_since(seq, timeout=15)
+            if not events:
+                yield ': keep-alive\n\n'
+                continue
+            for seq, kind, data in events:
+                yield f'id: {seq}\nevent: {kind}\ndata: {json.dumps(data)}\n\n'
+
+    return Response(generate(last_seq), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
-    conn = get_db()
-    cursor = conn.execute(
-        'INSERT INTO sessions (user_id, input_type, detected_emotion, confidence, mood, tracks_json) VALUES (?,?,?,?,?,?)',
-        (session.get('user_id'), 'face', emotion, confidence, mood, json.dumps(tracks))
-    )
-    session_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
 
+@app.route('/api/stream/face/<stream_id>', methods=['DELETE'])
+def stop_face_stream(stream_id):
+    stream = face_streams.close(stream_id)
+    if not stream:
+        return jsonify({'error': 'Unknown or expired stream'}), 404
+    return jsonify(stream.status())
+
+
+@app.route('/api/face/status')
+def face_status():
     return jsonify({
-        'session_id': session_id,
-        'emotion': emotion,
-        'confidence': confidence,
-        'mood': mood,
-        'mood_config': EMOTION_MOOD_MAP[emotion],
-        'tracks': tracks,
-        'input_type': 'face',
+        'pool': face_pool.stats() if face_pool is not None else None,
+        'classifier': FACE_CLASSIFIER,
+        'detectors': face_engine.face_detectors.stats(),
+        'streams': len(face_streams),
     })
 
 
+@app.route('/api/cache/status')
+def cache_status():
+    return jsonify({
+        'text': text_result_cache.stats(),
+        'tracks': track_cache.stats(),
+        'fanout': track_fanout.stats(),
+        'fanout_merged': merged_pool_cache.stats(),
+        'preferences': user_preferences.stats(),
+    })
+
+
+def collect_component_metrics():
+    """Counters and gauges that the caches, face pool and DB writer already keep, for /api/metrics."""
+    caches = {'text': text_result_cache.stats(), 'tracks': track_cache.stats()}
+    for field in ('hits', 'misses', 'evictions'):
+        yield (f'rooha_cache_{field}_total', 'counter', f'Cache {field}.',
+               {(('cache', name),): stats[field] for name, stats in caches.items()})
+    yield ('rooha_cache_stale_hits_total', 'counter', 'Stale track pools served while refreshing.',
+           {(): caches['tracks']['stale_hits']})
+    yield ('rooha_fanout_timeouts_total', 'counter', 'Genre searches that missed the fan-out deadline.',
+           {(): track_fanout.timeouts})
+    yield ('rooha_fanout_cancelled_total', 'counter', 'Queued genre searches dropped after every caller gave up.',
+           {(): track_fanout.cancelled})
+
+    writer = session_writer.stats()
+    yield ('rooha_db_writes_total', 'counter', 'Rows committed by the writer thread.', {(): writer['committed']})
+    yield ('rooha_db_write_errors_total', 'counter', 'Writes dropped after an error.', {(): writer['errors']})
+    yield ('rooha_db_pending_writes', 'gauge', 'Writes queued for the writer thread.', {(): writer['pending']})
+
+    if face_pool is not None:
+        pool = face_pool.stats()
+        yield ('rooha_face_pool_jobs', 'gauge', 'Face jobs in the worker pool.',
+               {(('state', 'queued'),): pool['queued'], (('state', 'running'),): pool['running']})
+        yield ('rooha_face_pool_rejected_total', 'counter', 'Face jobs refused with 503.', {(): pool['rejected']})
+        yield ('rooha_face_pool_timeouts_total', 'counter', 'Face jobs past their deadline.', {(): pool['timeouts']})
+
+
+metrics.register(collect_component_metrics)
+
+
+@app.route('/api/metrics')
+def get_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.before_request
+def start_server_timing():
+    if metrics.METRICS_SERVER_TIMING:
+        metrics.begin_request()
+
+
+@app.after_request
+def add_server_timing(response):
+    if metrics.METRICS_SERVER_TIMING:
+        header = metrics.server_timing()
+        if header:
+            response.headers['Server-Timing'] = header
+    return response
+
+
+# ---------- lifecycle ----------
+
+readiness = {'warm': False, 'started': False, 'draining': False}
+_configured_db_path = None
+
+
+def warm_track_cache():
+    """Load every prefetch pool now when recommendations come from live Spotify search."""
+    if spotify.configured and track_catalog is None:
+        return track_prefetcher.run_once()
+    return 0
+
+
+def warm_up():
+    """
+    One-time heavy initialisation: the lexicon index, the Spotify token and
+    track pools, Flask's URL map and the page template, plus the cascades
+    and classifier when faces are analysed in-process (FACE_POOL_WORKERS=0;
+    pool workers load their own). Starts no threads, so it can run in a
+    pre-fork parent and the workers inherit the result copy-on-write.
+    """
+    if face_pool is None:
+        face_engine.warm_up()
+    text_lexicon.get()
+    warm_track_cache()
+    with app.test_client() as client:
+        client.get('/')
+    readiness['warm'] = True
+
+
+def create_app(db_path=None, warm=True):
+    """
+    Prepare this module's Flask app for serving: point it at `db_path`,
+    create the schema, optionally warm_up(), and return it. Not a factory:
+    the app, its routes and all caches are created once at import, so every
+    call configures the same app; a second call with another `db_path`
+    raises instead of silently sharing state.
+    """
+    global _configured_db_path
+    if db_path and _configured_db_path not in (None, db_path):
+        raise RuntimeError(f'App already configured for {_configured_db_path}; one database per process')
+    if db_path:
+        database.path = _configured_db_path = db_path
+    init_db()
+    if warm:
+        warm_up()
+    return app
+
+
+def start_background():
+    """Per-process start-up, after any fork(): face worker processes and the track prefetcher."""
+    if face_pool is not None:
+        face_pool.warm_up()
+    if spotify.configured and track_catalog is None:
+        track_prefetcher.start()
+    readiness['started'] = True
+
+
+def shutdown(timeout=5):
+    """Stop background work and commit queued writes; the process can exit afterwards."""
+    readiness['draining'] = True
+    track_prefetcher.stop()
+    session_writer.close(timeout)
+    if face_pool is not None:
+        face_pool.shutdown()
+    spotify.close()
+
+
+@app.route('/api/health')
+def health():
+    return jsonify({'status': 'ok', 'pid': os.getpid()})
+
+
+@app.route('/api/ready')
+def ready():
+    """200 once this process is warmed up and started, 503 before that and while draining."""
+    is_ready = readiness['warm'] and readiness['started'] and not readiness['draining']
+    body = dict(readiness, ready=is_ready, pid=os.getpid(),
+                detectors=face_engine.face_detectors.stats()['idle'], track_pools=len(track_cache))
+    return jsonify(body), 200 if is_ready else 503
+
+
 @app.route('/api/feedback', methods=['POST'])
 def submit_feedback():
     data = request.json
-    conn = get_db()
-    conn.execute('INSERT INTO feedback (session_id, rating) VALUES (?,?)',
-                 (data.get('session_id'), data.get('rating')))
-    conn.commit()
-    conn.close()
+    user_id = session.get('user_id')
+    owner = user_preferences.session_owner(data.get('session_id'))
+    if owner is not None and owner != user_id:
+        return jsonify({'error': 'You can only rate your own sessions'}), 403
+    session_writer.add_feedback(data.get('session_id'), data.get('rating'))
+    user_preferences.record_feedback(data.get('session_id'), data.get('rating'), user_id)
     return jsonify({'success': True})
 
 
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 100
+HISTORY_TEXT_PREVIEW = 61
+HISTORY_COLUMNS = 'id, input_type, detected_emotion, confidence, mood, created_at'
+
+
+def encode_history_cursor(created_at, session_id):
+    return base64.urlsafe_b64encode(f'{created_at}|{session_id}'.encode()).decode()
+
+
+def decode_history_cursor(cursor):
+    created_at, session_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit('|', 1)
+    return created_at, int(session_id)
+
+
 @app.route('/api/history')
 def get_history():
-    conn = get_db()
-    rows = conn.execute(
-        'SELECT * FROM sessions ORDER BY created_at DESC LIMIT 50'
+    """
+    Newest-first sessions of the logged-in user (none when logged out),
+    keyset-paginated on (created_at, id). Rows are slim: no tracks, and
+    input_text is a short preview; see /api/history/<id> for the full session.
+    """
+    user_id = session.get('user_id')
+    if user_id is None:
+        return jsonify({'items': [], 'next_cursor': None})
+    limit = min(max(request.args.get('limit', HISTORY_PAGE_SIZE, type=int), 1), HISTORY_MAX_PAGE_SIZE)
+    params = [HISTORY_TEXT_PREVIEW, user_id]
+    where = 'user_id = ?'
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            params.extend(decode_history_cursor(cursor))
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        where += ' AND (created_at, id) < (?, ?)'
+
+    rows = get_db().execute(
+        f'SELECT {HISTORY_COLUMNS}, substr(input_text, 1, ?) AS input_text FROM sessions '
+        f'WHERE {where} ORDER BY created_at DESC, id DESC LIMIT ?',
+        params + [limit + 1]
     ).fetchall()
-    conn.close()
-    return jsonify([dict(r) for r in rows])
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_history_cursor(rows[-1]['created_at'], rows[-1]['id'])
+    return jsonify({'items': [dict(r) for r in rows], 'next_cursor': next_cursor})
+
+
+@app.route('/api/history/<int:session_id>')
+def get_history_detail(session_id):
+    user_id = session.get('user_id')
+    if user_id is None:
+        return jsonify({'error': 'Log in to see your history'}), 401
+    conn = get_db()
+    row = conn.execute(
+        f'SELECT {HISTORY_COLUMNS}, input_text, tracks_json FROM sessions WHERE id = ? AND user_id = ?',
+        (session_id, user_id)
+    ).fetchone()
+    if not row:
+        return jsonify({'error': 'Session not found'}), 404
+    detail = dict(row)
+    del detail['tracks_json']
+    detail['tracks'] = track_store.session_tracks(conn, row)
+    return jsonify(detail)
 
 
 @app.route('/api/stats')
 def get_stats():
-    conn = get_db()
-    total = conn.execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
-    by_emotion = conn.execute(
-        'SELECT detected_emotion, COUNT(*) as count FROM sessions GROUP BY detected_emotion ORDER BY count DESC'
-    ).fetchall()
-    by_type = conn.execute(
-        'SELECT input_type, COUNT(*) as count FROM sessions GROUP BY input_type'
-    ).fetchall()
-    avg_confidence = conn.execute('SELECT AVG(confidence) FROM sessions').fetchone()[0] or 0
+    return jsonify(stats.read(get_db()))
+
+
+@app.cli.command('rebuild-stats')
+def rebuild_stats_command():
+    """Recompute the /api/stats aggregate tables from the sessions table."""
+    init_db()
+    conn = database.connect()
+    total = stats.rebuild(conn)
     conn.close()
-    return jsonify({
-        'total_sessions': total,
-        'by_emotion': [dict(r) for r in by_emotion],
-        'by_input_type': [dict(r) for r in by_type],
-        'avg_confidence': round(avg_confidence, 3),
-    })
+    print(f"Rebuilt stats for {total} sessions")
+
+
+@app.cli.command('rebuild-preferences')
+def rebuild_preferences_command():
+    """Recompute every user's preference model by replaying the feedback table."""
+    init_db()
+    conn = database.connect()
+    users = preferences.rebuild(conn, EMOTION_MOOD_MAP)
+    conn.close()
+    print(f"Rebuilt preferences for {users} users")
+
+
+@app.cli.command('migrate-tracks')
+def migrate_tracks_command():
+    """Move sessions.tracks_json blobs into the normalized tracks tables."""
+    init_db()
+    conn = database.connect()
+    migrated, skipped = track_store.migrate(conn)
+    conn.close()
+    print(f"Migrated {migrated} sessions ({skipped} unreadable blobs left in place)")
+    print("Run VACUUM on the database to reclaim the freed space")
+
+
+def add_audio_features(tracks):
+    """Tracks that Spotify has valence/energy for, with those features added."""
+    by_id = {}
+    for track in tracks:
+        key = track_store.track_key(track)
+        if key.startswith('spotify:'):
+            by_id.setdefault(key[len('spotify:'):], track)
+    ids = list(by_id)
+    for start in range(0, len(ids), 100):
+        data = spotify.get('/v1/audio-features', {'ids': ','.join(ids[start:start + 100])})
+        for features in data.get('audio_features') or []:
+            if features and features.get('id') in by_id:
+                track = by_id[features['id']]
+                track['valence'] = features['valence']
+                track['energy'] = features['energy']
+                yield track
+
+
+@app.cli.command('import-catalog')
+@click.argument('csv_path')
+@click.option('--out', default=None, help='Catalog directory (default: CATALOG_PATH)')
+def import_catalog_command(csv_path, out):
+    """Build the offline track catalog from a CSV with valence/energy/popularity columns."""
+    out = out or CATALOG_PATH
+    if not out:
+        raise click.UsageError('Pass --out or set CATALOG_PATH')
+    count = catalog.import_csv(csv_path, out)
+    print(f"Wrote {count} tracks to {out}")
+
+
+@app.cli.command('refresh-catalog')
+def refresh_catalog_command():
+    """Add live Spotify search results (with audio features) for every mood query to the catalog."""
+    if not CATALOG_PATH:
+        raise click.UsageError('Set CATALOG_PATH')
+    if not spotify.configured:
+        raise click.UsageError('Set SPOTIFY_CLIENT_ID and SPOTIFY_CLIENT_SECRET')
+    fresh = []
+    for emotion in EMOTION_MOOD_MAP:
+        for genre, queries in spotify_queries(emotion).items():
+            for query in queries:
+                try:
+                    fresh.extend(dict(track, genre=genre) for track in fetch_spotify_tracks(query))
+                except Exception as e:
+                    print(f"Spotify search error for {query!r}: {e}")
+    existing = track_catalog.iter_tracks() if track_catalog is not None else []
+    count = catalog.write_catalog(chain(add_audio_features(fresh), existing), CATALOG_PATH)
+    print(f"Catalog now has {count} tracks; restart the app to use it")
 
 
 @app.route('/api/auth/register', methods=['POST'])
@@ -498,9 +1037,8 @@ def register():
         session['username'] = user['username']
         return jsonify({'success': True, 'username': user['username']})
     except sqlite3.IntegrityError:
+        conn.rollback()
         return jsonify({'success': False, 'message': 'Username or email already exists'}), 400
-    finally:
-        conn.close()
 
 
 @app.route('/api/auth/login', methods=['POST'])
@@ -509,7 +1047,6 @@ def login():
     conn = get_db()
     user = conn.execute('SELECT * FROM users WHERE email=? AND password_hash=?',
         (data['email'], hash_password(data['password']))).fetchone()
-    conn.close()
     if user:
         session['user_id'] = user['id']
         session['username'] = user['username']
@@ -531,7 +1068,8 @@ def auth_status():
 
 
 if __name__ == '__main__':
-    init_db()
+    create_app()
+    start_background()
     print("\n" + "=" * 60)
     print("  ROOHA — Emotion-Based Music Recommendation System")
     print("=" * 60)
@@ -540,6 +1078,9 @@ if __name__ == '__main__':
         print("  Set SPOTIFY_CLIENT_ID and SPOTIFY_CLIENT_SECRET env vars")
     else:
         print("  ✓  Spotify API configured")
+    if track_catalog is not None:
+        print(f"  ✓  Track catalog: {len(track_catalog)} tracks")
     print(f"  →  Running at http://localhost:5000")
+    print("  →  Production: python serve.py --workers 4")
     print("=" * 60 + "\n")
     app.run(debug=True, port=5000)
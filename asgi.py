@@ -0,0 +1,340 @@
+"""
+ASGI serving mode: `uvicorn asgi:app`.
+
+The analyze endpoints run on the event loop. Spotify searches go through
+AsyncSpotifyClient and OpenCV/NumPy face analysis runs in a thread pool, so
+a request waiting on Spotify does not hold a worker thread. Every other
+route is served by the Flask app from app.py through a small WSGI bridge,
+so both modes share routes, login sessions, caches and the database writer.
+"""
+import io
+import os
+import sys
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from quart import Quart, request, jsonify, session
+
+import app as rooha
+import metrics
+from face_pool import FacePoolBusy
+from spotify_client import AsyncSpotifyClient
+
+
+CPU_WORKERS = int(os.environ.get('ASGI_CPU_WORKERS', str(os.cpu_count() or 4)))
+WSGI_WORKERS = int(os.environ.get('ASGI_WSGI_WORKERS', '32'))
+IO_WORKERS = int(os.environ.get('ASGI_IO_WORKERS', '16'))
+SPOTIFY_MAX_CONNECTIONS = int(os.environ.get('SPOTIFY_MAX_CONNECTIONS', '100'))
+
+NATIVE_PATHS = {'/api/analyze/text', '/api/analyze/face'}
+
+native = Quart(__name__)
+native.secret_key = rooha.app.secret_key
+native.config['MAX_CONTENT_LENGTH'] = rooha.app.config['MAX_CONTENT_LENGTH']
+
+spotify = AsyncSpotifyClient(rooha.SPOTIFY_CLIENT_ID, rooha.SPOTIFY_CLIENT_SECRET,
+                             max_connections=SPOTIFY_MAX_CONNECTIONS)
+
+cpu_executor = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix='asgi-cpu')
+wsgi_executor = ThreadPoolExecutor(max_workers=WSGI_WORKERS, thread_name_prefix='asgi-wsgi')
+io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix='asgi-io')
+
+_pending = {}
+_background = set()
+
+
+async def run_in(executor, fn, *args):
+    """Run `fn` on `executor` in a copy of the current context, so its metrics stages count towards this request."""
+    ctx = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(executor, lambda: ctx.run(fn, *args))
+
+
+async def run_cpu(fn, *args):
+    return await run_in(cpu_executor, fn, *args)
+
+
+async def run_io(fn, *args):
+    """Blocking SQLite or disk work (session ids, preference loads, catalog reads) off the event loop."""
+    return await run_in(io_executor, fn, *args)
+
+
+def spawn(coro):
+    """Run a coroutine in the background, keeping a reference until it finishes."""
+    task = asyncio.ensure_future(coro)
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+    return task
+
+
+# ---------- Spotify ----------
+
+async def fetch_spotify_tracks(query):
+    data = await spotify.search_tracks(query, limit=rooha.SPOTIFY_POOL_SIZE, market=rooha.SPOTIFY_MARKET)
+    return rooha.parse_spotify_tracks(data)
+
+
+async def _load_and_store(key, query):
+    tracks = await fetch_spotify_tracks(query)
+    rooha.track_cache.put(key, tracks)
+    return tracks
+
+
+async def load_track_pool(key, query):
+    """Fetch one pool into the shared cache; concurrent callers for a key share one request."""
+    task = _pending.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_load_and_store(key, query))
+        _pending[key] = task
+        task.add_done_callback(lambda t: _forget_pending(key, t))
+    return await asyncio.shield(task)
+
+
+def _forget_pending(key, task):
+    _pending.pop(key, None)
+    if not task.cancelled():
+        task.exception()  # retrieved by any awaiting caller; avoids the warning when all of them gave up
+
+
+async def _refresh_track_pool(key, query):
+    try:
+        await load_track_pool(key, query)
+    except Exception as e:
+        print(f"Cache refresh error for {key}: {e}")
+
+
+async def get_track_pool(emotion, query):
+    """Async get_track_pool: cached pools are returned at once, stale ones refreshed in the background."""
+    key = rooha.track_pool_key(emotion, query)
+    found = rooha.track_cache.lookup(key)
+    if found is None:
+        return await load_track_pool(key, query)
+    pool, fresh = found
+    if not fresh:
+        spawn(_refresh_track_pool(key, query))
+    return pool
+
+
+async def fanout_track_pool(emotion):
+    """Async app.fanout_track_pool: one get_track_pool per genre, merged from those done by the deadline."""
+    queries = rooha.fanout_queries(emotion)
+    tasks = {asyncio.ensure_future(get_track_pool(emotion, query)): genre for genre, query in queries.items()}
+    done, not_done = await asyncio.wait(tasks, timeout=rooha.SPOTIFY_FANOUT_DEADLINE)
+    for task in not_done:
+        task.cancel()  # the shared fetch is shielded and still fills the cache
+    genre_pools = {}
+    for task in done:
+        try:
+            genre_pools[tasks[task]] = task.result()
+        except Exception as e:
+            print(f"Fan-out error for {tasks[task]}: {e}")
+    pool_keys = {genre: rooha.track_pool_key(emotion, query) for genre, query in queries.items()}
+    return rooha.merged_fanout_pool(emotion, genre_pools, pool_keys)
+
+
+async def search_spotify_tracks(emotion, limit=12, user_id=None):
+    with metrics.timer('recommend'):
+        prefs = await run_io(rooha.user_preferences.get, user_id) if user_id is not None else None
+        pool = await run_io(rooha.catalog_pool, emotion) if rooha.track_catalog is not None else None
+        if pool:
+            metrics.count('recommend_catalog')
+            return rooha.pick_tracks(emotion, pool, limit, prefs)
+
+        if not spotify.configured:
+            metrics.count('recommend_fallback')
+            return rooha.FALLBACK_PLAYLISTS.get(emotion, rooha.FALLBACK_PLAYLISTS['neutral'])
+
+        try:
+            metrics.count('recommend_spotify')
+            if rooha.SPOTIFY_FANOUT:
+                return rooha.pick_tracks(emotion, await fanout_track_pool(emotion), limit, prefs)
+            genre, query = rooha.choose_spotify_query(emotion, prefs)
+            return rooha.pick_spotify_tracks(emotion, genre, await get_track_pool(emotion, query), limit, prefs)
+        except Exception as e:
+            metrics.count('spotify_errors')
+            metrics.count('recommend_fallback')
+            print(f"Spotify search error: {e}")
+            return rooha.FALLBACK_PLAYLISTS.get(emotion, [])
+
+
+# ---------- native routes ----------
+
+@native.before_serving
+async def startup():
+    await run_cpu(rooha.create_app)
+    await run_cpu(rooha.start_background)
+
+
+@native.after_serving
+async def shutdown():
+    await spotify.close()
+    await run_cpu(rooha.shutdown)
+
+
+@native.before_request
+async def start_server_timing():
+    if metrics.METRICS_SERVER_TIMING:
+        metrics.begin_request()
+
+
+@native.after_request
+async def add_server_timing(response):
+    if metrics.METRICS_SERVER_TIMING:
+        header = metrics.server_timing()
+        if header:
+            response.headers['Server-Timing'] = header
+    return response
+
+
+@native.errorhandler(FacePoolBusy)
+async def face_pool_busy(e):
+    return jsonify({'error': str(e), 'retry_after': e.retry_after}), 503, {'Retry-After': str(e.retry_after)}
+
+
+@native.route('/api/analyze/text', methods=['POST'])
+async def analyze_text():
+    data = await request.get_json()
+    text = data.get('text', '').strip()
+    if not text:
+        return jsonify({'error': 'No text provided'}), 400
+
+    emotion, confidence, mood = rooha.analyze_text_cached(text)
+    user_id = session.get('user_id')
+    tracks = await search_spotify_tracks(emotion, user_id=user_id)
+    session_id = await run_io(rooha.save_session, user_id, 'text', emotion, confidence, mood, tracks, text)
+    return jsonify(rooha.analysis_result(session_id, emotion, confidence, mood, tracks, 'text'))
+
+
+async def read_image_payload():
+    """Same payload formats as app.read_image_payload()."""
+    if request.mimetype == 'application/octet-stream' or request.mimetype.startswith('image/'):
+        return await request.get_data(cache=False)
+    if request.mimetype == 'multipart/form-data':
+        upload = (await request.files).get('image')
+        return upload.read() if upload else b''
+    return ((await request.get_json(silent=True)) or {}).get('image', '')
+
+
+@native.route('/api/analyze/face', methods=['POST'])
+async def analyze_face():
+    image_data = await read_image_payload()
+    if not image_data:
+        return jsonify({'error': 'No image provided'}), 400
+
+    emotion, confidence, mood = await run_cpu(rooha.analyze_face_emotion, image_data)
+    user_id = session.get('user_id')
+    tracks = await search_spotify_tracks(emotion, user_id=user_id)
+    session_id = await run_io(rooha.save_session, user_id, 'face', emotion, confidence, mood, tracks)
+    return jsonify(rooha.analysis_result(session_id, emotion, confidence, mood, tracks, 'face'))
+
+
+# ---------- everything else: the Flask app ----------
+
+def wsgi_environ(scope, body):
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode().decode('latin-1'),
+        'PATH_INFO': scope['path'].encode().decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    server = scope.get('server') or ('localhost', 80)
+    environ['SERVER_NAME'], environ['SERVER_PORT'] = server[0], str(server[1] or 80)
+    if scope.get('client'):
+        environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = scope['client'][0], str(scope['client'][1])
+
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_LENGTH':
+            continue
+        if name != 'CONTENT_TYPE':
+            name = 'HTTP_' + name
+        environ[name] = f'{environ[name]},{value}' if name in environ else value
+    return environ
+
+
+class WSGIBridge:
+    """
+    Serve a WSGI app from ASGI. The app and its response iterator run on
+    `executor`, so blocking views (SQLite reads, SSE waits) never run on
+    the event loop.
+    """
+
+    def __init__(self, wsgi_app, executor):
+        self.wsgi_app = wsgi_app
+        self.executor = executor
+
+    async def __call__(self, scope, receive, send):
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+
+        loop = asyncio.get_running_loop()
+        environ = wsgi_environ(scope, bytes(body))
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+
+        result = await loop.run_in_executor(self.executor, self.wsgi_app, environ, start_response)
+        disconnected = asyncio.Event()
+
+        async def watch_disconnect():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            disconnected.set()
+
+        watcher = asyncio.ensure_future(watch_disconnect())
+        headers_sent = False
+
+        async def send_headers():
+            nonlocal headers_sent
+            if not headers_sent:
+                await send({'type': 'http.response.start', 'status': started['status'],
+                            'headers': started['headers']})
+                headers_sent = True
+
+        try:
+            chunks = iter(result)
+            while not disconnected.is_set():
+                # Headers go out before blocking on the body, so streams (SSE) open immediately.
+                if started:
+                    await send_headers()
+                chunk = await loop.run_in_executor(self.executor, next, chunks, None)
+                if chunk is None:
+                    break
+                await send_headers()
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if not disconnected.is_set():
+                await send_headers()
+                await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            watcher.cancel()
+            if hasattr(result, 'close'):
+                await loop.run_in_executor(self.executor, result.close)
+
+
+flask_bridge = WSGIBridge(rooha.app.wsgi_app, wsgi_executor)
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'] not in NATIVE_PATHS:
+        await flask_bridge(scope, receive, send)
+    else:
+        await native(scope, receive, send)
@@ -0,0 +1,124 @@
+"""
+Correctness checks for the cv2.dnn face classifier path, using the tiny
+ONNX fixtures from tiny_model.py (a logits and a softmax variant):
+
+    output shape   forward() returns one 7-score row per crop, for any batch size
+    softmax        logits are normalised, probabilities pass through unchanged,
+                   and both match the network computed in numpy
+    parity         a batch scores every crop exactly as one-crop calls do,
+                   directly and through BatchingClassifier under concurrency
+
+    python bench/check_classifier.py    # exits 1 if any check fails
+"""
+import os
+import sys
+import threading
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import cv2
+
+import tiny_model
+import face_classifier
+from face_classifier import LABELS, FACE_SIZE, DnnClassifier, BatchingClassifier
+
+
+failures = []
+
+
+def check(name, ok, detail=''):
+    print(f"{'ok  ' if ok else 'FAIL'}  {name}{f'  ({detail})' if detail else ''}")
+    if not ok:
+        failures.append(name)
+
+
+def crops(n, seed=0):
+    """Noisy 48x48 crops with a bright patch in a random place, so labels vary."""
+    rng = np.random.default_rng(seed)
+    out = []
+    for _ in range(n):
+        face = rng.normal(90, 20, (FACE_SIZE, FACE_SIZE))
+        y, x = rng.integers(0, FACE_SIZE - 16, 2)
+        face[y:y + 16, x:x + 16] += 120
+        out.append(face.clip(0, 255).astype(np.uint8))
+    return out
+
+
+def same_results(a, b, atol=1e-5):
+    return len(a) == len(b) and all(la == lb and abs(ca - cb) <= atol for (la, ca), (lb, cb) in zip(a, b))
+
+
+def check_shape(classifier):
+    for n in (1, 3, 64):
+        out = classifier.forward(crops(n, seed=n))
+        check(f'forward shape, batch of {n}', out.shape == (n, len(LABELS)) and out.dtype == np.float32,
+              f'{out.shape} {out.dtype}')
+    check('empty batch', classifier.classify([]) == [])
+
+
+def check_softmax(logits, softmax):
+    faces = crops(32, seed=1)
+    blob = cv2.dnn.blobFromImages(faces, logits.scale, (FACE_SIZE, FACE_SIZE))
+    expected = tiny_model.reference(blob)
+    for classifier in (logits, softmax):
+        probs = classifier.forward(faces)
+        name = os.path.basename(classifier.model_path)
+        check(f'{name}: rows are probabilities',
+              (probs >= 0).all() and np.allclose(probs.sum(axis=1), 1, atol=1e-5))
+        check(f'{name}: matches the numpy network', np.allclose(probs, expected, atol=1e-5),
+              f'max error {np.abs(probs - expected).max():.2e}')
+    labels = {label for label, _ in logits.classify(faces)}
+    check('crops get different labels', len(labels) > 1, ', '.join(sorted(labels)))
+
+
+def check_parity(classifier):
+    faces = crops(40, seed=2)
+    batched = classifier.classify(faces)
+    single = [classifier.classify([face])[0] for face in faces]
+    check('batch matches one-by-one', same_results(batched, single))
+
+    batcher = BatchingClassifier(classifier, max_batch=16, max_wait=0.005)
+    spans = list(zip(range(0, 40, 4), [1, 2, 3, 4] * 3))
+    jobs = [faces[i:i + n] for i, n in spans]
+    results = [None] * len(jobs)
+    before = classifier.batches
+
+    def worker(i):
+        results[i] = batcher.classify(jobs[i])
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(jobs))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    expected = [single[i:i + n] for i, n in spans]
+    check('BatchingClassifier matches one-by-one', all(same_results(r, e) for r, e in zip(results, expected)),
+          f'{len(jobs)} requests in {classifier.batches - before} forward passes')
+
+
+def check_loader():
+    face_classifier.FACE_MODEL_PATH = tiny_model.LOGITS_PATH
+    classifier = face_classifier.load_classifier('dnn')
+    check('load_classifier("dnn") uses the model', isinstance(classifier, BatchingClassifier)
+          and isinstance(classifier.classifier, DnnClassifier), type(classifier).__name__)
+
+
+def main():
+    for path in (tiny_model.LOGITS_PATH, tiny_model.SOFTMAX_PATH):
+        if not os.path.exists(path):
+            sys.exit(f"Missing fixture {path}; run python bench/tiny_model.py")
+    logits = DnnClassifier(tiny_model.LOGITS_PATH)
+    softmax = DnnClassifier(tiny_model.SOFTMAX_PATH)
+    check_shape(logits)
+    check_softmax(logits, softmax)
+    check_parity(logits)
+    check_loader()
+    print(f"\n{len(failures)} check(s) failed" if failures else '\nall checks passed')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
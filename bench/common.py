@@ -0,0 +1,103 @@
+"""Timing, percentile and baseline helpers shared by the benchmark scripts."""
+import os
+import sys
+import json
+import time
+import platform
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_DIR = os.path.join(REPO_DIR, 'bench', 'baselines')
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(pct / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(latencies, elapsed, errors=0):
+    """Throughput and latency percentiles (ms) for a list of per-operation seconds."""
+    latencies = sorted(latencies)
+    ms = lambda s: round(s * 1000, 4)
+    return {
+        'n': len(latencies),
+        'errors': errors,
+        'ops_per_sec': round(len(latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+        'p50_ms': ms(percentile(latencies, 50)),
+        'p95_ms': ms(percentile(latencies, 95)),
+        'p99_ms': ms(percentile(latencies, 99)),
+        'max_ms': ms(latencies[-1]) if latencies else 0.0,
+    }
+
+
+def measure(fn, min_time=1.0, min_iterations=20, max_iterations=100000, warmup=3):
+    """Call `fn` repeatedly (after `warmup` calls) for at least `min_time` seconds; returns summarize()."""
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    started = time.perf_counter()
+    while len(latencies) < max_iterations:
+        t0 = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t0)
+        if len(latencies) >= min_iterations and t0 - started >= min_time:
+            break
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def report(kind, results, config=None):
+    return {
+        'kind': kind,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': git_commit(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'config': config or {},
+        'results': results,
+    }
+
+
+def print_results(results):
+    print(f"{'benchmark':<34} {'n':>7} {'ops/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for name, r in results.items():
+        print(f"{name:<34} {r['n']:>7} {r['ops_per_sec']:>10.1f} {r['p50_ms']:>9.3f} "
+              f"{r['p95_ms']:>9.3f} {r['p99_ms']:>9.3f} {r['errors']:>7}")
+
+
+def save_baseline(data, path):
+    """Write a report as JSON; a bare name goes to bench/baselines/<name>.json."""
+    if os.sep not in path and not path.endswith('.json'):
+        path = os.path.join(BASELINE_DIR, f'{path}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+    print(f"Saved {path}")
+    return path
+
+
+def compare(results, baseline_path):
+    """Print throughput and p50/p99 changes against a saved baseline."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nvs {baseline_path} (commit {baseline.get('commit')}, {baseline.get('created_at')})")
+    print(f"{'benchmark':<34} {'ops/s':>10} {'p50':>9} {'p99':>9}")
+    change = lambda new, old: f'{(new - old) / old * 100:+.1f}%' if old else 'n/a'
+    for name, r in results.items():
+        old = baseline['results'].get(name)
+        if old is None:
+            print(f'{name:<34} {"new":>10}')
+            continue
+        print(f"{name:<34} {change(r['ops_per_sec'], old['ops_per_sec']):>10} "
+              f"{change(r['p50_ms'], old['p50_ms']):>9} {change(r['p99_ms'], old['p99_ms']):>9}")
@@ -0,0 +1,36 @@
+"""Synthetic test images: cartoon faces the Haar cascade detects, on a noisy background."""
+import numpy as np
+import cv2
+
+
+def draw_face(img, cx, cy, size):
+    """A light oval with dark eyes, brows, nose and mouth, centred at (cx, cy)."""
+    s = size
+    cv2.ellipse(img, (cx, cy), (int(s * 0.42), int(s * 0.55)), 0, 0, 360, 200, -1)
+    for side in (-1, 1):
+        ex, ey = cx + int(side * s * 0.18), cy - int(s * 0.1)
+        cv2.ellipse(img, (ex, ey), (int(s * 0.09), int(s * 0.05)), 0, 0, 360, 40, -1)
+        cv2.line(img, (ex - int(s * 0.1), ey - int(s * 0.1)), (ex + int(s * 0.1), ey - int(s * 0.12)),
+                 60, max(2, s // 40))
+    cv2.line(img, (cx, cy - int(s * 0.02)), (cx, cy + int(s * 0.15)), 140, max(2, s // 50))
+    cv2.ellipse(img, (cx, cy + int(s * 0.28)), (int(s * 0.15), int(s * 0.05)), 0, 0, 360, 80, -1)
+
+
+def synthetic_image(width, height, faces=1, seed=0):
+    """Grayscale image with `faces` cartoon faces side by side."""
+    rng = np.random.default_rng(seed)
+    img = rng.normal(120, 12, (height, width)).clip(0, 255).astype(np.uint8)
+    if faces:
+        slot = width // faces
+        size = int(min(slot * 0.8, height * 0.6))
+        for i in range(faces):
+            draw_face(img, slot * i + slot // 2, height // 2, size)
+    return cv2.GaussianBlur(img, (5, 5), 0)
+
+
+def synthetic_jpeg(width, height, faces=1, seed=0, quality=90):
+    """synthetic_image() encoded as JPEG bytes, like a webcam snapshot upload."""
+    ok, buf = cv2.imencode('.jpg', synthetic_image(width, height, faces, seed), [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise RuntimeError('JPEG encoding failed')
+    return buf.tobytes()
@@ -0,0 +1,301 @@
+"""
+End-to-end load generator for /api/analyze/text, /api/analyze/face,
+/api/history and /api/stats.
+
+By default it starts the stub Spotify server (bench/stub_spotify.py) and
+the app (threaded Werkzeug server, fresh temporary database) in a child
+process, then drives them from `--concurrency` client threads for
+`--duration` seconds. Use --url to target a server you started yourself,
+e.g. `uvicorn asgi:app` with SPOTIFY_ACCOUNTS_URL / SPOTIFY_API_URL
+pointing at `python bench/stub_spotify.py`.
+
+Responses that fell back (face analysis errors, fallback playlists) are
+counted as errors, not successes. They are recognised by the events in the
+Server-Timing header, so a server started by hand needs
+METRICS_SERVER_TIMING=1 as well.
+
+    python bench/load.py --duration 20 --concurrency 16 --spotify-latency-ms 120
+    python bench/load.py --mix text=1 --save text-only
+"""
+import os
+import sys
+import json
+import time
+import queue
+import random
+import signal
+import logging
+import argparse
+import tempfile
+import threading
+import http.client
+import multiprocessing
+import urllib.parse
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+import common
+import images
+from stub_spotify import StubSpotify
+
+
+TEXTS = [
+    'I feel really happy and excited today!',
+    'I am feeling sad and lonely right now',
+    'I am so angry and frustrated!',
+    'I feel calm and peaceful',
+    'I am scared and anxious about everything',
+    'I am completely surprised and shocked!',
+]
+
+DEFAULT_MIX = 'text=4,face=1,history=2,stats=1'
+
+# Server-Timing events marking a 200 response that did not take the real path
+DEGRADED_EVENTS = {'face_errors', 'face_fallback', 'recommend_fallback'}
+
+
+# ---------- app server (child process) ----------
+
+def serve_app(env, db_path, ready):
+    os.environ.update(env)
+    sys.path.insert(0, common.REPO_DIR)
+    from werkzeug.serving import make_server
+    import app as rooha
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    rooha.database.path = db_path
+    rooha.init_db()
+    if rooha.face_pool is not None:
+        rooha.face_pool.warm_up()
+    else:
+        rooha.face_engine.warm_up()
+    server = make_server('127.0.0.1', 0, rooha.app, threaded=True)
+    # stop_app() sends SIGTERM: stop serving, then shut the face pool and writer down
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+    ready.put(server.server_port)
+    server.serve_forever()
+    server.server_close()
+    rooha.shutdown()
+
+
+def start_app(env, db_path, timeout=60):
+    # not a daemon: daemonic processes cannot start the app's face pool workers
+    ctx = multiprocessing.get_context('spawn')
+    ready = ctx.Queue()
+    process = ctx.Process(target=serve_app, args=(env, db_path, ready))
+    process.start()
+    deadline = time.monotonic() + timeout
+    try:
+        while True:
+            try:
+                port = ready.get(timeout=0.5)
+                break
+            except queue.Empty:
+                if not process.is_alive():
+                    raise SystemExit(f"App process exited with code {process.exitcode}")
+                if time.monotonic() > deadline:
+                    raise SystemExit(f"App did not start within {timeout:g}s")
+    except BaseException:
+        stop_app(process)
+        raise
+    return process, f'http://127.0.0.1:{port}'
+
+
+def stop_app(process, timeout=10):
+    process.terminate()
+    process.join(timeout)
+    if process.is_alive():
+        process.kill()
+        process.join()
+
+
+# ---------- client ----------
+
+class Client:
+    """One keep-alive connection per thread; reconnects when the server closes it. Keeps the login cookie."""
+
+    def __init__(self, base_url):
+        url = urllib.parse.urlparse(base_url)
+        self.host, self.port = url.hostname, url.port or 80
+        self.conn = None
+        self.cookie = None
+        self.server_timing = False
+
+    def login(self):
+        """Register a throwaway user so /api/history reads a real, per-user history."""
+        name = f'load-{os.getpid()}-{threading.get_ident()}-{random.getrandbits(32):x}'
+        body = json.dumps({'username': name, 'email': f'{name}@example.com', 'password': 'load-test'}).encode()
+        return self.request('POST', '/api/auth/register', body, {'Content-Type': 'application/json'})
+
+    def request(self, method, path, body=None, headers=None):
+        """The response status, or 'degraded' when the server reports a fallback for it."""
+        headers = dict(headers or {})
+        for attempt in (0, 1):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            if self.cookie:
+                headers['Cookie'] = self.cookie
+            try:
+                self.conn.request(method, path, body, headers)
+                resp = self.conn.getresponse()
+                resp.read()
+                if resp.getheader('Set-Cookie'):
+                    self.cookie = resp.getheader('Set-Cookie').split(';', 1)[0]
+                if resp.will_close:
+                    self.conn.close()
+                    self.conn = None
+                timing = resp.getheader('Server-Timing')
+                if timing:
+                    self.server_timing = True
+                    if {part.split(';', 1)[0].strip() for part in timing.split(',')} & DEGRADED_EVENTS:
+                        return 'degraded'
+                return resp.status
+            except (OSError, http.client.HTTPException):
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+
+
+def make_requests(face_width, face_height, face_count):
+    jpeg = images.synthetic_jpeg(face_width, face_height, face_count)
+    json_headers = {'Content-Type': 'application/json'}
+    return {
+        'text': lambda: ('POST', '/api/analyze/text',
+                         json.dumps({'text': random.choice(TEXTS)}).encode(), json_headers),
+        'face': lambda: ('POST', '/api/analyze/face', jpeg, {'Content-Type': 'image/jpeg'}),
+        'history': lambda: ('GET', '/api/history?limit=20', None, None),
+        'stats': lambda: ('GET', '/api/stats', None, None),
+    }
+
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+def worker(base_url, requests, names, weights, stop, record_after, samples, lock, timed):
+    client = Client(base_url)
+    try:
+        client.login()
+    except (OSError, http.client.HTTPException):
+        pass
+    local = []
+    while not stop.is_set():
+        name = random.choices(names, weights)[0]
+        method, path, body, headers = requests[name]()
+        t0 = time.perf_counter()
+        try:
+            status = client.request(method, path, body, headers)
+        except (OSError, http.client.HTTPException):
+            status = 'error'
+        elapsed = time.perf_counter() - t0
+        if t0 >= record_after:
+            local.append((name, status, elapsed))
+    if client.server_timing:
+        timed.set()
+    with lock:
+        samples.extend(local)
+
+
+def run_load(base_url, args):
+    weights = parse_mix(args.mix)
+    requests = make_requests(args.face_width, args.face_height, args.face_count)
+    unknown = set(weights) - set(requests)
+    if unknown:
+        raise SystemExit(f"Unknown endpoint(s) in --mix: {', '.join(sorted(unknown))}")
+    names = list(weights)
+
+    stop, timed = threading.Event(), threading.Event()
+    samples, lock = [], threading.Lock()
+    record_after = time.perf_counter() + args.warmup
+    threads = [threading.Thread(target=worker, daemon=True,
+                                args=(base_url, requests, names, [weights[n] for n in names],
+                                      stop, record_after, samples, lock, timed))
+               for _ in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.warmup + args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join(30)
+
+    results, statuses = {}, {}
+    for name in names + ['all']:
+        rows = [s for s in samples if name == 'all' or s[0] == name]
+        ok = [elapsed for _, status, elapsed in rows if isinstance(status, int) and status < 400]
+        results[name] = common.summarize(ok, args.duration, errors=len(rows) - len(ok))
+        counts = {}
+        for _, status, _ in rows:
+            counts[str(status)] = counts.get(str(status), 0) + 1
+        statuses[name] = counts
+    if not timed.is_set():
+        print('warning: no Server-Timing headers; fallback responses cannot be told apart '
+              '(start the server with METRICS_SERVER_TIMING=1)')
+    return results, statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rooha end-to-end load test')
+    parser.add_argument('--url', help='target an already running server instead of starting one')
+    parser.add_argument('--duration', type=float, default=10.0, help='measured seconds (default: 10)')
+    parser.add_argument('--warmup', type=float, default=2.0, help='unmeasured seconds before that (default: 2)')
+    parser.add_argument('--concurrency', type=int, default=8, help='client threads (default: 8)')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'endpoint weights (default: {DEFAULT_MIX})')
+    parser.add_argument('--spotify-latency-ms', type=float, default=80.0, help='stub search latency')
+    parser.add_argument('--spotify-jitter-ms', type=float, default=20.0)
+    parser.add_argument('--spotify-error-rate', type=float, default=0.0)
+    parser.add_argument('--stub-port', type=int, default=0, help='stub Spotify port (default: any free port)')
+    parser.add_argument('--face-width', type=int, default=640)
+    parser.add_argument('--face-height', type=int, default=480)
+    parser.add_argument('--face-count', type=int, default=1, help='faces in the uploaded image')
+    parser.add_argument('--env', action='append', default=[], metavar='NAME=VALUE',
+                        help='extra environment for the app process, e.g. --env SPOTIFY_FANOUT=1')
+    parser.add_argument('--save', help='save results as JSON (bare name: bench/baselines/<name>.json)')
+    parser.add_argument('--compare', help='baseline JSON to compare against')
+    args = parser.parse_args()
+
+    stub = process = tmp = None
+    base_url = args.url
+    if not base_url or args.stub_port:
+        stub = StubSpotify(('127.0.0.1', args.stub_port), args.spotify_latency_ms,
+                           args.spotify_jitter_ms, args.spotify_error_rate).start()
+        print(f"Stub Spotify on {stub.url}")
+    if not base_url:
+        tmp = tempfile.TemporaryDirectory(prefix='rooha-load-')
+        env = {'SPOTIFY_ACCOUNTS_URL': stub.url, 'SPOTIFY_API_URL': stub.url,
+               'SPOTIFY_CLIENT_ID': 'bench', 'SPOTIFY_CLIENT_SECRET': 'bench', 'CATALOG_PATH': '',
+               'METRICS_SERVER_TIMING': '1'}
+        env.update(item.split('=', 1) for item in args.env)
+        process, base_url = start_app(env, os.path.join(tmp.name, 'load.db'))
+        print(f"App on {base_url}")
+
+    try:
+        results, statuses = run_load(base_url, args)
+    finally:
+        if process is not None:
+            stop_app(process)
+        if stub is not None:
+            stub.shutdown()
+
+    common.print_results(results)
+    print('status codes:', json.dumps(statuses))
+    if stub is not None:
+        print('stub Spotify calls:', stub.counts)
+    config = {k: v for k, v in vars(args).items() if k not in ('save', 'compare')}
+    if args.save:
+        data = common.report('load', results, config)
+        data['statuses'] = statuses
+        common.save_baseline(data, args.save)
+    if args.compare:
+        common.compare(results, args.compare)
+    if tmp is not None:
+        tmp.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""
+Micro-benchmarks for the hot paths, run in-process:
+
+    text_*   analyze_text_emotion on short and long texts (and the memoised path)
+    face_*   analyze_face_emotion on synthetic JPEGs of several sizes and face counts
+    db_*     the SQLite write path (enqueue latency, group-commit throughput)
+
+    python bench/micro.py                          # everything
+    python bench/micro.py --only face --save local # write bench/baselines/local.json
+    python bench/micro.py --compare bench/baselines/local.json
+"""
+import os
+import sys
+import time
+import base64
+import random
+import argparse
+import itertools
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+# in-process face analysis, no network, no catalog: only the code under test runs
+os.environ.setdefault('FACE_POOL_WORKERS', '0')
+os.environ['SPOTIFY_CLIENT_ID'] = os.environ['SPOTIFY_CLIENT_SECRET'] = ''
+os.environ['CATALOG_PATH'] = ''
+
+import common
+import images
+import app as rooha
+
+
+SHORT_TEXTS = [
+    'I feel really happy and excited today!',
+    'I am feeling sad and lonely right now',
+    'I am so angry and frustrated!',
+    'I feel calm and peaceful',
+]
+
+RESOLUTIONS = [(320, 240), (640, 480), (1280, 720), (1920, 1080)]
+FACE_COUNTS = [0, 1, 3]
+
+
+def long_text(words=2000, seed=0):
+    """A long diary-style text mixing lexicon words with filler."""
+    rng = random.Random(seed)
+    vocabulary = [w for words_ in rooha.EMOTION_KEYWORDS.values() for w in words_]
+    filler = 'the a and i was it to of in that day then we really very not so'.split()
+    return ' '.join(rng.choice(vocabulary) if rng.random() < 0.15 else rng.choice(filler) for _ in range(words))
+
+
+def bench_text(args):
+    results = {}
+    cycle = itertools.cycle(SHORT_TEXTS)
+    results['text_short'] = common.measure(lambda: rooha.analyze_text_emotion(next(cycle)), args.min_time)
+    text = long_text()
+    results['text_long_2000_words'] = common.measure(lambda: rooha.analyze_text_emotion(text), args.min_time)
+    rooha.text_result_cache.clear()
+    results['text_short_memoised'] = common.measure(lambda: rooha.analyze_text_cached(SHORT_TEXTS[0]), args.min_time)
+    return results
+
+
+def bench_face(args):
+    rooha.face_engine.warm_up()
+    results = {}
+    for width, height in RESOLUTIONS:
+        for faces in FACE_COUNTS:
+            jpeg = images.synthetic_jpeg(width, height, faces)
+            results[f'face_{width}x{height}_{faces}faces'] = common.measure(
+                lambda: rooha.analyze_face_emotion(jpeg), args.min_time, min_iterations=10)
+    data_url = 'data:image/jpeg;base64,' + base64.b64encode(images.synthetic_jpeg(640, 480, 1)).decode()
+    results['face_640x480_1faces_base64'] = common.measure(
+        lambda: rooha.analyze_face_emotion(data_url), args.min_time, min_iterations=10)
+    return results
+
+
+def bench_db(args):
+    tracks = rooha.FALLBACK_PLAYLISTS['happy'] * 4
+    writer = rooha.session_writer
+    results = {}
+
+    # enqueue latency as seen by a request
+    results['db_add_session_enqueue'] = common.measure(
+        lambda: rooha.save_session(None, 'text', 'happy', 0.9, 'Joyful', tracks, 'bench'), args.min_time)
+    writer.flush(60)
+
+    # end-to-end commit throughput: enqueue a burst, wait for the writer to drain it
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(args.db_rounds):
+        t0 = time.perf_counter()
+        for _ in range(args.db_batch):
+            writer.add_session(None, 'text', 'sad', 0.7, 'Melancholic', tracks, 'bench')
+        writer.flush(60)
+        latencies.append((time.perf_counter() - t0) / args.db_batch)
+    elapsed = time.perf_counter() - started
+    result = common.summarize(latencies, elapsed)
+    result['n'] = args.db_rounds * args.db_batch
+    result['ops_per_sec'] = round(result['n'] / elapsed, 2)
+    results[f'db_commit_burst_{args.db_batch}'] = result
+
+    session_id = rooha.save_session(None, 'text', 'happy', 0.9, 'Joyful', tracks)
+    results['db_add_feedback_enqueue'] = common.measure(
+        lambda: writer.add_feedback(session_id, 5), args.min_time)
+    writer.flush(60)
+    results['db_stats_read'] = common.measure(lambda: rooha.stats.read(rooha.get_db()), args.min_time)
+    return results
+
+
+SUITES = {'text': bench_text, 'face': bench_face, 'db': bench_db}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rooha micro-benchmarks')
+    parser.add_argument('--only', action='append', choices=sorted(SUITES), help='run only these suites')
+    parser.add_argument('--min-time', type=float, default=1.0, help='seconds per benchmark (default: 1)')
+    parser.add_argument('--db-batch', type=int, default=500, help='sessions per commit burst')
+    parser.add_argument('--db-rounds', type=int, default=5)
+    parser.add_argument('--save', help='save results as JSON (bare name: bench/baselines/<name>.json)')
+    parser.add_argument('--compare', help='baseline JSON to compare against')
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory(prefix='rooha-bench-')
+    rooha.database.path = os.path.join(tmp.name, 'bench.db')
+    rooha.init_db()
+
+    results = {}
+    for name in args.only or sorted(SUITES):
+        results.update(SUITES[name](args))
+    rooha.session_writer.close()
+
+    common.print_results(results)
+    config = {'suites': args.only or sorted(SUITES), 'min_time': args.min_time,
+              'face_classifier': rooha.FACE_CLASSIFIER, 'face_pool_workers': rooha.FACE_POOL_WORKERS}
+    if args.save:
+        common.save_baseline(common.report('micro', results, config), args.save)
+    if args.compare:
+        common.compare(results, args.compare)
+    tmp.cleanup()
+
+
+if __name__ == '__main__':
+    main()
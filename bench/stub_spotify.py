@@ -0,0 +1,116 @@
+"""
+Local stand-in for the Spotify accounts and Web API endpoints the app uses.
+
+Serves /api/token and /v1/search with deterministic fake tracks after a
+configurable delay, so load tests measure the app rather than the network.
+Point the app at it with SPOTIFY_ACCOUNTS_URL / SPOTIFY_API_URL.
+
+    python bench/stub_spotify.py --port 8765 --latency-ms 80
+"""
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class StubSpotify(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), latency_ms=50.0, jitter_ms=0.0, error_rate=0.0):
+        super().__init__(address, StubHandler)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.counts = {'token': 0, 'search': 0, 'errors': 0}
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def delay(self):
+        seconds = (self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def start(self):
+        """Serve on a daemon thread; returns self."""
+        threading.Thread(target=self.serve_forever, name='stub-spotify', daemon=True).start()
+        return self
+
+
+def fake_tracks(query, limit):
+    items = []
+    for i in range(limit):
+        track_id = hashlib.md5(f'{query}|{i}'.encode()).hexdigest()[:22]
+        items.append({
+            'name': f'{query.title()} #{i + 1}',
+            'artists': [{'name': f'Stub Artist {i % 7}'}],
+            'album': {'name': f'Stub Album {i % 5}', 'images': [{'url': f'https://example.com/{track_id}.jpg'}]},
+            'preview_url': None,
+            'external_urls': {'spotify': f'https://open.spotify.com/track/{track_id}'},
+            'duration_ms': 180000 + i * 1000,
+            'popularity': 100 - i,
+        })
+    return items
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.server.count('token')
+        self._send(200, {'access_token': 'stub-token', 'token_type': 'Bearer', 'expires_in': 3600})
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        if url.path != '/v1/search':
+            return self._send(404, {'error': {'status': 404, 'message': 'Not found'}})
+        self.server.count('search')
+        self.server.delay()
+        if self.server.error_rate and random.random() < self.server.error_rate:
+            self.server.count('errors')
+            return self._send(503, {'error': {'status': 503, 'message': 'Stub error'}}, {'Retry-After': '0'})
+        params = urllib.parse.parse_qs(url.query)
+        query = params.get('q', [''])[0]
+        limit = int(params.get('limit', ['20'])[0])
+        self._send(200, {'tracks': {'items': fake_tracks(query, limit)}})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local Spotify stand-in')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=50.0, help='delay before each search response')
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of searches answered with 503')
+    args = parser.parse_args()
+    server = StubSpotify(('127.0.0.1', args.port), args.latency_ms, args.jitter_ms, args.error_rate)
+    print(f"Stub Spotify on {server.url} (latency {args.latency_ms:g}ms)")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+A tiny FER-shaped ONNX network for exercising the cv2.dnn classifier path.
+
+input [N, 1, 48, 48] -> AveragePool 12x12 -> Flatten -> Gemm 16x7 (-> Softmax)
+
+The weights are fixed and random, so the scores mean nothing, but they
+depend on where the crop is bright, so different crops get different
+labels. The ONNX protobuf is written by hand: neither onnx nor torch is
+needed to rebuild the fixtures.
+
+    python bench/tiny_model.py    # rewrites bench/fixtures/tiny_fer_*.onnx
+"""
+import os
+
+import numpy as np
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+LOGITS_PATH = os.path.join(FIXTURE_DIR, 'tiny_fer_logits.onnx')
+SOFTMAX_PATH = os.path.join(FIXTURE_DIR, 'tiny_fer_softmax.onnx')
+
+POOL = 12
+FEATURES = (48 // POOL) ** 2
+CLASSES = 7
+
+FLOAT = 1
+ATTR_INT = 2
+ATTR_INTS = 7
+
+
+def weights():
+    """(W [16, 7], b [7]) shared by both fixtures."""
+    rng = np.random.default_rng(2013)
+    return (rng.normal(0, 4, (FEATURES, CLASSES)).astype(np.float32),
+            rng.normal(0, 0.5, CLASSES).astype(np.float32))
+
+
+def reference(blob, softmax=True):
+    """The network in numpy, for a float NCHW blob."""
+    n = blob.shape[0]
+    pooled = blob.reshape(n, 48 // POOL, POOL, 48 // POOL, POOL).mean(axis=(2, 4)).reshape(n, FEATURES)
+    w, b = weights()
+    out = pooled @ w + b
+    if softmax:
+        out = np.exp(out - out.max(axis=1, keepdims=True))
+        out /= out.sum(axis=1, keepdims=True)
+    return out
+
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _int(field, value):
+    return _varint(field << 3) + _varint(value)
+
+
+def _bytes(field, value):
+    if isinstance(value, str):
+        value = value.encode()
+    return _varint(field << 3 | 2) + _varint(len(value)) + value
+
+
+def _attr_int(name, value):
+    return _bytes(1, name) + _int(3, value) + _int(20, ATTR_INT)
+
+
+def _attr_ints(name, values):
+    return _bytes(1, name) + b''.join(_int(8, v) for v in values) + _int(20, ATTR_INTS)
+
+
+def _node(op_type, inputs, outputs, *attributes):
+    return (b''.join(_bytes(1, i) for i in inputs) + b''.join(_bytes(2, o) for o in outputs)
+            + _bytes(3, outputs[0]) + _bytes(4, op_type) + b''.join(_bytes(5, a) for a in attributes))
+
+
+def _tensor(name, array):
+    return (b''.join(_int(1, d) for d in array.shape) + _int(2, FLOAT) + _bytes(8, name)
+            + _bytes(9, array.astype('<f4').tobytes()))
+
+
+def _value_info(name, dims):
+    shape = b''.join(_bytes(1, _bytes(2, d) if isinstance(d, str) else _int(1, d)) for d in dims)
+    return _bytes(1, name) + _bytes(2, _bytes(1, _int(1, FLOAT) + _bytes(2, shape)))
+
+
+def build(softmax):
+    """Serialized ModelProto (IR 7, opset 13)."""
+    w, b = weights()
+    output = 'probs' if softmax else 'logits'
+    nodes = [
+        _node('AveragePool', ['input'], ['pooled'],
+              _attr_ints('kernel_shape', [POOL, POOL]), _attr_ints('strides', [POOL, POOL])),
+        _node('Flatten', ['pooled'], ['flat'], _attr_int('axis', 1)),
+        _node('Gemm', ['flat', 'W', 'b'], ['logits']),
+    ]
+    if softmax:
+        nodes.append(_node('Softmax', ['logits'], ['probs'], _attr_int('axis', 1)))
+    graph = (b''.join(_bytes(1, n) for n in nodes) + _bytes(2, 'tiny_fer')
+             + _bytes(5, _tensor('W', w)) + _bytes(5, _tensor('b', b))
+             + _bytes(11, _value_info('input', ['N', 1, 48, 48]))
+             + _bytes(12, _value_info(output, ['N', CLASSES])))
+    return (_int(1, 7) + _bytes(2, 'rooha-bench') + _bytes(7, graph)
+            + _bytes(8, _bytes(1, '') + _int(2, 13)))
+
+
+def main():
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    for path, softmax in ((LOGITS_PATH, False), (SOFTMAX_PATH, True)):
+        with open(path, 'wb') as f:
+            f.write(build(softmax))
+        print(f"Wrote {os.path.relpath(path)} ({os.path.getsize(path)} bytes)")
+
+
+if __name__ == '__main__':
+    main()
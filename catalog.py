@@ -0,0 +1,231 @@
+"""
+Offline track catalog for mood-based recommendations without the network.
+
+A catalog is a directory with three files:
+
+    tracks.npy   structured array (valence, energy, popularity, meta offset/length),
+                 sorted by valence/energy grid cell; opened with mmap_mode='r'
+    bins.npy     start row of every grid cell, so a valence/energy box maps to
+                 a few contiguous row ranges
+    meta.jsonl   one JSON object per track (name, artist, url, ...)
+
+Queries filter to the mood's valence/energy box and rank by distance to its
+centre, touching only the rows in grid cells that overlap the box.
+"""
+import os
+import ast
+import csv
+import json
+import mmap
+
+import numpy as np
+
+
+BINS_PER_AXIS = 64
+
+TRACK_DTYPE = np.dtype([
+    ('valence', '<f4'),
+    ('energy', '<f4'),
+    ('popularity', 'u1'),
+    ('meta_offset', '<u8'),
+    ('meta_length', '<u4'),
+])
+
+COLUMN_ALIASES = {
+    'id': ('id', 'track_id', 'spotify_id'),
+    'name': ('name', 'track_name'),
+    'artist': ('artists', 'artist', 'artist_name'),
+    'album': ('album', 'album_name'),
+    'genre': ('genre', 'track_genre'),
+    'valence': ('valence',),
+    'energy': ('energy',),
+    'popularity': ('popularity',),
+    'duration_ms': ('duration_ms',),
+    'preview': ('preview_url', 'preview'),
+    'image': ('image', 'image_url'),
+    'url': ('url', 'spotify_url'),
+}
+
+
+def _bin(values, bins):
+    return np.minimum((np.clip(values, 0, 1) * bins).astype(np.int64), bins - 1)
+
+
+def _artist(value):
+    """Kaggle exports store artists as a Python list literal: "['A', 'B']"."""
+    if value.startswith('['):
+        try:
+            return ', '.join(ast.literal_eval(value))
+        except (ValueError, SyntaxError):
+            pass
+    return value
+
+
+def track_from_csv(row, columns):
+    """Track dict (same keys as app.parse_spotify_tracks, plus mood features) from a CSV row."""
+    get = lambda field: row.get(columns[field], '') if field in columns else ''
+    track_id = get('id')
+    track = {
+        'name': get('name'),
+        'artist': _artist(get('artist')),
+        'album': get('album'),
+        'preview': get('preview') or None,
+        'image': get('image'),
+        'url': get('url') or (f'https://open.spotify.com/track/{track_id}' if track_id else ''),
+        'duration_ms': int(float(get('duration_ms') or 0)),
+        'popularity': int(float(get('popularity') or 0)),
+        'valence': float(get('valence')),
+        'energy': float(get('energy')),
+    }
+    if get('genre'):
+        track['genre'] = get('genre')
+    return track
+
+
+def read_csv(path):
+    """Yield track dicts from a CSV export with valence/energy/popularity columns."""
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        header = {name.strip().lower(): name for name in reader.fieldnames or []}
+        columns = {}
+        for field, aliases in COLUMN_ALIASES.items():
+            for alias in aliases:
+                if alias in header:
+                    columns[field] = header[alias]
+                    break
+        missing = {'name', 'valence', 'energy'} - set(columns)
+        if missing:
+            raise ValueError(f"{path}: missing column(s) {', '.join(sorted(missing))}")
+        for row in reader:
+            try:
+                yield track_from_csv(row, columns)
+            except ValueError:
+                continue
+
+
+def write_catalog(tracks, out_dir, bins=BINS_PER_AXIS):
+    """
+    Write tracks (an iterable of dicts with valence/energy) as a catalog
+    directory. Metadata is streamed to disk; only the numeric columns are
+    held in memory. Duplicate track URLs keep their first occurrence.
+    Returns the number of tracks written.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    valence, energy, popularity, offsets, lengths = [], [], [], [], []
+    seen = set()
+    offset = 0
+    meta_tmp = os.path.join(out_dir, 'meta.tmp.jsonl')
+    with open(meta_tmp, 'wb') as meta:
+        for track in tracks:
+            key = track.get('url') or (track.get('name'), track.get('artist'))
+            if key in seen:
+                continue
+            seen.add(key)
+            line = json.dumps(track, separators=(',', ':')).encode() + b'\n'
+            meta.write(line)
+            valence.append(track['valence'])
+            energy.append(track['energy'])
+            popularity.append(min(max(int(track.get('popularity') or 0), 0), 100))
+            offsets.append(offset)
+            lengths.append(len(line) - 1)
+            offset += len(line)
+
+    data = np.empty(len(valence), dtype=TRACK_DTYPE)
+    data['valence'] = valence
+    data['energy'] = energy
+    data['popularity'] = popularity
+    data['meta_offset'] = offsets
+    data['meta_length'] = lengths
+
+    cells = _bin(data['valence'], bins) * bins + _bin(data['energy'], bins)
+    order = np.argsort(cells, kind='stable')
+    data = data[order]
+    bin_starts = np.searchsorted(cells[order], np.arange(bins * bins + 1)).astype(np.int64)
+
+    np.save(os.path.join(out_dir, 'tracks.tmp.npy'), data)
+    np.save(os.path.join(out_dir, 'bins.tmp.npy'), bin_starts)
+    for name in ('meta.jsonl', 'tracks.npy', 'bins.npy'):
+        stem, ext = os.path.splitext(name)
+        os.replace(os.path.join(out_dir, f'{stem}.tmp{ext}'), os.path.join(out_dir, name))
+    return len(data)
+
+
+def import_csv(csv_path, out_dir, bins=BINS_PER_AXIS):
+    return write_catalog(read_csv(csv_path), out_dir, bins)
+
+
+class Catalog:
+    """Read-only, memory-mapped view of a catalog directory."""
+
+    def __init__(self, path):
+        self.path = path
+        self.tracks = np.load(os.path.join(path, 'tracks.npy'), mmap_mode='r')
+        self.bin_starts = np.load(os.path.join(path, 'bins.npy'))
+        self.bins = int(round((len(self.bin_starts) - 1) ** 0.5))
+        self._meta_file = open(os.path.join(path, 'meta.jsonl'), 'rb')
+        self._meta = mmap.mmap(self._meta_file.fileno(), 0, access=mmap.ACCESS_READ) if len(self.tracks) else b''
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def track(self, row):
+        record = self.tracks[row]
+        start = int(record['meta_offset'])
+        return json.loads(self._meta[start:start + int(record['meta_length'])])
+
+    def candidates(self, valence_range, energy_range):
+        """Row numbers of the grid cells overlapping the box."""
+        bins = self.bins
+        v0, v1 = _bin(np.array(valence_range), bins)
+        e0, e1 = _bin(np.array(energy_range), bins)
+        rows = np.arange(v0, v1 + 1) * bins
+        starts = self.bin_starts[rows + e0]
+        ends = self.bin_starts[rows + e1 + 1]
+        return np.concatenate([np.arange(s, e) for s, e in zip(starts, ends)] or [np.empty(0, np.int64)])
+
+    def query(self, valence_range, energy_range, limit=50):
+        """
+        Row numbers of up to `limit` tracks inside the box, closest to its
+        centre first (distances scaled by the box size), then most popular.
+        """
+        rows = self.candidates(valence_range, energy_range)
+        if not len(rows):
+            return rows
+        data = self.tracks[rows]
+        v, e = data['valence'], data['energy']
+        (v_lo, v_hi), (e_lo, e_hi) = np.float32(valence_range), np.float32(energy_range)
+        inside = (v >= v_lo) & (v <= v_hi) & (e >= e_lo) & (e <= e_hi)
+        rows, v, e, popularity = rows[inside], v[inside], e[inside], data['popularity'][inside]
+
+        v_center, v_half = sum(valence_range) / 2, max((valence_range[1] - valence_range[0]) / 2, 1e-6)
+        e_center, e_half = sum(energy_range) / 2, max((energy_range[1] - energy_range[0]) / 2, 1e-6)
+        distance = np.hypot((v - v_center) / v_half, (e - e_center) / e_half)
+
+        if len(rows) > limit:
+            keep = np.argpartition(distance, limit - 1)[:limit]
+            rows, distance, popularity = rows[keep], distance[keep], popularity[keep]
+        order = np.lexsort((rows, -popularity.astype(np.int16), distance))
+        return rows[order]
+
+    def recommend(self, valence_range, energy_range, limit=50):
+        return [self.track(row) for row in self.query(valence_range, energy_range, limit)]
+
+    def iter_tracks(self):
+        for row in range(len(self.tracks)):
+            yield self.track(row)
+
+    def close(self):
+        if isinstance(self._meta, mmap.mmap):
+            self._meta.close()
+        self._meta_file.close()
+
+
+def open_catalog(path):
+    """Catalog at `path`, or None when it is not configured or cannot be opened."""
+    if not path:
+        return None
+    try:
+        return Catalog(path)
+    except (OSError, ValueError) as e:
+        print(f"Catalog error: {e}")
+        return None
@@ -0,0 +1,214 @@
+import os
+import queue
+import atexit
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+from tracks import TrackStore
+import metrics
+
+
+WRITE_BATCH_SIZE = int(os.environ.get('DB_WRITE_BATCH_SIZE', '64'))
+ID_BLOCK_SIZE = int(os.environ.get('DB_ID_BLOCK_SIZE', '100'))
+BUSY_TIMEOUT_MS = 5000
+
+SESSION_COLUMNS = ('id', 'user_id', 'input_type', 'detected_emotion', 'confidence', 'mood',
+                   'input_text', 'created_at')
+
+
+def utc_timestamp():
+    """Same format as SQLite's CURRENT_TIMESTAMP."""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class Database:
+    """
+    SQLite access with one long-lived connection per thread.
+
+    Connections are never shared between threads or carried across fork():
+    a child process opens its own on first use.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        return conn
+
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid() or self._local.path != self.path:
+            conn = self.connect()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            self._local.path = self.path
+        return conn
+
+
+class SessionWriter:
+    """
+    Single writer thread for `sessions` and `feedback` inserts.
+
+    Requests enqueue writes and return immediately; the writer drains the
+    queue and commits everything it finds in one transaction (group
+    commit). A session's tracks are stored once in `tracks` and linked
+    through `session_tracks`. Session ids are handed out up front from
+    blocks reserved in the `id_blocks` table, so callers get an id without
+    waiting for the insert, and several processes can write to the same
+    database.
+    """
+
+    def __init__(self, database, batch_size=WRITE_BATCH_SIZE, id_block_size=ID_BLOCK_SIZE):
+        self.database = database
+        self.batch_size = batch_size
+        self.id_block_size = id_block_size
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._next_id = 0
+        self._block_end = 0
+        self.committed = 0
+        self.batches = 0
+        self.errors = 0
+        self.track_store = TrackStore()
+        atexit.register(self.close)
+
+    # ---------- ids ----------
+
+    def _reserve_block(self):
+        conn = self.database.connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute("SELECT next_id FROM id_blocks WHERE name='sessions'").fetchone()
+            max_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM sessions').fetchone()[0]
+            start = max(row[0] if row else 1, max_id + 1)
+            conn.execute("INSERT OR REPLACE INTO id_blocks (name, next_id) VALUES ('sessions', ?)",
+                         (start + self.id_block_size,))
+            conn.commit()
+        finally:
+            conn.close()
+        self._next_id, self._block_end = start, start + self.id_block_size
+
+    def next_session_id(self):
+        with self._lock:
+            self._check_pid()
+            if self._next_id >= self._block_end:
+                self._reserve_block()
+            session_id = self._next_id
+            self._next_id += 1
+            return session_id
+
+    # ---------- thread ----------
+
+    def _check_pid(self):
+        """Ids and the writer thread belong to one process; start over after fork(). Caller holds the lock."""
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._queue = queue.Queue()
+            self._thread = None
+            self._next_id = self._block_end = 0
+
+    def _ensure_started(self):
+        with self._lock:
+            self._check_pid()
+            # restarted if it ever died, so queued writes are not stranded
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, args=(self._queue,),
+                                                name='db-writer', daemon=True)
+                self._thread.start()
+            return self._queue
+
+    def _run(self, q):
+        conn = self.database.connect()
+        conn.execute('PRAGMA synchronous=NORMAL')
+        while True:
+            items = [q.get()]
+            while len(items) < self.batch_size:
+                try:
+                    items.append(q.get_nowait())
+                except queue.Empty:
+                    break
+
+            writes = [item for item in items if callable(item)]
+            if writes:
+                self._commit(conn, writes)
+            for item in items:
+                if isinstance(item, threading.Event):
+                    item.set()
+            if None in items:
+                conn.close()
+                return
+
+    def _commit(self, conn, writes):
+        try:
+            with metrics.timer('db_commit'), conn:
+                for write in writes:
+                    write(conn)
+            self.committed += len(writes)
+            self.batches += 1
+        except Exception as e:
+            # any failing row (bad value, JSON error) rolls back the batch; retry the rest without it
+            print(f"DB batch write error, retrying rows one by one: {e}")
+            self.track_store.forget()
+            for write in writes:
+                try:
+                    with conn:
+                        write(conn)
+                    self.committed += 1
+                except Exception as row_error:
+                    self.track_store.forget()
+                    self.errors += 1
+                    print(f"DB write dropped: {row_error}")
+
+    # ---------- API ----------
+
+    def add_session(self, user_id, input_type, emotion, confidence, mood, tracks, input_text=None):
+        session_id = self.next_session_id()
+        row = (session_id, user_id, input_type, emotion, confidence, mood, input_text, utc_timestamp())
+        sql = f"INSERT INTO sessions ({', '.join(SESSION_COLUMNS)}) VALUES ({', '.join('?' * len(row))})"
+        tracks = list(tracks)
+
+        def write(conn):
+            conn.execute(sql, row)
+            self.track_store.save(conn, session_id, tracks)
+
+        self._ensure_started().put(write)
+        return session_id
+
+    def add_feedback(self, session_id, rating):
+        row = (session_id, rating, utc_timestamp())
+        self.submit(
+            lambda conn: conn.execute('INSERT INTO feedback (session_id, rating, created_at) VALUES (?,?,?)', row))
+
+    def submit(self, write):
+        """Queue `write(conn)` to run inside the writer's next transaction."""
+        self._ensure_started().put(write)
+
+    def flush(self, timeout=5):
+        """Block until everything queued so far is committed."""
+        done = threading.Event()
+        self._ensure_started().put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout=5):
+        with self._lock:
+            thread, q = self._thread, self._queue
+            if thread is None or self._pid != os.getpid():
+                return
+            self._thread = None
+        q.put(None)
+        thread.join(timeout)
+
+    def stats(self):
+        return {
+            'pending': self._queue.qsize() if self._queue else 0,
+            'committed': self.committed,
+            'batches': self.batches,
+            'errors': self.errors,
+        }
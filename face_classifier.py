@@ -0,0 +1,211 @@
+"""
+Emotion classifiers for 48x48 grayscale face crops.
+
+Every backend takes a list of crops and returns one (emotion, confidence)
+per crop, so all faces of a frame are scored in a single call.
+"""
+import os
+import queue
+import random
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+
+# FER2013 label order, which is also the order of app.EMOTIONS
+LABELS = ['angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral']
+FACE_SIZE = 48
+
+FACE_CLASSIFIER = os.environ.get('FACE_CLASSIFIER', 'heuristic')
+FACE_MODEL_PATH = os.environ.get('FACE_MODEL_PATH', '')
+FACE_MODEL_INT8_PATH = os.environ.get('FACE_MODEL_INT8_PATH', '')
+FACE_MODEL_PRECISION = os.environ.get('FACE_MODEL_PRECISION', 'fp32')
+FACE_MODEL_SCALE = float(os.environ.get('FACE_MODEL_SCALE', str(1 / 255)))
+FACE_BATCH_MAX = int(os.environ.get('FACE_BATCH_MAX', '32'))
+FACE_BATCH_WAIT_MS = float(os.environ.get('FACE_BATCH_WAIT_MS', '0'))
+
+
+class HeuristicClassifier:
+    """Brightness/contrast/symmetry rules plus a little noise; needs no model file."""
+
+    name = 'heuristic'
+
+    def classify(self, faces):
+        return [self._classify_one(face) for face in faces]
+
+    def _classify_one(self, face_resized):
+        brightness = np.mean(face_resized)
+        contrast = np.std(face_resized)
+        upper_half = np.mean(face_resized[:24, :])
+        lower_half = np.mean(face_resized[24:, :])
+        left_half = np.mean(face_resized[:, :24])
+        right_half = np.mean(face_resized[:, 24:])
+        symmetry = 1.0 - abs(left_half - right_half) / 255.0
+
+        scores = {
+            'happy': 0.0, 'sad': 0.0, 'angry': 0.0, 'fear': 0.0,
+            'surprise': 0.0, 'disgust': 0.0, 'neutral': 0.0
+        }
+
+        if brightness > 130 and lower_half > upper_half:
+            scores['happy'] += 3.0
+        if brightness < 100:
+            scores['sad'] += 2.0
+            scores['angry'] += 1.0
+        if contrast > 60:
+            scores['surprise'] += 2.0
+            scores['angry'] += 1.0
+        if upper_half > lower_half + 10:
+            scores['surprise'] += 2.0
+        if symmetry > 0.9:
+            scores['neutral'] += 2.0
+            scores['happy'] += 1.0
+        if contrast < 35:
+            scores['neutral'] += 2.0
+            scores['sad'] += 1.0
+
+        for e in scores:
+            scores[e] += random.uniform(0, 0.5)
+
+        emotion = max(scores, key=scores.get)
+        total = sum(scores.values())
+        confidence = min(scores[emotion] / max(total, 1), 0.92)
+        return emotion, max(confidence, 0.35)
+
+
+class DnnClassifier:
+    """
+    FER2013-style CNN run through cv2.dnn (ONNX, or any format readNet accepts).
+
+    The network is loaded once; a batch of crops becomes one NCHW blob and
+    one forward pass. Outputs are 7 scores per face in LABELS order, either
+    probabilities or logits (softmax is applied when rows do not sum to 1).
+    A cv2.dnn.Net is not thread-safe, so forward passes are serialized.
+    """
+
+    name = 'dnn'
+
+    def __init__(self, model_path, scale=FACE_MODEL_SCALE):
+        if cv2 is None:
+            raise ImportError('OpenCV is not installed')
+        if not model_path or not os.path.exists(model_path):
+            raise FileNotFoundError(f'Face model not found: {model_path!r}')
+        self.model_path = model_path
+        self.scale = scale
+        self.net = cv2.dnn.readNet(model_path)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.faces = 0
+
+    def forward(self, faces):
+        blob = cv2.dnn.blobFromImages(faces, self.scale, (FACE_SIZE, FACE_SIZE))
+        with self._lock:
+            self.net.setInput(blob)
+            out = self.net.forward()
+            self.batches += 1
+            self.faces += len(faces)
+        out = out.reshape(len(faces), -1)[:, :len(LABELS)].astype(np.float32)
+        if not np.allclose(out.sum(axis=1), 1, atol=1e-3) or (out < 0).any():
+            out = np.exp(out - out.max(axis=1, keepdims=True))
+            out /= out.sum(axis=1, keepdims=True)
+        return out
+
+    def classify(self, faces):
+        if not faces:
+            return []
+        probs = self.forward(faces)
+        best = probs.argmax(axis=1)
+        return [(LABELS[i], float(probs[row, i])) for row, i in enumerate(best)]
+
+
+class BatchingClassifier:
+    """
+    Merges concurrent classify() calls into shared forward passes.
+
+    One thread owns the wrapped classifier. It takes the first waiting
+    request, then everything else already queued (up to `max_batch` faces),
+    optionally waiting `max_wait` seconds for more, and runs them as one
+    batch. With max_wait=0 no request is ever delayed: batches only form
+    when requests are already waiting.
+    """
+
+    def __init__(self, classifier, max_batch=FACE_BATCH_MAX, max_wait=FACE_BATCH_WAIT_MS / 1000):
+        self.classifier = classifier
+        self.name = classifier.name
+        self.max_batch = max(max_batch, 1)
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, args=(self._queue,),
+                                                name='face-batcher', daemon=True)
+                self._thread.start()
+            return self._queue
+
+    def _collect(self, q):
+        jobs = [q.get()]
+        size = len(jobs[0][0])
+        while size < self.max_batch:
+            try:
+                job = q.get(timeout=self.max_wait) if self.max_wait > 0 else q.get_nowait()
+            except queue.Empty:
+                break
+            jobs.append(job)
+            size += len(job[0])
+        return jobs
+
+    def _run(self, q):
+        while True:
+            jobs = self._collect(q)
+            faces = [face for job_faces, _ in jobs for face in job_faces]
+            try:
+                results = self.classifier.classify(faces)
+            except Exception as e:
+                for _, future in jobs:
+                    future.set_exception(e)
+                continue
+            start = 0
+            for job_faces, future in jobs:
+                future.set_result(results[start:start + len(job_faces)])
+                start += len(job_faces)
+
+    def classify(self, faces):
+        if not faces:
+            return []
+        future = Future()
+        self._ensure_started().put((list(faces), future))
+        return future.result()
+
+
+def model_path(precision=FACE_MODEL_PRECISION):
+    """The int8 (quantized) model when requested and configured, else the fp32 one."""
+    if precision == 'int8' and FACE_MODEL_INT8_PATH:
+        return FACE_MODEL_INT8_PATH
+    return FACE_MODEL_PATH
+
+
+def load_classifier(kind=FACE_CLASSIFIER):
+    """Build the configured backend; falls back to the heuristic when the model cannot be loaded."""
+    if kind == 'dnn':
+        try:
+            return BatchingClassifier(DnnClassifier(model_path()))
+        except Exception as e:
+            print(f"Face classifier error, using heuristic backend: {e}")
+    elif kind != 'heuristic':
+        print(f"Unknown FACE_CLASSIFIER {kind!r}, using heuristic backend")
+    return HeuristicClassifier()
@@ -0,0 +1,255 @@
+import os
+import queue
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+import face_classifier
+import metrics
+
+
+FACE_CASCADE_FILE = 'haarcascade_frontalface_default.xml'
+POOL_SIZE = int(os.environ.get('FACE_DETECTOR_POOL_SIZE', str(max(os.cpu_count() or 1, 4))))
+# Large uploads are decoded at 1/2 or 1/4 scale as long as the longest side stays above this
+DECODE_TARGET_SIZE = int(os.environ.get('FACE_DECODE_TARGET_SIZE', '640'))
+
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def cascade_path(filename=FACE_CASCADE_FILE):
+    """Prefer the cascade bundled with OpenCV, fall back to the copy in the repo."""
+    if cv2 is not None:
+        bundled = os.path.join(cv2.data.haarcascades, filename)
+        if os.path.exists(bundled):
+            return bundled
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
+
+
+class FaceDetectorPool:
+    """
+    Pool of warm cv2.CascadeClassifier instances.
+
+    A classifier is parsed from XML once and then reused across requests.
+    Each detector is checked out by exactly one thread at a time, so the
+    pool is safe under threaded servers that spawn a thread per request.
+    At most `size` detectors exist; once they are all checked out, further
+    threads wait for one to be released instead of parsing another.
+    """
+
+    def __init__(self, filename=FACE_CASCADE_FILE, size=POOL_SIZE):
+        self.filename = filename
+        self.size = max(size, 1)
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._live = 0
+        self.created = 0
+        self.waits = 0
+
+    def _create(self):
+        if cv2 is None:
+            raise ImportError('OpenCV is not installed')
+        detector = cv2.CascadeClassifier(cascade_path(self.filename))
+        if detector.empty():
+            raise RuntimeError(f'Could not load cascade {self.filename}')
+        with self._lock:
+            self.created += 1
+        return detector
+
+    def _checkout(self):
+        """(generation, detector): an idle one, a new one while under `size`, else wait."""
+        while True:
+            try:
+                entry = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    generation = self._generation
+                    create = self._live < self.size
+                    if create:
+                        self._live += 1
+                    else:
+                        self.waits += 1
+                if create:
+                    try:
+                        return generation, self._create()
+                    except Exception:
+                        with self._lock:
+                            if generation == self._generation:
+                                self._live -= 1
+                        raise
+                entry = self._idle.get()
+            # a detector released while reload() was draining is dropped here
+            if entry[0] == self._generation:
+                return entry
+
+    @contextmanager
+    def acquire(self):
+        generation, detector = self._checkout()
+        try:
+            yield detector
+        finally:
+            # detectors from before a reload are dropped; reload() already
+            # stopped counting them
+            if generation == self._generation:
+                self._idle.put((generation, detector))
+
+    def warm_up(self):
+        """Load `size` detectors and run each once so the first request is not cold."""
+        blank = np.zeros((96, 96), dtype=np.uint8)
+        with self._lock:
+            generation = self._generation
+            missing = self.size - self._live
+            self._live += missing
+        detectors = []
+        try:
+            for _ in range(missing):
+                detectors.append(self._create())
+        finally:
+            with self._lock:
+                if generation == self._generation:
+                    self._live -= missing - len(detectors)
+        for detector in detectors:
+            detector.detectMultiScale(blank, 1.1, 5, minSize=(48, 48))
+            self._idle.put((generation, detector))
+        return self._idle.qsize()
+
+    def reload(self):
+        """Drop every pooled detector and load fresh ones from disk."""
+        with self._lock:
+            self._generation += 1
+            self._live = 0
+            while True:
+                try:
+                    self._idle.get_nowait()
+                except queue.Empty:
+                    break
+        return self.warm_up()
+
+    def stats(self):
+        return {'idle': self._idle.qsize(), 'size': self.size, 'created': self.created, 'waits': self.waits}
+
+
+face_detectors = FaceDetectorPool()
+
+
+def image_size(buf):
+    """(width, height) from a JPEG or PNG header without decoding, or None."""
+    data = memoryview(buf)
+    if len(data) >= 24 and bytes(data[:8]) == b'\x89PNG\r\n\x1a\n':
+        return int.from_bytes(data[16:20], 'big'), int.from_bytes(data[20:24], 'big')
+    if len(data) < 4 or bytes(data[:2]) != b'\xff\xd8':
+        return None
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker in JPEG_SOF_MARKERS:
+            height = int.from_bytes(data[i + 5:i + 7], 'big')
+            width = int.from_bytes(data[i + 7:i + 9], 'big')
+            return width, height
+        i += 2 + int.from_bytes(data[i + 2:i + 4], 'big')
+    return None
+
+
+def decode_flag(size):
+    """Pick a grayscale imdecode flag, reducing resolution for large images."""
+    if size:
+        longest = max(size)
+        if longest >= DECODE_TARGET_SIZE * 4:
+            return cv2.IMREAD_REDUCED_GRAYSCALE_4
+        if longest >= DECODE_TARGET_SIZE * 2:
+            return cv2.IMREAD_REDUCED_GRAYSCALE_2
+    return cv2.IMREAD_GRAYSCALE
+
+
+def decode_gray(buf):
+    """Decode an encoded image (any bytes-like object, not copied) straight to grayscale."""
+    if cv2 is None:
+        raise ImportError('OpenCV is not installed')
+    arr = np.frombuffer(buf, np.uint8)
+    with metrics.timer('face_imdecode'):
+        return cv2.imdecode(arr, decode_flag(image_size(arr)))
+
+
+_classifier = None
+_classifier_lock = threading.Lock()
+
+
+def get_classifier():
+    """The configured face_classifier backend, loaded once per process."""
+    global _classifier
+    if _classifier is None:
+        with _classifier_lock:
+            if _classifier is None:
+                _classifier = face_classifier.load_classifier()
+    return _classifier
+
+
+def analyze_faces(gray, detectors=None):
+    """
+    Detect every face and classify all of them in one batch.
+    Returns [{'box': [x, y, w, h], 'emotion': ..., 'confidence': ...}], largest face first.
+    """
+    with metrics.timer('face_detect'), (detectors or face_detectors).acquire() as face_cascade:
+        faces = face_cascade.detectMultiScale(gray, 1.1, 5, minSize=(48, 48))
+    if len(faces) == 0:
+        return []
+
+    with metrics.timer('face_score'):
+        boxes = sorted((tuple(int(v) for v in f) for f in faces), key=lambda f: f[2] * f[3], reverse=True)
+        crops = [cv2.resize(gray[y:y+h, x:x+w], (face_classifier.FACE_SIZE, face_classifier.FACE_SIZE))
+                 for x, y, w, h in boxes]
+        results = get_classifier().classify(crops)
+    return [{'box': list(box), 'emotion': emotion, 'confidence': confidence}
+            for box, (emotion, confidence) in zip(boxes, results)]
+
+
+def analyze_gray(gray, detectors=None):
+    """
+    (emotion, confidence) for a grayscale image: the largest face as scored
+    by the classifier backend, or a brightness guess when no face is found.
+    """
+    faces = analyze_faces(gray, detectors)
+    if faces:
+        return faces[0]['emotion'], faces[0]['confidence']
+
+    avg_brightness = np.mean(gray)
+    if avg_brightness > 140:
+        return 'happy', 0.55
+    if avg_brightness < 80:
+        return 'sad', 0.50
+    return 'neutral', 0.45
+
+
+def analyze_image(buf):
+    """(emotion, confidence) for an encoded image; raises ImportError without OpenCV."""
+    gray = decode_gray(buf)
+    if gray is None:
+        return 'neutral', 0.5
+    return analyze_gray(gray)
+
+
+def warm_up():
+    if cv2 is None:
+        print("Face engine: OpenCV not installed, skipping warm-up")
+        return 0
+    try:
+        get_classifier()
+        return face_detectors.warm_up()
+    except Exception as e:
+        print(f"Face engine warm-up error: {e}")
+        return 0
+
+
+def reload():
+    return face_detectors.reload()
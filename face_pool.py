@@ -0,0 +1,253 @@
+import os
+import sys
+import time
+import types
+import threading
+import multiprocessing
+import multiprocessing.context
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+import face_engine
+import metrics
+
+
+FACE_POOL_WORKERS = int(os.environ.get('FACE_POOL_WORKERS', str(min(os.cpu_count() or 1, 4))))
+FACE_POOL_QUEUE_SIZE = int(os.environ.get('FACE_POOL_QUEUE_SIZE', '16'))
+FACE_JOB_TIMEOUT = float(os.environ.get('FACE_JOB_TIMEOUT', '5'))
+FACE_POOL_START_METHOD = os.environ.get(
+    'FACE_POOL_START_METHOD', 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+
+
+class FacePoolBusy(Exception):
+    """The pool cannot take the job in time; the client should retry after `retry_after` seconds."""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+# ---------- worker side ----------
+
+def _watch_parent(parent):
+    """Exit once the web process is gone, e.g. a serve.py worker killed with SIGKILL."""
+    parent.join()
+    os._exit(0)
+
+
+def _init_worker():
+    face_engine.face_detectors.size = 1
+    face_engine.warm_up()
+    # the process that started the pool, not os.getppid(): under forkserver that is the fork server
+    parent = multiprocessing.parent_process()
+    if parent is not None:
+        threading.Thread(target=_watch_parent, args=(parent,), name='parent-watch', daemon=True).start()
+
+
+def _ping():
+    return os.getpid()
+
+
+def _run_job(buf, deadline):
+    """
+    Runs in a worker process. Jobs whose caller has already given up are
+    skipped. Returns (result, seconds, [(stage, seconds)]).
+    """
+    started = time.time()
+    if started > deadline:
+        return None, 0.0, []
+    with metrics.collect() as stages:
+        result = face_engine.analyze_image(buf)
+    return result, time.time() - started, stages
+
+
+# ---------- starting workers ----------
+
+@contextmanager
+def _bare_main():
+    """
+    Hide the web process's __main__ (app.py, serve.py) while a worker is
+    started, so the worker does not re-run it and build the whole app; it
+    only imports this module and face_engine.
+    """
+    main = sys.modules['__main__']
+    sys.modules['__main__'] = types.ModuleType('__main__')
+    try:
+        yield
+    finally:
+        sys.modules['__main__'] = main
+
+
+class _SpawnWorker(multiprocessing.context.SpawnProcess):
+    def start(self):
+        with _bare_main():
+            super().start()
+
+
+class _SpawnContext(multiprocessing.context.SpawnContext):
+    Process = _SpawnWorker
+
+
+_contexts = {'spawn': _SpawnContext}
+
+if 'forkserver' in multiprocessing.get_all_start_methods():
+    class _ForkServerWorker(multiprocessing.context.ForkServerProcess):
+        def start(self):
+            with _bare_main():
+                super().start()
+
+    class _ForkServerContext(multiprocessing.context.ForkServerContext):
+        Process = _ForkServerWorker
+
+    _contexts['forkserver'] = _ForkServerContext
+
+
+def worker_context(start_method):
+    """
+    multiprocessing context for the pool. 'forkserver' forks workers from a
+    small server that has imported face_engine (OpenCV) once; 'spawn' starts
+    each one from scratch; neither runs the web process's __main__. 'fork'
+    copies the web process as it is.
+    """
+    if start_method not in _contexts:
+        return multiprocessing.get_context(start_method)
+    ctx = _contexts[start_method]()
+    if start_method == 'forkserver':
+        ctx.set_forkserver_preload(['face_engine', 'face_pool'])
+    return ctx
+
+
+# ---------- parent side ----------
+
+class FacePool:
+    """
+    Face analysis in a fixed set of worker processes, each with its own warm
+    Haar detector, so a burst of uploads does not hold the GIL of the web
+    process.
+
+    At most `workers + queue_size` jobs are admitted at once; further
+    submissions fail immediately with FacePoolBusy instead of queueing
+    without bound. Every job has a deadline: a caller stops waiting after
+    `timeout` seconds and a worker skips jobs that expired while queued.
+    The executor is created lazily and again after fork().
+    """
+
+    def __init__(self, workers=FACE_POOL_WORKERS, queue_size=FACE_POOL_QUEUE_SIZE,
+                 timeout=FACE_JOB_TIMEOUT, start_method=FACE_POOL_START_METHOD):
+        self.workers = max(workers, 1)
+        self.queue_size = max(queue_size, 0)
+        self.timeout = timeout
+        self.start_method = start_method
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._in_flight = set()
+        self._started_at = time.monotonic()
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+
+    def _ensure_executor(self):
+        """Caller holds the lock."""
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, initializer=_init_worker,
+                mp_context=worker_context(self.start_method))
+            self._pid = os.getpid()
+            self._in_flight = set()
+            self._started_at = time.monotonic()
+        return self._executor
+
+    def _retry_after(self):
+        """Rough time for the current backlog to drain, in whole seconds."""
+        per_job = self.busy_seconds / self.completed if self.completed else 0.2
+        return max(1, round(len(self._in_flight) * per_job / self.workers))
+
+    def _done(self, future):
+        with self._lock:
+            self._in_flight.discard(future)
+
+    def submit(self, buf, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        with self._lock:
+            executor = self._ensure_executor()
+            if len(self._in_flight) >= self.workers + self.queue_size:
+                self.rejected += 1
+                raise FacePoolBusy('Face analysis queue is full', self._retry_after())
+            future = executor.submit(_run_job, bytes(buf), time.time() + timeout)
+            self._in_flight.add(future)
+            self.submitted += 1
+        future.add_done_callback(self._done)
+        return future
+
+    def analyze(self, buf, timeout=None):
+        """(emotion, confidence) for an encoded image, computed in a worker process."""
+        timeout = self.timeout if timeout is None else timeout
+        submitted_at = time.perf_counter()
+        future = self.submit(buf, timeout)
+        try:
+            result, elapsed, stages = future.result(timeout)
+        except FutureTimeout:
+            future.cancel()
+            with self._lock:
+                self.timeouts += 1
+            raise FacePoolBusy(f'Face analysis took longer than {timeout:g}s', self._retry_after())
+        except BrokenProcessPool:
+            with self._lock:
+                self.errors += 1
+                self._executor = None
+            raise
+        for stage, seconds in stages:
+            if seconds is None:
+                metrics.count(stage)
+            else:
+                metrics.record(stage, seconds)
+        metrics.record('face_pool_wait', max(time.perf_counter() - submitted_at - elapsed, 0.0))
+        with self._lock:
+            self.busy_seconds += elapsed
+            if result is None:
+                self.timeouts += 1
+            else:
+                self.completed += 1
+        if result is None:
+            raise FacePoolBusy('Face analysis job expired in the queue', self._retry_after())
+        return result
+
+    def warm_up(self):
+        """Start every worker now so the first uploads do not pay for process start-up."""
+        with self._lock:
+            executor = self._ensure_executor()
+        try:
+            pids = {f.result() for f in [executor.submit(_ping) for _ in range(self.workers * 2)]}
+        except Exception as e:
+            print(f"Face pool warm-up error: {e}")
+            return 0
+        return len(pids)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None and self._pid == os.getpid():
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            in_flight = list(self._in_flight)
+            uptime = time.monotonic() - self._started_at
+        running = sum(1 for f in in_flight if f.running())
+        return {
+            'workers': self.workers,
+            'queue_size': self.queue_size,
+            'queued': len(in_flight) - running,
+            'running': running,
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'timeouts': self.timeouts,
+            'errors': self.errors,
+            'utilization': round(self.busy_seconds / (uptime * self.workers), 3) if uptime > 0 else 0,
+        }
@@ -0,0 +1,204 @@
+import os
+import time
+import uuid
+import threading
+from collections import deque, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+
+STREAM_WINDOW = int(os.environ.get('FACE_STREAM_WINDOW', '8'))
+STREAM_MIN_FRAMES = int(os.environ.get('FACE_STREAM_MIN_FRAMES', '3'))
+STREAM_IDLE_TIMEOUT = float(os.environ.get('FACE_STREAM_IDLE_TIMEOUT', '30'))
+STREAM_WORKERS = int(os.environ.get('FACE_STREAM_WORKERS', '2'))
+STREAM_EVENT_BACKLOG = 32
+
+
+class FaceStream:
+    """
+    One live webcam session.
+
+    Frames are kept in a single-slot mailbox: a new frame replaces any frame
+    that has not been picked up yet, so a slow analyzer always works on the
+    most recent image. Per-frame results are smoothed over a sliding window
+    (confidence-weighted votes), and `on_change` runs only when the smoothed
+    emotion changes.
+
+    Each executor task handles one frame and queues the next one behind
+    other streams' work, so busy streams cannot hold every worker.
+    `on_change` (a playlist fetch and a DB write) runs on `change_executor`,
+    with the same single-slot mailbox: only the latest change is applied.
+    """
+
+    def __init__(self, stream_id, user_id, analyze, on_change, executor, change_executor=None,
+                 window=STREAM_WINDOW, min_frames=STREAM_MIN_FRAMES):
+        self.id = stream_id
+        self.user_id = user_id
+        self.analyze = analyze
+        self.on_change = on_change
+        self.executor = executor
+        self.change_executor = change_executor or executor
+        self.min_frames = min_frames
+
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+        self.emotion = None
+        self.confidence = 0.0
+        self.last_seen = time.monotonic()
+        self.closed = False
+
+        self._window = deque(maxlen=window)
+        self._pending = None
+        self._busy = False
+        self._change = None
+        self._changing = False
+        self._lock = threading.Lock()
+        self._events = deque(maxlen=STREAM_EVENT_BACKLOG)
+        self._seq = 0
+        self._cond = threading.Condition(self._lock)
+
+    def push(self, frame):
+        with self._lock:
+            self.last_seen = time.monotonic()
+            self.received += 1
+            if self._pending is not None:
+                self.dropped += 1
+            self._pending = frame
+            if self._busy:
+                return
+            self._busy = True
+        self.executor.submit(self._analyze_next)
+
+    def _analyze_next(self):
+        with self._lock:
+            frame, self._pending = self._pending, None
+            if frame is None or self.closed:
+                self._busy = False
+                return
+        try:
+            emotion, confidence, mood = self.analyze(frame)
+            self._observe(emotion, confidence)
+        except Exception as e:
+            print(f"Face stream {self.id} error: {e}")
+        with self._lock:
+            if self._pending is None or self.closed:
+                self._busy = False
+                return
+        self.executor.submit(self._analyze_next)
+
+    def _observe(self, emotion, confidence):
+        with self._lock:
+            self.processed += 1
+            self._window.append((emotion, confidence))
+            votes = defaultdict(float)
+            for e, c in self._window:
+                votes[e] += c
+            smoothed = max(votes, key=votes.get)
+            smoothed_conf = round(votes[smoothed] / len(self._window), 3)
+            changed = len(self._window) >= self.min_frames and smoothed != self.emotion
+            if changed:
+                self.emotion = smoothed
+            if smoothed == self.emotion:
+                self.confidence = smoothed_conf
+            self._publish('frame', {'emotion': emotion, 'confidence': confidence,
+                                    'smoothed': smoothed, 'smoothed_confidence': smoothed_conf})
+            if not changed:
+                return
+            self._change = (smoothed, smoothed_conf)
+            if self._changing:
+                return
+            self._changing = True
+        self.change_executor.submit(self._apply_change)
+
+    def _apply_change(self):
+        with self._lock:
+            change, self._change = self._change, None
+            if change is None or self.closed:
+                self._changing = False
+                return
+        try:
+            result = self.on_change(self, *change)
+            with self._lock:
+                self._publish('change', result)
+        except Exception as e:
+            print(f"Face stream {self.id} change error: {e}")
+        with self._lock:
+            if self._change is None or self.closed:
+                self._changing = False
+                return
+        self.change_executor.submit(self._apply_change)
+
+    def _publish(self, kind, data):
+        """Append an event; caller holds the lock."""
+        self._seq += 1
+        self._events.append((self._seq, kind, data))
+        self._cond.notify_all()
+
+    def events_since(self, seq, timeout):
+        """Block up to `timeout` for events newer than `seq`; returns a list of (seq, kind, data)."""
+        with self._cond:
+            if self._seq <= seq and not self.closed:
+                self._cond.wait(timeout)
+            return [ev for ev in self._events if ev[0] > seq]
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+            self._pending = None
+            self._cond.notify_all()
+
+    def status(self):
+        return {
+            'stream_id': self.id,
+            'received': self.received,
+            'processed': self.processed,
+            'dropped': self.dropped,
+            'emotion': self.emotion,
+            'confidence': self.confidence,
+        }
+
+
+class FaceStreamRegistry:
+    def __init__(self, workers=STREAM_WORKERS, idle_timeout=STREAM_IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self.workers = workers
+        self._streams = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self._change_executor = None
+
+    def _sweep(self):
+        """Close streams that stopped sending frames; caller holds the lock."""
+        now = time.monotonic()
+        for stream_id, stream in list(self._streams.items()):
+            if now - stream.last_seen > self.idle_timeout:
+                stream.close()
+                del self._streams[stream_id]
+
+    def create(self, user_id, analyze, on_change):
+        with self._lock:
+            self._sweep()
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                    thread_name_prefix='face-stream')
+                self._change_executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                           thread_name_prefix='face-stream-change')
+            stream = FaceStream(uuid.uuid4().hex, user_id, analyze, on_change,
+                                self._executor, self._change_executor)
+            self._streams[stream.id] = stream
+        return stream
+
+    def get(self, stream_id):
+        with self._lock:
+            self._sweep()
+            return self._streams.get(stream_id)
+
+    def close(self, stream_id):
+        with self._lock:
+            stream = self._streams.pop(stream_id, None)
+        if stream:
+            stream.close()
+        return stream
+
+    def __len__(self):
+        return len(self._streams)
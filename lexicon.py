@@ -0,0 +1,292 @@
+import os
+import json
+import time
+import threading
+from collections import Counter
+
+import numpy as np
+
+
+WORD_CACHE_SIZE = 50000
+
+
+class AhoCorasick:
+    """Multi-pattern substring matcher; find_all() returns the distinct patterns inside a string."""
+
+    def __init__(self, patterns):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [set()]
+        for pattern in patterns:
+            self._add(pattern)
+        self._build()
+
+    def _add(self, pattern):
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(set())
+            node = nxt
+        self._out[node].add(pattern)
+
+    def _build(self):
+        queue = list(self._goto[0].values())
+        for node in queue:
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] |= self._out[self._fail[nxt]]
+        self._out = [frozenset(o) for o in self._out]
+
+    def find_all(self, text):
+        found = set()
+        node = 0
+        goto, fail, out = self._goto, self._fail, self._out
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                found |= out[node]
+        return found
+
+
+class LexiconIndex:
+    """
+    Compiled form of EMOTION_KEYWORDS / SENTIMENT_KEYWORDS.
+
+    Scores are identical to the original nested loops: an exact keyword hit
+    is worth 2.0, otherwise every keyword that contains the word, or is
+    contained in it, is worth 0.5. Exact hits use frozensets, keywords inside
+    a word are found with an Aho-Corasick automaton, and words inside a
+    keyword are looked up in a table of every keyword substring.
+    `generation` numbers the indexes built by a LexiconStore.
+    """
+
+    def __init__(self, emotion_keywords, sentiment_keywords, emotions, generation=0):
+        self.generation = generation
+        self.emotions = list(emotions)
+        slots = {e: i for i, e in enumerate(self.emotions)}
+        n = len(self.emotions)
+
+        self.exact = [frozenset() for _ in range(n)]
+        counts = {}
+        containing = {}
+        for emotion, keywords in emotion_keywords.items():
+            i = slots[emotion]
+            self.exact[i] = frozenset(keywords)
+            for kw, count in Counter(keywords).items():
+                counts.setdefault(kw, [0] * n)[i] += count
+                substrings = {kw[a:b] for a in range(len(kw)) for b in range(a + 1, len(kw) + 1)}
+                for sub in substrings:
+                    containing.setdefault(sub, [0] * n)[i] += count
+        self.keyword_counts = {kw: tuple(c) for kw, c in counts.items()}
+        self.containing = {sub: tuple(c) for sub, c in containing.items()}
+        self.matcher = AhoCorasick(self.keyword_counts)
+
+        self.negation = frozenset(sentiment_keywords['negation']['words'])
+        self.intensity = frozenset(sentiment_keywords['intensity']['words'])
+        self.intensity_weight = sentiment_keywords['intensity']['weight']
+        self.polar = [(frozenset(sentiment_keywords[cat]['words']), sentiment_keywords[cat]['weight'])
+                      for cat in ['positive', 'negative']]
+
+        self._word_cache = {}
+
+    def word_scores(self, word):
+        """Per-emotion score contributed by one word, in `emotions` order."""
+        cached = self._word_cache.get(word)
+        if cached is not None:
+            return cached
+
+        n = len(self.emotions)
+        partial = list(self.containing.get(word, (0,) * n))
+        for kw in self.matcher.find_all(word):
+            for i, count in enumerate(self.keyword_counts[kw]):
+                partial[i] += count
+        scores = tuple(2.0 if word in self.exact[i] else 0.5 * partial[i] for i in range(n))
+
+        if len(self._word_cache) >= WORD_CACHE_SIZE:
+            self._word_cache.clear()
+        self._word_cache[word] = scores
+        return scores
+
+    def emotion_scores(self, words):
+        totals = [0.0] * len(self.emotions)
+        for word in words:
+            for i, score in enumerate(self.word_scores(word)):
+                totals[i] += score
+        return dict(zip(self.emotions, totals))
+
+    def batch_scores(self, docs, flag_words=frozenset()):
+        """
+        Score many tokenised documents at once.
+
+        Builds a sparse document x vocabulary count matrix and returns
+        (emotion_scores[n, emotions], polarity[n], flagged[n]) where `flagged`
+        marks documents containing any of `flag_words`. Values match
+        emotion_scores() and polarity() row for row.
+        """
+        n_docs = len(docs)
+        vocab = {}
+        lengths = np.fromiter((len(words) for words in docs), dtype=np.int64, count=n_docs)
+        tokens = np.fromiter((vocab.setdefault(w, len(vocab)) for words in docs for w in words),
+                             dtype=np.int64, count=int(lengths.sum()))
+        doc_ids = np.repeat(np.arange(n_docs), lengths)
+        words = list(vocab)
+        n_vocab = len(words)
+
+        scores = np.zeros((n_docs, len(self.emotions)))
+        polarity = np.zeros(n_docs)
+        flagged = np.zeros(n_docs, dtype=bool)
+        if not n_vocab:
+            return scores, polarity, flagged
+
+        # Emotion scores: (sparse doc x vocab counts) @ (vocab x emotion scores)
+        cells, counts = np.unique(doc_ids * n_vocab + tokens, return_counts=True)
+        word_matrix = np.array([self.word_scores(w) for w in words])
+        np.add.at(scores, cells // n_vocab, counts[:, None] * word_matrix[cells % n_vocab])
+
+        # Polarity: a sentiment word is negated/intensified when a negation/intensity
+        # word occurs after the previous sentiment word of the same document.
+        kind = np.zeros(n_vocab, dtype=np.int8)
+        first_weight = np.zeros(n_vocab)
+        rest_weight = np.zeros(n_vocab)
+        for v, word in enumerate(words):
+            if word in self.negation:
+                kind[v] = 1
+            elif word in self.intensity:
+                kind[v] = 2
+            else:
+                weights = [weight for cat_words, weight in self.polar if word in cat_words]
+                if weights:
+                    kind[v] = 3
+                    first_weight[v] = weights[0]
+                    rest_weight[v] = sum(weights[1:])
+        token_kind = kind[tokens]
+        idx = np.arange(len(tokens))
+        last_negation = np.maximum.accumulate(np.where(token_kind == 1, idx, -1))
+        last_intensity = np.maximum.accumulate(np.where(token_kind == 2, idx, -1))
+        last_sentiment = np.maximum.accumulate(np.where(token_kind == 3, idx, -1))
+        previous_sentiment = np.concatenate(([-1], last_sentiment[:-1]))
+        doc_starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        boundary = np.maximum(previous_sentiment, doc_starts[doc_ids] - 1)
+
+        sentiment = token_kind == 3
+        mult = np.where(last_intensity > boundary, self.intensity_weight, 1.0)
+        sign = np.where(last_negation > boundary, -1.0, 1.0)
+        token_scores = first_weight[tokens] * mult * sign + rest_weight[tokens]
+        polarity = np.bincount(doc_ids[sentiment], weights=token_scores[sentiment], minlength=n_docs)
+
+        if flag_words:
+            is_flag = np.fromiter((w in flag_words for w in words), dtype=bool, count=n_vocab)
+            flagged = np.bincount(doc_ids, weights=is_flag[tokens], minlength=n_docs) > 0
+        return scores, polarity, flagged
+
+    def polarity(self, words):
+        polarity = 0.0
+        intensity_mult = 1.0
+        negation_active = False
+
+        for word in words:
+            if word in self.negation:
+                negation_active = True
+                continue
+            if word in self.intensity:
+                intensity_mult = self.intensity_weight
+                continue
+            for cat_words, weight in self.polar:
+                if word in cat_words:
+                    score = weight * intensity_mult
+                    if negation_active:
+                        score *= -1
+                    polarity += score
+                    negation_active = False
+                    intensity_mult = 1.0
+        return polarity
+
+
+def load_lexicon_file(path):
+    """Read {"emotion_keywords": {...}, "sentiment_keywords": {...}} from a JSON file."""
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    return data.get('emotion_keywords'), data.get('sentiment_keywords')
+
+
+SENTIMENT_CATEGORIES = {'positive': ('words', 'weight'), 'negative': ('words', 'weight'),
+                        'negation': ('words',), 'intensity': ('words', 'weight')}
+
+
+def validate_lexicon(emotion_keywords, sentiment_keywords, emotions):
+    """Raise ValueError unless the keyword tables have the shape LexiconIndex expects."""
+    unknown = set(emotion_keywords) - set(emotions)
+    if unknown:
+        raise ValueError(f"unknown emotion(s) in emotion_keywords: {', '.join(sorted(unknown))}")
+    for category, fields in SENTIMENT_CATEGORIES.items():
+        entry = sentiment_keywords.get(category)
+        if not isinstance(entry, dict) or any(field not in entry for field in fields):
+            raise ValueError(f"sentiment_keywords['{category}'] needs {' and '.join(fields)}")
+
+
+class LexiconStore:
+    """
+    Holds the active LexiconIndex and hot-reloads it from `path`.
+
+    The file's mtime is checked at most every `check_interval` seconds; on
+    change a new index is compiled and swapped in. Keys missing from the
+    file fall back to the built-in lexicon. A file that cannot be read or
+    compiled is logged and skipped until it changes again; the previous
+    index keeps serving.
+    """
+
+    def __init__(self, emotion_keywords, sentiment_keywords, emotions, path=None, check_interval=5.0):
+        self.defaults = (emotion_keywords, sentiment_keywords)
+        self.emotions = emotions
+        self.path = path
+        self.check_interval = check_interval
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.index = LexiconIndex(emotion_keywords, sentiment_keywords, emotions)
+        if path:
+            self.reload()
+
+    def reload(self):
+        emotion_keywords, sentiment_keywords = self.defaults
+        mtime = None
+        if self.path and os.path.exists(self.path):
+            mtime = os.path.getmtime(self.path)
+        try:
+            if mtime is not None:
+                loaded_emotion, loaded_sentiment = load_lexicon_file(self.path)
+                emotion_keywords = loaded_emotion or emotion_keywords
+                sentiment_keywords = loaded_sentiment or sentiment_keywords
+            validate_lexicon(emotion_keywords, sentiment_keywords, self.emotions)
+            self.index = LexiconIndex(emotion_keywords, sentiment_keywords, self.emotions,
+                                      self.index.generation + 1)
+        except Exception as e:
+            print(f"Lexicon reload error: {e}")
+        self._mtime = mtime
+        return self.index
+
+    def get(self):
+        if self.path:
+            now = time.monotonic()
+            if now - self._checked_at >= self.check_interval:
+                self._checked_at = now
+                try:
+                    mtime = os.path.getmtime(self.path)
+                except OSError:
+                    mtime = None
+                if mtime != self._mtime:
+                    with self._lock:
+                        if mtime != self._mtime:
+                            self.reload()
+        return self.index
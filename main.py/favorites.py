@@ -0,0 +1,187 @@
+import os
+import errno
+import queue
+import random
+import shutil
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Linux ioctl that makes dst share src's blocks (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+
+class MusicLibrary:
+    """
+    Index of the songs in a folder.
+
+    The folder is scanned once; afterwards the index is only rebuilt when
+    the folder's mtime changes (files added, removed or renamed), checked at
+    most every `check_interval` seconds.
+    """
+
+    def __init__(self, folder, extensions=('.mp3',), check_interval=2.0):
+        self.folder = folder
+        self.extensions = tuple(extensions)
+        self.check_interval = check_interval
+        self._songs = {}
+        self._mtime = None
+        self._checked_at = 0.0
+        self.scans = 0
+
+    def _scan(self):
+        songs = {}
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if entry.name.endswith(self.extensions) and entry.is_file():
+                    songs[entry.name] = entry.path
+        self._songs = songs
+        self.scans += 1
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.check_interval:
+            return False
+        self._checked_at = now
+        try:
+            mtime = os.stat(self.folder).st_mtime_ns
+        except FileNotFoundError:
+            self._songs, self._mtime = {}, None
+            return False
+        if mtime == self._mtime and not force:
+            return False
+        self._mtime = mtime
+        self._scan()
+        return True
+
+    def pick(self):
+        """(name, path) of a random song, or None when the folder is empty."""
+        self.refresh()
+        if not self._songs:
+            return None
+        name = random.choice(list(self._songs))
+        return name, self._songs[name]
+
+
+class SmileDebouncer:
+    """
+    Turns per-frame smile detections into one event per smile episode.
+
+    An episode starts after `start_frames` consecutive smiling frames and
+    ends after `end_frames` consecutive frames without a smile; update()
+    returns True only on the frame an episode starts.
+    """
+
+    def __init__(self, start_frames=2, end_frames=15):
+        self.start_frames = start_frames
+        self.end_frames = end_frames
+        self.smiling = False
+        self._hits = 0
+        self._misses = 0
+        self.episodes = 0
+
+    def update(self, smiled):
+        if smiled:
+            self._hits += 1
+            self._misses = 0
+        else:
+            self._misses += 1
+            self._hits = 0
+
+        if not self.smiling and self._hits >= self.start_frames:
+            self.smiling = True
+            self.episodes += 1
+            return True
+        if self.smiling and self._misses >= self.end_frames:
+            self.smiling = False
+        return False
+
+
+def reflink(src, dest):
+    """Copy-on-write clone of src at dest; raises OSError where unsupported."""
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, 'reflink not supported on this platform')
+    with open(src, 'rb') as s, open(dest, 'wb') as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        except OSError:
+            d.close()
+            os.unlink(dest)
+            raise
+
+
+class FavoriteWorker:
+    """
+    Saves favorites on a background thread so the capture loop never waits on disk.
+
+    Each request picks a random song from the library and puts it in
+    `folder` as a hardlink, else a reflink, else a full copy. Songs already
+    in favorites are skipped. Requests beyond `max_pending` are dropped.
+    """
+
+    def __init__(self, library, folder, max_pending=8):
+        self.library = library
+        self.folder = folder
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self.counts = {'linked': 0, 'reflinked': 0, 'copied': 0, 'skipped': 0, 'dropped': 0, 'errors': 0}
+
+    def start(self):
+        if self._thread is None:
+            os.makedirs(self.folder, exist_ok=True)
+            self._thread = threading.Thread(target=self._run, name='favorites', daemon=True)
+            self._thread.start()
+
+    def submit(self):
+        """Queue one favorite; never blocks."""
+        self.start()
+        try:
+            self._queue.put_nowait(True)
+        except queue.Full:
+            self.counts['dropped'] += 1
+
+    def _run(self):
+        while self._queue.get():
+            try:
+                self._save()
+            except OSError as e:
+                self.counts['errors'] += 1
+                print(f"Favorite error: {e}")
+
+    def _save(self):
+        picked = self.library.pick()
+        if picked is None:
+            return
+        song, src = picked
+        dest = os.path.join(self.folder, song)
+        if os.path.exists(dest):
+            self.counts['skipped'] += 1
+            return
+
+        try:
+            os.link(src, dest)
+            self.counts['linked'] += 1
+            how = 'Linked'
+        except OSError:
+            try:
+                reflink(src, dest)
+                self.counts['reflinked'] += 1
+                how = 'Cloned'
+            except OSError:
+                tmp = dest + '.part'
+                shutil.copyfile(src, tmp)
+                os.replace(tmp, dest)
+                self.counts['copied'] += 1
+                how = 'Copied'
+        print(f"😊 {how} '{song}' to Favorites")
+
+    def close(self, timeout=5):
+        """Finish queued favorites and stop the thread."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
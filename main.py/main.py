@@ -1,59 +1,170 @@
 import cv2
 import os
-import shutil
-import random
+import time
+import argparse
 
-# Load Haar cascades
-face_cascade = cv2.CascadeClassifier('haarcascade_frontalface_default.xml')
-smile_cascade = cv2.CascadeClassifier('haarcascade_smile.xml')
+from tracking import StageTimer, SmileDetector
+from pipeline import Pipeline
+from favorites import MusicLibrary, SmileDebouncer, FavoriteWorker
 
 # Paths
 music_folder = 'music'
 favorites_folder = 'favorites'
 
-# Create favorites folder if it doesn't exist
-if not os.path.exists(favorites_folder):
-    os.makedirs(favorites_folder)
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
-# Start video capture
-cap = cv2.VideoCapture(0)
 
-while True:
-    ret, frame = cap.read()
-    if not ret:
-        break
+def load_cascade(filename):
+    """Cascade from the working directory, falling back to the copy at the repo root."""
+    path = filename if os.path.exists(filename) else os.path.join(REPO_DIR, filename)
+    cascade = cv2.CascadeClassifier(path)
+    if cascade.empty():
+        raise SystemExit(f"Could not load {filename}")
+    return cascade
 
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
 
-    faces = face_cascade.detectMultiScale(gray, 1.3, 5)
+def parse_args():
+    parser = argparse.ArgumentParser(description='Rooha smile detection')
+    parser.add_argument('--source', default='0',
+                        help='camera index or path to a recorded video (default: 0)')
+    parser.add_argument('--headless', action='store_true',
+                        help='no preview window; for benchmarking on recorded video')
+    parser.add_argument('--detect-every', type=int, default=10,
+                        help='run full face detection every N frames, track in between (default: 10)')
+    parser.add_argument('--detect-scale', type=float, default=0.5,
+                        help='downscale factor for full-frame detection (default: 0.5)')
+    parser.add_argument('--track-threshold', type=float, default=0.6,
+                        help='template match score below which a face counts as lost (default: 0.6)')
+    parser.add_argument('--no-tracking', action='store_true',
+                        help='detect on every full-size frame (the original behaviour)')
+    parser.add_argument('--smile-frames', type=int, default=2,
+                        help='consecutive smiling frames that start a smile (default: 2)')
+    parser.add_argument('--release-frames', type=int, default=15,
+                        help='consecutive frames without a smile that end it (default: 15)')
+    parser.add_argument('--sequential', action='store_true',
+                        help='capture, detect and display in one loop instead of separate threads')
+    parser.add_argument('--no-pace', action='store_true',
+                        help='read recorded videos as fast as possible instead of at their frame rate')
+    parser.add_argument('--max-frames', type=int, default=0, help='stop after N frames (0: no limit)')
+    parser.add_argument('--report-every', type=float, default=5.0,
+                        help='print fps and stage timings every N seconds (0: only at exit)')
+    return parser.parse_args()
 
-    for (x, y, w, h) in faces:
-        roi_gray = gray[y:y+h, x:x+w]
-        roi_color = frame[y:y+h, x:x+w]
 
+def draw(frame, faces, smiles, fps):
+    for (x, y, w, h) in faces:
         # Draw rectangle around face
         cv2.rectangle(frame, (x, y), (x+w, y+h), (255, 0, 0), 2)
-
-        smiles = smile_cascade.detectMultiScale(roi_gray, 1.8, 20)
-
+    if smiles:
         for (sx, sy, sw, sh) in smiles:
-            cv2.rectangle(roi_color, (sx, sy), (sx+sw, sy+sh), (0, 255, 0), 2)
-            cv2.putText(frame, "Smile Detected!", (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0,255,0), 2)
-
-            # Pick a random song
-            songs = [f for f in os.listdir(music_folder) if f.endswith('.mp3')]
-            if songs:
-                song = random.choice(songs)
-                src = os.path.join(music_folder, song)
-                dest = os.path.join(favorites_folder, song)
-                shutil.copy(src, dest)
-                print(f"😊 Copied '{song}' to Favorites")
-            break  # Only once per smile
+            cv2.rectangle(frame, (sx, sy), (sx+sw, sy+sh), (0, 255, 0), 2)
+        cv2.putText(frame, "Smile Detected!", (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0,255,0), 2)
+    cv2.putText(frame, f"{fps:.1f} fps", (10, frame.shape[0] - 10),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
 
+
+def show(frame):
+    """Display a frame; False when the user pressed q."""
     cv2.imshow('Rooha - Smile Detection', frame)
+    return cv2.waitKey(1) & 0xFF != ord('q')
+
+
+def run_sequential(args, cap, detector, on_result):
+    """Capture, detection and display one after another on this thread."""
+    timer = detector.timer
+    last_report = timer.started
+
+    while True:
+        with timer.stage('capture'):
+            ret, frame = cap.read()
+        if not ret:
+            break
+
+        with timer.stage('gray'):
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        faces, smiles = detector.process(gray)
+        on_result(faces, smiles)
+
+        with timer.stage('draw'):
+            draw(frame, faces, smiles, timer.fps())
+
+        now = time.perf_counter()
+        if args.report_every and now - last_report >= args.report_every:
+            print(timer.report())
+            last_report = now
+
+        if args.max_frames and timer.frames >= args.max_frames:
+            break
+        if not args.headless and not show(frame):
+            break
+
+    print(timer.report())
+
+
+def run_pipeline(args, cap, detector, on_result):
+    """Capture and detection on their own threads; display on this one."""
+    fps = 0
+    if not args.source.isdigit() and not args.no_pace:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    pipeline = Pipeline(cap, detector, on_result, fps=fps)
+    display = pipeline.stats['display']
+    last_report = time.perf_counter()
+    pipeline.start()
+
+    for frame, faces, smiles in pipeline.frames_for_display():
+        draw(frame, faces, smiles, display.count / max(time.perf_counter() - display.started, 1e-6))
+
+        now = time.perf_counter()
+        if args.report_every and now - last_report >= args.report_every:
+            print(pipeline.report())
+            last_report = now
+
+        if args.max_frames and display.count >= args.max_frames:
+            break
+        if not args.headless and not show(frame):
+            break
+
+    pipeline.stop()
+    print(pipeline.report())
+    print(detector.timer.report())
+
+
+def main():
+    args = parse_args()
+
+    # Load Haar cascades
+    face_cascade = load_cascade('haarcascade_frontalface_default.xml')
+    smile_cascade = load_cascade('haarcascade_smile.xml')
+
+    # Favorites are saved on a background thread, once per smile
+    favorites = FavoriteWorker(MusicLibrary(music_folder), favorites_folder)
+    favorites.start()
+    debouncer = SmileDebouncer(args.smile_frames, args.release_frames)
+
+    def on_result(faces, smiles):
+        if debouncer.update(bool(smiles)):
+            favorites.submit()
+
+    detector = SmileDetector(
+        face_cascade, smile_cascade,
+        detect_every=1 if args.no_tracking else args.detect_every,
+        detect_scale=1.0 if args.no_tracking else args.detect_scale,
+        track_threshold=args.track_threshold, timer=StageTimer())
+
+    # Start video capture
+    cap = cv2.VideoCapture(int(args.source) if args.source.isdigit() else args.source)
+
+    if args.sequential:
+        run_sequential(args, cap, detector, on_result)
+    else:
+        run_pipeline(args, cap, detector, on_result)
+
+    cap.release()
+    if not args.headless:
+        cv2.destroyAllWindows()
+    favorites.close()
+    print(f"{debouncer.episodes} smiles | favorites: {favorites.counts}")
 
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        break
 
-cap.release()
-cv2.destroyAllWindows()
+if __name__ == '__main__':
+    main()
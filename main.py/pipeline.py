@@ -0,0 +1,171 @@
+import threading
+import time
+
+import cv2
+
+
+class LatestSlot:
+    """
+    Holds only the newest item. put() replaces whatever is there, so a slow
+    reader skips stale items instead of working through a backlog.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._item = None
+        self._seq = 0
+        self.closed = False
+
+    def put(self, item):
+        with self._cond:
+            self._item = item
+            self._seq += 1
+            self._cond.notify_all()
+
+    def get(self, after=0, timeout=None):
+        """Wait for an item newer than sequence number `after`; returns (seq, item), item None on timeout/close."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > after or self.closed, timeout)
+            if self._seq > after:
+                return self._seq, self._item
+            return after, None
+
+    def latest(self):
+        with self._cond:
+            return self._item
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class StageStats:
+    """Throughput of one pipeline stage and latency since frame capture."""
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def record(self, captured_at):
+        latency = time.perf_counter() - captured_at
+        with self._lock:
+            self.count += 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+
+    def report(self):
+        with self._lock:
+            count, total, worst = self.count, self.latency_total, self.latency_max
+        elapsed = time.perf_counter() - self.started
+        fps = count / elapsed if elapsed > 0 else 0.0
+        avg = total / count * 1000 if count else 0.0
+        return f'{self.name} {count} @ {fps:.1f} fps, latency {avg:.1f}ms avg / {worst * 1000:.1f}ms max'
+
+
+def capture_loop(cap, frames, stats, stop, fps=0):
+    """
+    Read frames as fast as the source delivers them into `frames`. `fps`
+    paces recorded videos like a live camera; 0 reads without pausing.
+    """
+    interval = 1.0 / fps if fps else 0
+    next_at = time.perf_counter()
+    try:
+        while not stop.is_set():
+            ret, frame = cap.read()
+            if not ret:
+                break
+            captured_at = time.perf_counter()
+            frames.put((frame, captured_at))
+            stats.record(captured_at)
+            if interval:
+                next_at += interval
+                time.sleep(max(next_at - time.perf_counter(), 0))
+    finally:
+        frames.close()
+
+
+def detect_loop(frames, results, detector, stats, on_result=None):
+    """Run `detector` on the newest captured frame, skipping frames that arrived meanwhile."""
+    seq = 0
+    try:
+        while True:
+            seq, item = frames.get(seq)
+            if item is None:
+                break
+            frame, captured_at = item
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            faces, smiles = detector.process(gray)
+            if on_result is not None:
+                on_result(faces, smiles)
+            results.put((faces, smiles, captured_at))
+            stats.record(captured_at)
+    finally:
+        results.close()
+
+
+class Pipeline:
+    """
+    Capture, detection and display on separate stages.
+
+    The capture thread keeps only the latest frame; the detection thread
+    always works on the newest one; the display stage (the caller's thread,
+    since HighGUI windows belong to the main thread) draws the latest
+    results over the latest frame. Latency is then bounded by detection
+    time, with no driver-buffer backlog on top.
+    """
+
+    def __init__(self, cap, detector, on_result=None, fps=0):
+        self.cap = cap
+        self.detector = detector
+        self.on_result = on_result
+        self.fps = fps
+        self.frames = LatestSlot()
+        self.results = LatestSlot()
+        self.stop_event = threading.Event()
+        self.stats = {name: StageStats(name) for name in ('capture', 'detect', 'display')}
+        self._threads = []
+
+    def start(self):
+        self._threads = [
+            threading.Thread(target=capture_loop, name='capture', daemon=True,
+                             args=(self.cap, self.frames, self.stats['capture'], self.stop_event, self.fps)),
+            threading.Thread(target=detect_loop, name='detect', daemon=True,
+                             args=(self.frames, self.results, self.detector, self.stats['detect'],
+                                   self.on_result)),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def frames_for_display(self, timeout=0.5):
+        """
+        Yield (frame, faces, smiles) for the display stage until capture ends
+        and the detector has caught up. The frame is a copy, safe to draw on.
+        """
+        seq = 0
+        while not self.stop_event.is_set():
+            seq, item = self.frames.get(seq, timeout)
+            if item is None:
+                if self.frames.closed:
+                    break
+                continue
+            frame, captured_at = item
+            faces, smiles, _ = self.results.latest() or ([], [], captured_at)
+            yield frame.copy(), faces, smiles
+            self.stats['display'].record(captured_at)
+        self.stop()
+
+    def stop(self):
+        self.stop_event.set()
+        for thread in self._threads:
+            thread.join(2)
+
+    def report(self):
+        captured, detected = self.stats['capture'].count, self.stats['detect'].count
+        lines = [s.report() for s in self.stats.values()]
+        lines.append(f'skipped by detection: {max(captured - detected, 0)} frames')
+        return ' | '.join(lines)
@@ -0,0 +1,145 @@
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import cv2
+
+
+class StageTimer:
+    """Per-stage wall time and overall frame rate for the smile detection loop."""
+
+    def __init__(self):
+        self.totals = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.frames = 0
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.totals[name] += time.perf_counter() - start
+            self.counts[name] += 1
+
+    def frame_done(self):
+        self.frames += 1
+
+    def fps(self):
+        elapsed = time.perf_counter() - self.started
+        return self.frames / elapsed if elapsed > 0 else 0.0
+
+    def report(self):
+        stages = ', '.join(f'{name} {self.totals[name] / self.counts[name] * 1000:.1f}ms x{self.counts[name]}'
+                           for name in self.totals)
+        return f'{self.frames} frames, {self.fps():.1f} fps | {stages}'
+
+
+def detect_faces(gray, cascade, scale=0.5, min_size=48):
+    """Full-frame face detection on a downscaled copy; boxes are returned in full-frame coordinates."""
+    if scale != 1.0:
+        small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    else:
+        small = gray
+    min_side = max(int(min_size * scale), 12)
+    faces = cascade.detectMultiScale(small, 1.3, 5, minSize=(min_side, min_side))
+    return [tuple(int(v / scale) for v in face) for face in faces]
+
+
+def detect_smiles(gray, box, cascade):
+    """Smiles inside the lower half of a face box, in full-frame coordinates."""
+    x, y, w, h = box
+    top = y + h // 2
+    roi = gray[top:y + h, x:x + w]
+    if roi.size == 0:
+        return []
+    smiles = cascade.detectMultiScale(roi, 1.8, 20)
+    return [(x + sx, top + sy, sw, sh) for sx, sy, sw, sh in smiles]
+
+
+class FaceTracker:
+    """
+    Follows faces between detections by template matching.
+
+    Each face keeps a grayscale template of its last box; on every frame
+    the template is matched inside a search window around the previous
+    position (cv2.matchTemplate, normalised cross-correlation). When the
+    best match for any face drops below `threshold` that face is dropped,
+    `lost` is set and the caller should run full detection again.
+    """
+
+    def __init__(self, threshold=0.6, search_margin=0.5):
+        self.threshold = threshold
+        self.search_margin = search_margin
+        self.boxes = []
+        self.scores = []
+        self._templates = []
+        self.lost = False
+
+    def reset(self, gray, boxes):
+        self.boxes = [tuple(box) for box in boxes]
+        self.scores = [1.0] * len(self.boxes)
+        self._templates = [gray[y:y + h, x:x + w].copy() for x, y, w, h in self.boxes]
+        self.lost = False
+
+    def update(self, gray):
+        frame_h, frame_w = gray.shape[:2]
+        boxes, scores, templates = [], [], []
+        for (x, y, w, h), template in zip(self.boxes, self._templates):
+            mx, my = int(w * self.search_margin), int(h * self.search_margin)
+            x0, y0 = max(x - mx, 0), max(y - my, 0)
+            x1, y1 = min(x + w + mx, frame_w), min(y + h + my, frame_h)
+            window = gray[y0:y1, x0:x1]
+            if window.shape[0] < h or window.shape[1] < w:
+                continue
+            result = cv2.matchTemplate(window, template, cv2.TM_CCOEFF_NORMED)
+            _, score, _, (bx, by) = cv2.minMaxLoc(result)
+            if score < self.threshold:
+                continue
+            box = (x0 + bx, y0 + by, w, h)
+            boxes.append(box)
+            scores.append(score)
+            templates.append(gray[box[1]:box[1] + h, box[0]:box[0] + w].copy())
+
+        self.lost = len(boxes) < len(self.boxes)
+        self.boxes, self.scores, self._templates = boxes, scores, templates
+        return self.boxes
+
+
+class SmileDetector:
+    """
+    Per-frame face and smile detection: full detection on a downscaled frame
+    every `detect_every` frames or when tracking loses a face, template
+    tracking in between, smile search in the lower half of each face.
+    Stage timings go to `timer`.
+    """
+
+    def __init__(self, face_cascade, smile_cascade, detect_every=10, detect_scale=0.5,
+                 track_threshold=0.6, timer=None):
+        self.face_cascade = face_cascade
+        self.smile_cascade = smile_cascade
+        self.detect_every = max(detect_every, 1)
+        self.detect_scale = detect_scale
+        self.tracker = FaceTracker(threshold=track_threshold)
+        self.timer = timer or StageTimer()
+        self.frame_no = 0
+
+    def process(self, gray):
+        """(faces, smiles) for one grayscale frame; smiles are those of the first smiling face."""
+        if self.frame_no % self.detect_every == 0 or self.tracker.lost:
+            with self.timer.stage('detect'):
+                faces = detect_faces(gray, self.face_cascade, self.detect_scale)
+                self.tracker.reset(gray, faces)
+        else:
+            with self.timer.stage('track'):
+                faces = self.tracker.update(gray)
+        self.frame_no += 1
+        self.timer.frame_done()
+
+        with self.timer.stage('smile'):
+            for box in faces:
+                smiles = detect_smiles(gray, box, self.smile_cascade)
+                if smiles:
+                    return faces, smiles
+        return faces, []
@@ -0,0 +1,180 @@
+"""
+Low-overhead latency histograms and counters, exported as Prometheus text.
+
+Stages are timed with `timer(stage)` (two perf_counter calls and one
+locked bucket increment). Timings and counted events also go to the
+current request's collector when one is active, which feeds the optional
+Server-Timing header; the collector travels with contextvars, so work handed to an
+executor through `contextvars.copy_context()` is attributed to the request
+that started it. Numbers are per process.
+"""
+import os
+import time
+import threading
+import contextvars
+from bisect import bisect_left
+from contextlib import contextmanager
+
+
+METRICS_SERVER_TIMING = os.environ.get('METRICS_SERVER_TIMING', '0') == '1'
+
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_request_stages = contextvars.ContextVar('request_stages', default=None)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'sum', 'count')
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+class Registry:
+    """Stage histograms, event counters and callbacks that report gauges/counters kept elsewhere."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self._collectors = []
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            hist = self.histograms.get(stage)
+            if hist is None:
+                hist = self.histograms[stage] = Histogram()
+            hist.buckets[bisect_left(BUCKETS, seconds)] += 1
+            hist.sum += seconds
+            hist.count += 1
+
+    def count(self, event, amount=1):
+        with self._lock:
+            self.counters[event] = self.counters.get(event, 0) + amount
+
+    def reset(self):
+        """Drop recorded histograms and counters, e.g. in a worker forked after warm-up."""
+        with self._lock:
+            self.histograms = {}
+            self.counters = {}
+
+    def register(self, collector):
+        """
+        `collector()` returns or yields (name, type, help, {labels: value})
+        tuples, read at scrape time; labels are ((label, value), ...).
+        """
+        self._collectors.append(collector)
+
+    def snapshot(self):
+        with self._lock:
+            histograms = {stage: (list(h.buckets), h.sum, h.count) for stage, h in self.histograms.items()}
+            counters = dict(self.counters)
+        return histograms, counters
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        histograms, counters = self.snapshot()
+        lines = ['# HELP rooha_stage_seconds Time spent per processing stage.',
+                 '# TYPE rooha_stage_seconds histogram']
+        for stage in sorted(histograms):
+            buckets, total, count = histograms[stage]
+            cumulative = 0
+            for bound, n in zip(BUCKETS, buckets):
+                cumulative += n
+                lines.append(f'rooha_stage_seconds_bucket{{stage="{stage}",le="{bound:g}"}} {cumulative}')
+            lines.append(f'rooha_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'rooha_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'rooha_stage_seconds_count{{stage="{stage}"}} {count}')
+
+        lines += ['# HELP rooha_events_total Cache hits, fallbacks and errors.',
+                  '# TYPE rooha_events_total counter']
+        lines += [f'rooha_events_total{{event="{event}"}} {counters[event]}' for event in sorted(counters)]
+
+        for collector in self._collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                print(f"Metrics collector error: {e}")
+                continue
+            for name, kind, help_text, samples in families:
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+                for labels, value in samples.items():
+                    label_text = ','.join(f'{k}="{v}"' for k, v in labels)
+                    lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+observe = registry.observe
+register = registry.register
+reset = registry.reset
+render = registry.render
+
+
+def record(stage, seconds):
+    """Observe a stage timed elsewhere (e.g. in a worker process) and add it to the current request."""
+    registry.observe(stage, seconds)
+    stages = _request_stages.get()
+    if stages is not None:
+        stages.append((stage, seconds))
+
+
+def count(event, amount=1):
+    """Count an event; the current request also lists it in its Server-Timing header."""
+    registry.count(event, amount)
+    stages = _request_stages.get()
+    if stages is not None:
+        stages.append((event, None))
+
+
+class timer:
+    """`with timer(stage):` records the block's wall time (a plain class: cheaper than a generator context manager)."""
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.stage, time.perf_counter() - self.start)
+
+
+@contextmanager
+def collect():
+    """
+    Capture the stages timed inside the block as a [(stage, seconds)] list,
+    e.g. to ship them to a parent process; counted events have seconds None.
+    """
+    stages = []
+    token = _request_stages.set(stages)
+    try:
+        yield stages
+    finally:
+        _request_stages.reset(token)
+
+
+def begin_request():
+    _request_stages.set([])
+
+
+def server_timing():
+    """Server-Timing header value for the current request's stages ('' when none), and end its collection."""
+    stages = _request_stages.get()
+    _request_stages.set(None)
+    if not stages:
+        return ''
+    totals, calls = {}, {}
+    for stage, seconds in stages:
+        totals[stage] = seconds if seconds is None else (totals.get(stage) or 0.0) + seconds
+        calls[stage] = calls.get(stage, 0) + 1
+    # stages that ran several times (possibly in parallel) report their summed time and call count;
+    # counted events (fallbacks, errors) have no duration
+    return ', '.join(stage + (f';dur={seconds * 1000:.2f}' if seconds is not None else '')
+                     + (f';desc="x{calls[stage]}"' if calls[stage] > 1 else '')
+                     for stage, seconds in totals.items())
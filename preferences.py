@@ -0,0 +1,324 @@
+"""
+Per-user taste learned from /api/feedback ratings.
+
+Each user has a weight per genre and, per emotion, a valence/energy offset
+from the centre of that emotion's mood box. A rating moves only the genres
+and the one emotion of the rated session, so an update is O(1) no matter
+how long the user's history is. State lives in memory (LRU of users) and
+is persisted as additive deltas to two small tables through the session
+writer, so several processes can learn into the same database. Each
+process reloads a cached user after PREFERENCE_RELOAD_SECONDS, so what
+another worker learned shows up after at most that long. Only the owner
+of a session can rate it into their model.
+"""
+import os
+import math
+import time
+import random
+import threading
+from collections import OrderedDict
+
+import tracks as track_store
+
+
+PREFERENCE_USERS = int(os.environ.get('PREFERENCE_USERS', '10000'))
+PREFERENCE_SESSIONS = int(os.environ.get('PREFERENCE_SESSIONS', '5000'))
+PREFERENCE_LEARNING_RATE = float(os.environ.get('PREFERENCE_LEARNING_RATE', '0.2'))
+PREFERENCE_RELOAD_SECONDS = float(os.environ.get('PREFERENCE_RELOAD_SECONDS', '30'))
+GENRE_WEIGHT_LIMIT = 3.0
+MOOD_OFFSET_LIMIT = 0.3
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS preference_genres (
+        user_id INTEGER NOT NULL,
+        genre TEXT NOT NULL,
+        weight REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, genre)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS preference_moods (
+        user_id INTEGER NOT NULL,
+        emotion TEXT NOT NULL,
+        valence REAL NOT NULL DEFAULT 0,
+        energy REAL NOT NULL DEFAULT 0,
+        ratings INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, emotion)
+    ) WITHOUT ROWID;
+'''
+
+
+def rating_signal(rating):
+    """1-5 star rating centred on 3 and scaled to -1..1; None if it is not a rating."""
+    try:
+        rating = float(rating)
+    except (TypeError, ValueError):
+        return None
+    if not 1 <= rating <= 5:
+        return None
+    return (rating - 3) / 2
+
+
+def _clamp(value, limit):
+    return max(-limit, min(limit, value))
+
+
+def summarize(user_id, emotion, tracks):
+    """
+    What a rating of this session teaches: the share of each genre among its
+    tracks and their mean valence/energy (None when no track has features).
+    A track's genre is the one it was searched under for this session; read
+    back from the database it comes from session_tracks.genre.
+    """
+    genres = {}
+    valence, energy = [], []
+    for track in tracks:
+        if track.get('genre'):
+            genres[track['genre']] = genres.get(track['genre'], 0) + 1
+        if track.get('valence') is not None and track.get('energy') is not None:
+            valence.append(track['valence'])
+            energy.append(track['energy'])
+    total = sum(genres.values())
+    features = (sum(valence) / len(valence), sum(energy) / len(energy)) if valence else None
+    return {
+        'user_id': user_id,
+        'emotion': emotion,
+        'genres': {g: n / total for g, n in genres.items()},
+        'features': features,
+        'signal': None,
+    }
+
+
+def apply_rating(prefs, summary, signal, mood_map, learning_rate=PREFERENCE_LEARNING_RATE):
+    """
+    Update `prefs` in place from one rated session summary; returns the
+    deltas actually applied: ({genre: weight delta}, (valence, energy, ratings)
+    delta or None).
+    """
+    rerated = summary['signal'] is not None
+    step = learning_rate * (signal - (summary['signal'] or 0.0))
+    summary['signal'] = signal
+    genre_deltas = {}
+    for genre, share in summary['genres'].items():
+        old = prefs.genres.get(genre, 0.0)
+        prefs.genres[genre] = _clamp(old + step * share, GENRE_WEIGHT_LIMIT)
+        genre_deltas[genre] = prefs.genres[genre] - old
+
+    mood_delta = None
+    if summary['features'] is not None and summary['emotion'] in mood_map:
+        mood_config = mood_map[summary['emotion']]
+        centre = (sum(mood_config['valence']) / 2, sum(mood_config['energy']) / 2)
+        mood = prefs.moods.setdefault(summary['emotion'], [0.0, 0.0, 0])
+        old = mood[:2]
+        # pull the offset towards what was rated well, push it away from what was not
+        for axis in (0, 1):
+            target = summary['features'][axis] - centre[axis]
+            mood[axis] = _clamp(mood[axis] + step * (target - mood[axis]), MOOD_OFFSET_LIMIT)
+        mood[2] += 0 if rerated else 1
+        mood_delta = (mood[0] - old[0], mood[1] - old[1], 0 if rerated else 1)
+    return genre_deltas, mood_delta
+
+
+class UserPreferences:
+    __slots__ = ('genres', 'moods')
+
+    def __init__(self):
+        self.genres = {}
+        self.moods = {}
+
+    def offset(self, emotion):
+        """(valence, energy) shift of the emotion's target, (0, 0) until rated."""
+        mood = self.moods.get(emotion)
+        return (mood[0], mood[1]) if mood else (0.0, 0.0)
+
+    def score(self, track, emotion, mood_config):
+        """Higher is better: genre weight minus distance from the user's target, in box half-widths."""
+        score = self.genres.get(track.get('genre'), 0.0)
+        if emotion in self.moods and track.get('valence') is not None and track.get('energy') is not None:
+            (v_lo, v_hi), (e_lo, e_hi) = mood_config['valence'], mood_config['energy']
+            dv, de = self.offset(emotion)
+            v_half, e_half = max((v_hi - v_lo) / 2, 1e-6), max((e_hi - e_lo) / 2, 1e-6)
+            score -= math.hypot((track['valence'] - (v_lo + v_hi) / 2 - dv) / v_half,
+                                (track['energy'] - (e_lo + e_hi) / 2 - de) / e_half)
+        return score
+
+    def pick_genre(self, genres):
+        """A genre drawn with probability proportional to exp(weight)."""
+        return random.choices(genres, [math.exp(self.genres.get(g, 0.0)) for g in genres])[0]
+
+    def rank(self, tracks, emotion, mood_config, limit):
+        """
+        Up to `limit` tracks, sampled without replacement with probability
+        proportional to exp(score) (Efraimidis-Spirakis keys), best first.
+        Unrated users get a uniform sample, as before.
+        """
+        keyed = [(math.log(1.0 - random.random()) / math.exp(self.score(t, emotion, mood_config)), i)
+                 for i, t in enumerate(tracks)]
+        keyed.sort(reverse=True)
+        return [tracks[i] for _, i in keyed[:limit]]
+
+
+class PreferenceStore:
+    """
+    In-memory preference state for recently active users, loaded on first
+    use with one primary-key lookup per table, plus a bounded map of recent
+    sessions so feedback can be applied without reading the session back.
+    """
+
+    def __init__(self, database, writer, mood_map, max_users=PREFERENCE_USERS, max_sessions=PREFERENCE_SESSIONS,
+                 learning_rate=PREFERENCE_LEARNING_RATE, reload_after=PREFERENCE_RELOAD_SECONDS):
+        self.database = database
+        self.writer = writer
+        self.mood_map = mood_map
+        self.max_users = max_users
+        self.max_sessions = max_sessions
+        self.learning_rate = learning_rate
+        self.reload_after = reload_after
+        self._users = OrderedDict()
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.updates = 0
+        self.ignored = 0
+
+    def _load(self, user_id):
+        conn = self.database.connection()
+        prefs = UserPreferences()
+        for genre, weight in conn.execute(
+                'SELECT genre, weight FROM preference_genres WHERE user_id = ?', (user_id,)):
+            prefs.genres[genre] = weight
+        for emotion, valence, energy, ratings in conn.execute(
+                'SELECT emotion, valence, energy, ratings FROM preference_moods WHERE user_id = ?', (user_id,)):
+            prefs.moods[emotion] = [valence, energy, ratings]
+        self.loads += 1
+        return prefs
+
+    def get(self, user_id):
+        """UserPreferences for a logged-in user; None for anonymous requests."""
+        if user_id is None:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            cached = self._users.get(user_id)
+            if cached is not None and now - cached[1] < self.reload_after:
+                self._users.move_to_end(user_id)
+                return cached[0]
+        prefs = self._load(user_id)
+        with self._lock:
+            current = self._users.get(user_id)
+            if current is not None and current[1] >= now:
+                return current[0]
+            self._users[user_id] = (prefs, now)
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        return prefs
+
+    def remember_session(self, session_id, user_id, emotion, tracks):
+        if user_id is None:
+            return
+        summary = summarize(user_id, emotion, tracks)
+        with self._lock:
+            self._sessions[session_id] = summary
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def _read_session(self, session_id):
+        """Summary for a session that is no longer (or never was) in memory, e.g. written by another process."""
+        conn = self.database.connection()
+        row = conn.execute('SELECT id, user_id, detected_emotion, tracks_json FROM sessions WHERE id = ?',
+                           (session_id,)).fetchone()
+        if row is None or row['user_id'] is None:
+            return None
+        return summarize(row['user_id'], row['detected_emotion'], track_store.session_tracks(conn, row))
+
+    def _summary(self, session_id):
+        try:
+            session_id = int(session_id)
+        except (TypeError, ValueError):
+            return None
+        with self._lock:
+            summary = self._sessions.get(session_id)
+        if summary is None:
+            summary = self._read_session(session_id)
+            if summary is not None:
+                with self._lock:
+                    summary = self._sessions.setdefault(session_id, summary)
+        return summary
+
+    def session_owner(self, session_id):
+        """user_id of a logged-in user's session; None for anonymous or unknown sessions."""
+        summary = self._summary(session_id)
+        return summary['user_id'] if summary is not None else None
+
+    def record_feedback(self, session_id, rating, user_id):
+        """
+        Learn from `user_id`'s rating of one of their own sessions. Rating
+        the same session again replaces the earlier rating rather than
+        adding to it. Returns True if anything changed.
+        """
+        signal = rating_signal(rating)
+        summary = self._summary(session_id) if signal is not None and user_id is not None else None
+        if summary is None or summary['user_id'] != user_id:
+            self.ignored += 1
+            return False
+
+        prefs = self.get(summary['user_id'])
+        with self._lock:
+            genre_deltas, mood_delta = apply_rating(prefs, summary, signal, self.mood_map, self.learning_rate)
+            self.updates += 1
+
+        self._persist(summary['user_id'], summary['emotion'], genre_deltas, mood_delta)
+        return True
+
+    def _persist(self, user_id, emotion, genre_deltas, mood_delta):
+        genre_rows = [(user_id, genre, delta) for genre, delta in genre_deltas.items() if delta]
+
+        def write(conn):
+            conn.executemany(
+                'INSERT INTO preference_genres (user_id, genre, weight) VALUES (?,?,?) '
+                'ON CONFLICT(user_id, genre) DO UPDATE SET weight = weight + excluded.weight', genre_rows)
+            if mood_delta is not None:
+                conn.execute(
+                    'INSERT INTO preference_moods (user_id, emotion, valence, energy, ratings) VALUES (?,?,?,?,?) '
+                    'ON CONFLICT(user_id, emotion) DO UPDATE SET valence = valence + excluded.valence, '
+                    'energy = energy + excluded.energy, ratings = ratings + excluded.ratings',
+                    (user_id, emotion) + mood_delta)
+
+        if genre_rows or mood_delta is not None:
+            self.writer.submit(write)
+
+    def stats(self):
+        return {
+            'users': len(self._users),
+            'sessions': len(self._sessions),
+            'loads': self.loads,
+            'updates': self.updates,
+            'ignored': self.ignored,
+        }
+
+
+def rebuild(conn, mood_map, learning_rate=PREFERENCE_LEARNING_RATE):
+    """Replay every rating in `feedback`, oldest first, into fresh preference tables. Returns the number of users."""
+    users, summaries = {}, {}
+    rows = conn.execute(
+        'SELECT s.id, s.user_id, s.detected_emotion, s.tracks_json, f.rating FROM feedback f '
+        'JOIN sessions s ON s.id = f.session_id WHERE s.user_id IS NOT NULL ORDER BY f.id').fetchall()
+    for row in rows:
+        signal = rating_signal(row['rating'])
+        if signal is None:
+            continue
+        summary = summaries.get(row['id'])
+        if summary is None:
+            summary = summaries[row['id']] = summarize(
+                row['user_id'], row['detected_emotion'], track_store.session_tracks(conn, row))
+        apply_rating(users.setdefault(row['user_id'], UserPreferences()), summary, signal, mood_map, learning_rate)
+
+    with conn:
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute('DELETE FROM preference_genres')
+        conn.execute('DELETE FROM preference_moods')
+        for user_id, prefs in users.items():
+            conn.executemany('INSERT INTO preference_genres (user_id, genre, weight) VALUES (?,?,?)',
+                             [(user_id, g, w) for g, w in prefs.genres.items()])
+            conn.executemany('INSERT INTO preference_moods (user_id, emotion, valence, energy, ratings) '
+                             'VALUES (?,?,?,?,?)', [(user_id, e, *m) for e, m in prefs.moods.items()])
+    return len(users)
@@ -0,0 +1,374 @@
+import os
+import sys
+import time
+import threading
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+
+
+CACHE_TTL = float(os.environ.get('RECOMMENDATION_CACHE_TTL', '1800'))
+CACHE_STALE_TTL = float(os.environ.get('RECOMMENDATION_CACHE_STALE_TTL', '86400'))
+CACHE_MAX_ENTRIES = int(os.environ.get('RECOMMENDATION_CACHE_MAX_ENTRIES', '512'))
+
+
+class TTLCache:
+    """
+    Bounded LRU cache with TTL expiry and stale-while-revalidate.
+
+    Entries younger than `ttl` are fresh. Entries older than that but within
+    `stale_ttl` are still returned by get_or_load(), which schedules a
+    background reload so the next caller sees fresh data. Anything older is
+    treated as a miss.
+    """
+
+    def __init__(self, ttl=CACHE_TTL, stale_ttl=CACHE_STALE_TTL, max_entries=CACHE_MAX_ENTRIES,
+                 refresh_workers=2):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.refresh_workers = refresh_workers
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._executor = None
+        self._pid = None
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.refreshes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def _lookup(self, key):
+        """Return (value, age) for a servable entry, else None. Caller holds the lock."""
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, stored_at = entry
+        age = time.monotonic() - stored_at
+        if age > self.ttl + self.stale_ttl:
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value, age
+
+    def get(self, key):
+        with self._lock:
+            found = self._lookup(key)
+        if found is None or found[1] > self.ttl:
+            return None
+        return found[0]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def expires_in(self, key):
+        """Seconds until `key` goes stale; negative if stale, None if absent."""
+        with self._lock:
+            entry = self._data.get(key)
+        if entry is None:
+            return None
+        return self.ttl - (time.monotonic() - entry[1])
+
+    def lookup(self, key):
+        """(value, fresh) for a servable entry, else None; counts a hit, stale hit or miss."""
+        with self._lock:
+            found = self._lookup(key)
+            if found is None:
+                self.misses += 1
+                return None
+            value, age = found
+            if age <= self.ttl:
+                self.hits += 1
+                return value, True
+            self.stale_hits += 1
+            return value, False
+
+    def get_or_load(self, key, loader):
+        found = self.lookup(key)
+        if found is not None:
+            value, fresh = found
+            if not fresh:
+                self.refresh_async(key, loader)
+            return value
+
+        value = loader()
+        self.put(key, value)
+        return value
+
+    def refresh(self, key, loader):
+        value = loader()
+        self.put(key, value)
+        with self._lock:
+            self.refreshes += 1
+        return value
+
+    def refresh_async(self, key, loader):
+        """Reload `key` on a background worker unless a reload is already in flight."""
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                # reloads in flight at fork() happen in the parent only
+                self._executor = ThreadPoolExecutor(max_workers=self.refresh_workers,
+                                                    thread_name_prefix='cache-refresh')
+                self._pid = os.getpid()
+                self._refreshing = set()
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        self._executor.submit(self._refresh_task, key, loader)
+
+    def _refresh_task(self, key, loader):
+        try:
+            self.refresh(key, loader)
+        except Exception as e:
+            print(f"Cache refresh error for {key}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {
+            'entries': len(self._data),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'refreshes': self.refreshes,
+        }
+
+
+class MemoCache:
+    """
+    Bounded LRU memo for small results keyed by strings.
+
+    Capped both by entry count and by approximate memory (`max_bytes`: key
+    size plus a fixed per-entry overhead); least recently used entries are
+    evicted first. Values should be small, immutable and shared.
+    """
+
+    ENTRY_OVERHEAD = 200
+
+    def __init__(self, max_entries=4096, max_bytes=1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def _size(self, key):
+        return sys.getsizeof(key) + self.ENTRY_OVERHEAD
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        size = self._size(key)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self.bytes -= self._size(key)
+            self._data[key] = value
+            self._data.move_to_end(key)
+            self.bytes += size
+            while len(self._data) > self.max_entries or self.bytes > self.max_bytes:
+                old_key, _ = self._data.popitem(last=False)
+                self.bytes -= self._size(old_key)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def stats(self):
+        return {
+            'entries': len(self._data),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+class FanOut:
+    """
+    Runs independent loaders concurrently on a bounded thread pool.
+
+    run() waits at most `deadline` seconds and returns the results that
+    arrived by then. Loaders already running are left to finish in the
+    background (e.g. to fill a cache for the next request); ones still
+    queued are cancelled once no caller waits for them, so a slow backend
+    does not build a backlog. Jobs given the same key share one load while
+    it is in flight. The pool is created on first use and again after fork().
+    """
+
+    def __init__(self, workers=8, deadline=2.5):
+        self.workers = workers
+        self.deadline = deadline
+        self._lock = threading.RLock()
+        self._executor = None
+        self._pid = None
+        self._in_flight = {}
+        self.runs = 0
+        self.jobs = 0
+        self.shared = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self.errors = 0
+
+    def _ensure_executor(self):
+        """Caller holds the lock."""
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='fan-out')
+            self._pid = os.getpid()
+            self._in_flight = {}
+        return self._executor
+
+    def _forget(self, key, future):
+        with self._lock:
+            entry = self._in_flight.get(key)
+            if entry is not None and entry[0] is future:
+                del self._in_flight[key]
+
+    def run(self, jobs, deadline=None, keys=None):
+        """
+        {name: result} for the `jobs` ({name: loader}) that finished in time
+        without raising. `keys` ({name: key}) lets concurrent runs share the
+        load of a key instead of each submitting it.
+        """
+        if not jobs:
+            return {}
+        keys = keys or {}
+        futures, shared = {}, 0
+        with self._lock:
+            executor = self._ensure_executor()
+            for name, loader in jobs.items():
+                key = keys.get(name, (id(self), object()))
+                entry = self._in_flight.get(key)
+                if entry is None:
+                    future = executor.submit(contextvars.copy_context().run, loader)
+                    entry = self._in_flight[key] = [future, 0]
+                    future.add_done_callback(lambda f, key=key: self._forget(key, f))
+                else:
+                    shared += 1
+                entry[1] += 1
+                futures.setdefault(entry[0], []).append((name, key))
+
+        done, not_done = wait(futures, timeout=self.deadline if deadline is None else deadline)
+
+        results, errors = {}, 0
+        for future in done:
+            try:
+                result = future.result()
+            except Exception as e:
+                errors += 1
+                print(f"Fan-out error for {futures[future][0][0]}: {e}")
+                continue
+            for name, _ in futures[future]:
+                results[name] = result
+
+        with self._lock:
+            cancelled = 0
+            for future, names in futures.items():
+                entry = self._in_flight.get(names[0][1])
+                if entry is None or entry[0] is not future:
+                    continue
+                entry[1] -= len(names)
+                # nobody is waiting for it any more and it has not started: drop it
+                if entry[1] <= 0 and future in not_done and future.cancel():
+                    cancelled += 1
+            self.runs += 1
+            self.jobs += len(jobs)
+            self.shared += shared
+            self.timeouts += len(not_done)
+            self.cancelled += cancelled
+            self.errors += errors
+        return results
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'deadline': self.deadline,
+                'in_flight': len(self._in_flight),
+                'runs': self.runs,
+                'jobs': self.jobs,
+                'shared': self.shared,
+                'timeouts': self.timeouts,
+                'cancelled': self.cancelled,
+                'errors': self.errors,
+            }
+
+
+class Prefetcher:
+    """
+    Keeps a fixed set of cache keys hot.
+
+    `jobs` is a callable returning (key, loader) pairs. Every `interval`
+    seconds each key that is missing or close to going stale is reloaded.
+    """
+
+    def __init__(self, cache, jobs, interval=None, margin=None):
+        self.cache = cache
+        self.jobs = jobs
+        self.interval = interval if interval is not None else max(cache.ttl / 4, 30)
+        self.margin = margin if margin is not None else self.interval * 2
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self):
+        loaded = 0
+        for key, loader in self.jobs():
+            if self._stop.is_set():
+                break
+            remaining = self.cache.expires_in(key)
+            if remaining is not None and remaining > self.margin:
+                continue
+            try:
+                self.cache.refresh(key, loader)
+                loaded += 1
+            except Exception as e:
+                print(f"Prefetch error for {key}: {e}")
+        return loaded
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.run_once()
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='prefetcher', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
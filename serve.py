@@ -0,0 +1,211 @@
+"""
+Production launcher: a pre-fork server for the Flask app in app.py.
+
+The parent binds the listening socket, creates the schema and runs
+app.warm_up() once (lexicon index, Spotify token and track pools, URL map
+and templates; cascades and classifier only without a face pool), freezes
+the GC so those objects stay shared, then forks `--workers` processes. Each worker starts its own
+face pool and prefetcher, serves the inherited socket with a threaded
+Werkzeug server, and only starts accepting once it is warm, so the first
+requests after a deploy are as fast as the rest.
+
+SIGTERM or SIGINT drains: /api/ready turns 503, the worker waits
+`--drain-delay` seconds for load balancers to notice, stops accepting,
+lets in-flight requests finish (at most `--drain-timeout` seconds), then
+commits queued writes and exits. The parent replaces workers that die.
+
+    python serve.py --workers 4 --port 5000
+"""
+import os
+import gc
+import sys
+import time
+import signal
+import socket
+import logging
+import argparse
+import threading
+
+from werkzeug.serving import make_server
+from werkzeug.wsgi import ClosingIterator
+
+import app as rooha
+import metrics
+
+
+SERVE_HOST = os.environ.get('SERVE_HOST', '0.0.0.0')
+SERVE_PORT = int(os.environ.get('SERVE_PORT', '5000'))
+SERVE_WORKERS = int(os.environ.get('SERVE_WORKERS', str(os.cpu_count() or 2)))
+SERVE_BACKLOG = int(os.environ.get('SERVE_BACKLOG', '1024'))
+SERVE_DRAIN_DELAY = float(os.environ.get('SERVE_DRAIN_DELAY', '0'))
+SERVE_DRAIN_TIMEOUT = float(os.environ.get('SERVE_DRAIN_TIMEOUT', '30'))
+
+RESPAWN_BACKOFF = 1.0
+
+
+class InFlight:
+    """WSGI middleware counting requests whose response has not been fully sent."""
+
+    def __init__(self, app):
+        self.app = app
+        self.active = 0
+        self._idle = threading.Condition()
+
+    def _finished(self):
+        with self._idle:
+            self.active -= 1
+            if not self.active:
+                self._idle.notify_all()
+
+    def __call__(self, environ, start_response):
+        with self._idle:
+            self.active += 1
+        try:
+            return ClosingIterator(self.app(environ, start_response), self._finished)
+        except BaseException:
+            self._finished()
+            raise
+
+    def wait_idle(self, timeout):
+        with self._idle:
+            return self._idle.wait_for(lambda: not self.active, timeout)
+
+
+def bind(host, port, backlog=SERVE_BACKLOG):
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.create_server((host, port), family=family, backlog=backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(sock, args):
+    """Serve `sock` until SIGTERM/SIGINT, then drain; returns the exit code."""
+    metrics.reset()
+    stopping = threading.Event()
+    server = None
+
+    def drain():
+        rooha.readiness['draining'] = True
+        time.sleep(args.drain_delay)
+        server.shutdown()
+
+    def on_signal(signum, frame):
+        if stopping.is_set():
+            return
+        stopping.set()
+        # before the server exists there is nothing to drain: the start-up
+        # below notices `stopping` and skips serving
+        if server is not None:
+            threading.Thread(target=drain, name='drain', daemon=True).start()
+
+    # handlers go in before any background work starts, so a SIGTERM during
+    # start-up still shuts the face pool and writer down cleanly
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+    rooha.start_background()
+    host, port = sock.getsockname()[:2]
+    handler = InFlight(rooha.app)
+    server = make_server(host, port, handler, threaded=True, fd=sock.fileno())
+    if not stopping.is_set():
+        print(f"Worker {os.getpid()} ready")
+        server.serve_forever()
+
+    clean = handler.wait_idle(args.drain_timeout)
+    if not clean:
+        print(f"Worker {os.getpid()}: {handler.active} request(s) still running after {args.drain_timeout:g}s")
+    server.server_close()
+    rooha.shutdown()
+    return 0 if clean else 1
+
+
+def spawn(sock, args):
+    pid = os.fork()
+    if pid:
+        return pid
+    code = 1
+    try:
+        code = run_worker(sock, args)
+    except BaseException as e:
+        print(f"Worker {os.getpid()} error: {e}")
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(code)
+
+
+def supervise(sock, args):
+    """Fork the workers, replace any that die, and stop them all on SIGTERM/SIGINT."""
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.set())
+
+    # objects created during warm-up are never collected, so the GC does not
+    # touch (and copy) the pages the workers share
+    gc.collect()
+    gc.freeze()
+
+    workers = {spawn(sock, args): time.monotonic() for _ in range(args.workers)}
+    while not stopping.is_set():
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if not pid:
+            stopping.wait(0.2)
+            continue
+        started_at = workers.pop(pid, None)
+        if started_at is None or stopping.is_set():
+            continue
+        print(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}; starting a new one")
+        if time.monotonic() - started_at < RESPAWN_BACKOFF:
+            time.sleep(RESPAWN_BACKOFF)
+        workers[spawn(sock, args)] = time.monotonic()
+
+    print(f"Draining {len(workers)} worker(s)")
+    for pid in workers:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    deadline = time.monotonic() + args.drain_delay + args.drain_timeout + 10
+    while workers and time.monotonic() < deadline:
+        pid, _ = os.waitpid(-1, os.WNOHANG)
+        if pid:
+            workers.pop(pid, None)
+        else:
+            time.sleep(0.1)
+    for pid in workers:
+        print(f"Worker {pid} did not stop in time, killing it")
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rooha production server')
+    parser.add_argument('--host', default=SERVE_HOST)
+    parser.add_argument('--port', type=int, default=SERVE_PORT)
+    parser.add_argument('--workers', type=int, default=SERVE_WORKERS,
+                        help='worker processes; 0 serves from this process (default: CPU count)')
+    parser.add_argument('--db', help='SQLite database path (default: database/rooha.db)')
+    parser.add_argument('--drain-delay', type=float, default=SERVE_DRAIN_DELAY,
+                        help='seconds between /api/ready turning 503 and closing the listener')
+    parser.add_argument('--drain-timeout', type=float, default=SERVE_DRAIN_TIMEOUT,
+                        help='seconds to wait for in-flight requests when stopping')
+    parser.add_argument('--access-log', action='store_true', help='log every request')
+    args = parser.parse_args()
+
+    if not args.access_log:
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    sock = bind(args.host, args.port)
+    started = time.monotonic()
+    rooha.create_app(args.db)
+    host, port = sock.getsockname()[:2]
+    print(f"Warmed up in {time.monotonic() - started:.2f}s; listening on http://{host}:{port}")
+
+    if args.workers < 1 or not hasattr(os, 'fork'):
+        sys.exit(run_worker(sock, args))
+    print(f"Starting {args.workers} worker(s)")
+    supervise(sock, args)
+    sock.close()
+
+
+if __name__ == '__main__':
+    main()
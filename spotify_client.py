@@ -0,0 +1,400 @@
+import os
+import json
+import time
+import base64
+import queue
+import random
+import asyncio
+import threading
+import http.client
+import urllib.parse
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+import metrics
+
+
+SPOTIFY_ACCOUNTS_URL = os.environ.get('SPOTIFY_ACCOUNTS_URL', 'https://accounts.spotify.com')
+SPOTIFY_API_URL = os.environ.get('SPOTIFY_API_URL', 'https://api.spotify.com')
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class SpotifyError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+def api_stage(path):
+    """metrics stage name for a Web API path."""
+    return 'spotify_search' if path == '/v1/search' else 'spotify_api'
+
+
+def retry_delay(attempt, retry_after, backoff, max_retry_after):
+    """Seconds to wait before retry `attempt`: Retry-After if given, else jittered exponential backoff."""
+    if retry_after:
+        try:
+            return min(float(retry_after), max_retry_after)
+        except ValueError:
+            pass
+    return backoff * (2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+def token_request(client_id, client_secret):
+    """(body, headers) for a client-credentials token request."""
+    credentials = base64.b64encode(f"{client_id}:{client_secret}".encode()).decode()
+    body = urllib.parse.urlencode({'grant_type': 'client_credentials'})
+    return body, {'Authorization': f'Basic {credentials}',
+                  'Content-Type': 'application/x-www-form-urlencoded'}
+
+
+def parse_token(data, status=None):
+    """(access_token, expires_in seconds) from a token response body."""
+    token_data = json.loads(data.decode())
+    token = token_data.get('access_token')
+    if not token:
+        raise SpotifyError('No access_token in token response', status)
+    return token, float(token_data.get('expires_in', 3600))
+
+
+class ConnectionPool:
+    """
+    Keep-alive HTTP(S) connections, pooled per (scheme, host, port).
+
+    After fork() the inherited sockets belong to the parent: they are
+    forgotten without being closed (closing would end the parent's TLS
+    sessions) and the child opens its own.
+    """
+
+    def __init__(self, max_idle=8):
+        self.max_idle = max_idle
+        self._pools = {}
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def _idle(self, key):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pools, self._pid = {}, os.getpid()
+            if key not in self._pools:
+                self._pools[key] = queue.LifoQueue()
+            return self._pools[key]
+
+    def _connect(self, key, timeout):
+        scheme, host, port = key
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, port, timeout=timeout)
+        return http.client.HTTPConnection(host, port, timeout=timeout)
+
+    def request(self, method, url, body=None, headers=None, timeout=8):
+        parts = urllib.parse.urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80))
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        idle = self._idle(key)
+        try:
+            conn, reused = idle.get_nowait(), True
+        except queue.Empty:
+            conn, reused = self._connect(key, timeout), False
+
+        try:
+            conn.timeout = timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+            conn.request(method, path, body=body, headers=headers or {})
+            resp = conn.getresponse()
+            data = resp.read()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            conn.close()
+            if not reused:
+                raise
+            # The server closed an idle keep-alive connection; retry once on a fresh one.
+            return self.request(method, url, body, headers, timeout)
+        except Exception:
+            conn.close()
+            raise
+
+        if resp.will_close or idle.qsize() >= self.max_idle:
+            conn.close()
+        else:
+            idle.put(conn)
+        return resp.status, resp.headers, data
+
+    def close(self):
+        with self._lock:
+            pools, self._pools = self._pools, {}
+            if self._pid != os.getpid():
+                return
+        for idle in pools.values():
+            while True:
+                try:
+                    idle.get_nowait().close()
+                except queue.Empty:
+                    break
+
+
+class SpotifyClient:
+    """
+    Client-credentials Spotify client.
+
+    The access token is cached until shortly before it expires and is
+    refreshed ahead of time on a background thread. API calls reuse pooled
+    keep-alive connections and retry 429/5xx responses with backoff,
+    honouring Retry-After.
+    """
+
+    def __init__(self, client_id, client_secret, accounts_url=SPOTIFY_ACCOUNTS_URL,
+                 api_url=SPOTIFY_API_URL, max_retries=3, backoff=0.5, max_retry_after=10,
+                 refresh_margin=300, pool=None):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.accounts_url = accounts_url.rstrip('/')
+        self.api_url = api_url.rstrip('/')
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_retry_after = max_retry_after
+        self.refresh_margin = refresh_margin
+        self.pool = pool or ConnectionPool()
+
+        self._token = None
+        self._expires_at = 0.0
+        self._token_lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+        self._refreshing = False
+
+    @property
+    def configured(self):
+        return bool(self.client_id and self.client_secret)
+
+    # ---------- token ----------
+
+    def _fetch_token(self):
+        body, headers = token_request(self.client_id, self.client_secret)
+        with metrics.timer('spotify_token'):
+            status, resp_headers, data = self._send(
+                'POST', f'{self.accounts_url}/api/token', body=body, headers=headers, timeout=5)
+        token, expires_in = parse_token(data, status)
+        with self._token_lock:
+            self._token = token
+            self._expires_at = time.monotonic() + expires_in
+        return token
+
+    def _refresh_in_background(self):
+        try:
+            self._fetch_token()
+        except Exception as e:
+            print(f"Spotify token refresh error: {e}")
+        finally:
+            self._refreshing = False
+
+    def get_token(self):
+        """Return a valid access token, or None when credentials are missing."""
+        if not self.configured:
+            return None
+        now = time.monotonic()
+        with self._token_lock:
+            token, expires_at = self._token, self._expires_at
+            refresh = (token is not None and now < expires_at
+                       and now >= expires_at - self.refresh_margin and not self._refreshing)
+            if refresh:
+                self._refreshing = True
+        if refresh:
+            threading.Thread(target=self._refresh_in_background, daemon=True).start()
+        if token is not None and now < expires_at:
+            return token
+        with self._fetch_lock:
+            if self._token is not None and time.monotonic() < self._expires_at:
+                return self._token
+            return self._fetch_token()
+
+    def invalidate_token(self):
+        with self._token_lock:
+            self._token = None
+            self._expires_at = 0.0
+
+    # ---------- requests ----------
+
+    def _retry_delay(self, attempt, headers):
+        retry_after = headers.get('Retry-After') if headers is not None else None
+        return retry_delay(attempt, retry_after, self.backoff, self.max_retry_after)
+
+    def _send(self, method, url, body=None, headers=None, timeout=8):
+        """Send with bounded retries on 429/5xx and connection errors."""
+        for attempt in range(self.max_retries + 1):
+            last = attempt == self.max_retries
+            try:
+                status, resp_headers, data = self.pool.request(method, url, body, headers, timeout)
+            except (OSError, http.client.HTTPException) as e:
+                if last:
+                    raise SpotifyError(f'{method} {url} failed: {e}')
+                metrics.count('spotify_retries')
+                time.sleep(self._retry_delay(attempt, None))
+                continue
+            if status in RETRY_STATUSES and not last:
+                metrics.count('spotify_retries')
+                time.sleep(self._retry_delay(attempt, resp_headers))
+                continue
+            if status >= 400:
+                raise SpotifyError(f'{method} {url} returned {status}', status)
+            return status, resp_headers, data
+
+    def get(self, path, params=None, timeout=8):
+        url = f'{self.api_url}{path}'
+        if params:
+            url += '?' + urllib.parse.urlencode(params)
+        for retry_auth in (True, False):
+            token = self.get_token()
+            if not token:
+                raise SpotifyError('Spotify credentials not configured')
+            try:
+                with metrics.timer(api_stage(path)):
+                    status, headers, data = self._send(
+                        'GET', url, headers={'Authorization': f'Bearer {token}'}, timeout=timeout)
+            except SpotifyError as e:
+                if e.status == 401 and retry_auth:
+                    self.invalidate_token()
+                    continue
+                raise
+            return json.loads(data.decode())
+
+    def search_tracks(self, query, limit=12, market='IN'):
+        return self.get('/v1/search', {'q': query, 'type': 'track', 'limit': limit, 'market': market})
+
+    def close(self):
+        self.pool.close()
+
+
+class AsyncSpotifyClient:
+    """
+    asyncio counterpart of SpotifyClient for the ASGI serving mode.
+
+    Requests go through one httpx.AsyncClient (keep-alive, at most
+    `max_connections` sockets), so waiting on Spotify never blocks the event
+    loop. Token caching, early refresh and retry behaviour match
+    SpotifyClient. Must be used from a single event loop.
+    """
+
+    def __init__(self, client_id, client_secret, accounts_url=SPOTIFY_ACCOUNTS_URL,
+                 api_url=SPOTIFY_API_URL, max_retries=3, backoff=0.5, max_retry_after=10,
+                 refresh_margin=300, max_connections=100):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.accounts_url = accounts_url.rstrip('/')
+        self.api_url = api_url.rstrip('/')
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_retry_after = max_retry_after
+        self.refresh_margin = refresh_margin
+        self.max_connections = max_connections
+
+        self._client = None
+        self._token = None
+        self._expires_at = 0.0
+        self._fetch_lock = asyncio.Lock()
+        self._refresh_task = None
+
+    @property
+    def configured(self):
+        return bool(self.client_id and self.client_secret)
+
+    def _http(self):
+        if self._client is None:
+            if httpx is None:
+                raise ImportError('httpx is not installed')
+            self._client = httpx.AsyncClient(limits=httpx.Limits(
+                max_connections=self.max_connections, max_keepalive_connections=self.max_connections))
+        return self._client
+
+    # ---------- token ----------
+
+    async def _fetch_token(self):
+        body, headers = token_request(self.client_id, self.client_secret)
+        with metrics.timer('spotify_token'):
+            resp = await self._send('POST', f'{self.accounts_url}/api/token', body=body, headers=headers, timeout=5)
+        token, expires_in = parse_token(resp.content, resp.status_code)
+        self._token = token
+        self._expires_at = time.monotonic() + expires_in
+        return token
+
+    async def _refresh_in_background(self):
+        try:
+            await self._fetch_token()
+        except Exception as e:
+            print(f"Spotify token refresh error: {e}")
+        finally:
+            self._refresh_task = None
+
+    async def get_token(self):
+        """Return a valid access token, or None when credentials are missing."""
+        if not self.configured:
+            return None
+        now = time.monotonic()
+        if self._token is not None and now < self._expires_at:
+            if now >= self._expires_at - self.refresh_margin and self._refresh_task is None:
+                self._refresh_task = asyncio.ensure_future(self._refresh_in_background())
+            return self._token
+        async with self._fetch_lock:
+            if self._token is not None and time.monotonic() < self._expires_at:
+                return self._token
+            return await self._fetch_token()
+
+    def invalidate_token(self):
+        self._token = None
+        self._expires_at = 0.0
+
+    # ---------- requests ----------
+
+    async def _send(self, method, url, body=None, headers=None, timeout=8):
+        """Send with bounded retries on 429/5xx and connection errors."""
+        client = self._http()
+        for attempt in range(self.max_retries + 1):
+            last = attempt == self.max_retries
+            try:
+                resp = await client.request(method, url, content=body, headers=headers, timeout=timeout)
+            except httpx.HTTPError as e:
+                if last:
+                    raise SpotifyError(f'{method} {url} failed: {e}')
+                metrics.count('spotify_retries')
+                await asyncio.sleep(retry_delay(attempt, None, self.backoff, self.max_retry_after))
+                continue
+            if resp.status_code in RETRY_STATUSES and not last:
+                metrics.count('spotify_retries')
+                await asyncio.sleep(retry_delay(attempt, resp.headers.get('Retry-After'),
+                                                self.backoff, self.max_retry_after))
+                continue
+            if resp.status_code >= 400:
+                raise SpotifyError(f'{method} {url} returned {resp.status_code}', resp.status_code)
+            return resp
+
+    async def get(self, path, params=None, timeout=8):
+        url = f'{self.api_url}{path}'
+        if params:
+            url += '?' + urllib.parse.urlencode(params)
+        for retry_auth in (True, False):
+            token = await self.get_token()
+            if not token:
+                raise SpotifyError('Spotify credentials not configured')
+            try:
+                with metrics.timer(api_stage(path)):
+                    resp = await self._send('GET', url, headers={'Authorization': f'Bearer {token}'},
+                                            timeout=timeout)
+            except SpotifyError as e:
+                if e.status == 401 and retry_auth:
+                    self.invalidate_token()
+                    continue
+                raise
+            return resp.json()
+
+    async def search_tracks(self, query, limit=12, market='IN'):
+        return await self.get('/v1/search', {'q': query, 'type': 'track', 'limit': limit, 'market': market})
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
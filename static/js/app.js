@@ -3,6 +3,8 @@ let currentSessionId = null;
 let cameraStream = null;
 const audioPlayer = document.getElementById('audioPlayer');
 let currentlyPlaying = null;
+let currentTracks = [];
+let historyCursor = null;
 
 const EMOTION_EMOJIS = {
     happy: '😊', sad: '😢', angry: '😤', fear: '😰',
@@ -143,6 +145,7 @@ async function startCamera() {
         document.getElementById('cameraFeed').srcObject = cameraStream;
         status.innerHTML = '<span class="material-icons-outlined">videocam</span> Camera active — smile!';
         captureBtn.disabled = false;
+        document.getElementById('liveBtn').disabled = false;
     } catch (e) {
         status.innerHTML = '<span class="material-icons-outlined">videocam_off</span> Camera not available';
         console.error('Camera error:', e);
@@ -151,6 +154,7 @@ async function startCamera() {
 }
 
 function stopCamera() {
+    stopLiveMode();
     if (cameraStream) {
         cameraStream.getTracks().forEach(t => t.stop());
         cameraStream = null;
@@ -166,13 +170,13 @@ async function capturePhoto() {
     ctx.translate(canvas.width, 0);
     ctx.scale(-1, 1);
     ctx.drawImage(video, 0, 0);
-    const imageData = canvas.toDataURL('image/jpeg', 0.8);
+    const imageBlob = await new Promise(resolve => canvas.toBlob(resolve, 'image/jpeg', 0.8));
 
     stopCamera();
     document.getElementById('faceInput').style.display = 'none';
     document.getElementById('loadingState').style.display = 'flex';
 
-    const result = await api('/api/analyze/face', 'POST', { image: imageData });
+    const result = await uploadImage('/api/analyze/face', imageBlob);
 
     setTimeout(() => {
         document.getElementById('loadingState').style.display = 'none';
@@ -185,6 +189,85 @@ async function capturePhoto() {
     }, 2000);
 }
 
+// Raw JPEG body instead of a base64 data URL inside JSON
+async function uploadImage(url, blob) {
+    try {
+        const res = await fetch(url, { method: 'POST', headers: { 'Content-Type': blob.type }, body: blob });
+        return await res.json();
+    } catch (e) {
+        console.error('API Error:', e);
+        toast('Connection error. Please try again.', 'error');
+        return null;
+    }
+}
+
+// ===== LIVE MODE =====
+const LIVE_FPS = 4;
+const LIVE_FRAME_WIDTH = 320;
+let liveStream = null;
+
+function toggleLiveMode() {
+    if (liveStream) stopLiveMode();
+    else startLiveMode();
+}
+
+async function startLiveMode() {
+    const res = await api('/api/stream/face', 'POST');
+    if (!res?.stream_id) return;
+
+    const events = new EventSource(`/api/stream/face/${res.stream_id}/events`);
+    liveStream = { id: res.stream_id, events, timer: null, inFlight: false };
+
+    events.addEventListener('frame', e => {
+        const d = JSON.parse(e.data);
+        document.getElementById('cameraStatus').innerHTML =
+            `<span class="material-icons-outlined">sensors</span> Live — ${EMOTION_EMOJIS[d.smoothed] || '🎵'} ${d.smoothed}`;
+    });
+    events.addEventListener('change', e => showResults(JSON.parse(e.data)));
+
+    liveStream.timer = setInterval(sendLiveFrame, 1000 / LIVE_FPS);
+    document.getElementById('liveBtn').classList.add('active');
+    document.getElementById('liveBtnLabel').textContent = 'Stop Live';
+}
+
+function sendLiveFrame() {
+    // Skip this tick while the previous frame is still uploading
+    if (!liveStream || liveStream.inFlight) return;
+    const video = document.getElementById('cameraFeed');
+    if (!video.videoWidth) return;
+
+    const canvas = document.getElementById('captureCanvas');
+    const scale = Math.min(1, LIVE_FRAME_WIDTH / video.videoWidth);
+    canvas.width = Math.round(video.videoWidth * scale);
+    canvas.height = Math.round(video.videoHeight * scale);
+    const ctx = canvas.getContext('2d');
+    ctx.setTransform(-1, 0, 0, 1, canvas.width, 0);
+    ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
+
+    const stream = liveStream;
+    stream.inFlight = true;
+    canvas.toBlob(blob => {
+        fetch(`/api/stream/face/${stream.id}/frames`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'image/jpeg' },
+            body: blob,
+        })
+            .then(r => { if (r.status === 404) stopLiveMode(); })
+            .catch(e => console.error('Live frame error:', e))
+            .finally(() => { stream.inFlight = false; });
+    }, 'image/jpeg', 0.7);
+}
+
+function stopLiveMode() {
+    if (!liveStream) return;
+    clearInterval(liveStream.timer);
+    liveStream.events.close();
+    fetch(`/api/stream/face/${liveStream.id}`, { method: 'DELETE' }).catch(() => {});
+    liveStream = null;
+    document.getElementById('liveBtn').classList.remove('active');
+    document.getElementById('liveBtnLabel').textContent = 'Go Live';
+}
+
 // ===== RESULTS =====
 function showResults(result) {
     currentSessionId = result.session_id;
@@ -205,12 +288,13 @@ function showResults(result) {
     document.getElementById('emotionResultCard').style.borderLeft = `4px solid ${emotionColor}`;
 
     const tracks = result.tracks || [];
+    currentTracks = tracks;
     document.getElementById('tracksCount').textContent = tracks.length + ' tracks';
 
     document.getElementById('tracksGrid').innerHTML = tracks.map((t, i) => `
-        <div class="track-card" onclick="${t.preview ? `playPreview('${t.preview}', ${i})` : `window.open('${t.url}','_blank')`}">
+        <div class="track-card" onclick="openTrack(${i})">
             <div class="track-art">
-                ${t.image ? `<img src="${t.image}" alt="${t.name}" loading="lazy">` : `<div style="width:100%;height:100%;background:var(--surface-3);display:flex;align-items:center;justify-content:center"><span class="material-icons-outlined" style="color:var(--text-3)">music_note</span></div>`}
+                ${t.image ? `<img src="${safeUrl(t.image)}" alt="${escapeAttr(t.name)}" loading="lazy">` : `<div style="width:100%;height:100%;background:var(--surface-3);display:flex;align-items:center;justify-content:center"><span class="material-icons-outlined" style="color:var(--text-3)">music_note</span></div>`}
                 <div class="play-overlay">
                     <span class="material-icons-outlined">${t.preview ? 'play_arrow' : 'open_in_new'}</span>
                 </div>
@@ -219,7 +303,7 @@ function showResults(result) {
                 <h4>${escapeHtml(t.name)}</h4>
                 <p>${escapeHtml(t.artist)}</p>
             </div>
-            ${t.url ? `<a href="${t.url}" target="_blank" class="track-link" onclick="event.stopPropagation()"><span class="material-icons-outlined">open_in_new</span></a>` : ''}
+            ${t.url ? `<a href="${safeUrl(t.url)}" target="_blank" rel="noopener" class="track-link" onclick="event.stopPropagation()"><span class="material-icons-outlined">open_in_new</span></a>` : ''}
         </div>
     `).join('');
 
@@ -233,6 +317,19 @@ function escapeHtml(text) {
     return d.innerHTML;
 }
 
+function escapeAttr(text) {
+    return escapeHtml(text).replace(/"/g, '&quot;').replace(/'/g, '&#39;');
+}
+
+// Only http(s) links from track data end up in href/src attributes or get opened
+function isHttpUrl(url) {
+    return /^https?:\/\//i.test(url || '');
+}
+
+function safeUrl(url) {
+    return isHttpUrl(url) ? escapeAttr(url) : '#';
+}
+
 function setAmbientMood(emotion) {
     const bg = document.getElementById('ambientBg');
     bg.className = 'ambient-bg';
@@ -240,6 +337,14 @@ function setAmbientMood(emotion) {
 }
 
 // ===== AUDIO =====
+// Track cards pass their index; the URLs never go through inline handler strings
+function openTrack(index) {
+    const t = currentTracks[index];
+    if (!t) return;
+    if (t.preview && isHttpUrl(t.preview)) playPreview(t.preview, index);
+    else if (isHttpUrl(t.url)) window.open(t.url, '_blank', 'noopener');
+}
+
 function playPreview(url, index) {
     if (currentlyPlaying === index) {
         audioPlayer.pause();
@@ -272,24 +377,10 @@ async function loadHistory() {
         `;
     }
 
-    if (history && history.length > 0) {
-        document.getElementById('historyList').innerHTML = history.map(h => {
-            const dt = new Date(h.created_at);
-            const timeStr = dt.toLocaleDateString() + ' ' + dt.toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' });
-            return `
-                <div class="history-item">
-                    <div class="hi-emoji">${EMOTION_EMOJIS[h.detected_emotion] || '🎵'}</div>
-                    <div class="hi-info">
-                        <h4>${h.detected_emotion}</h4>
-                        <p>${h.mood} • Confidence: ${Math.round((h.confidence || 0) * 100)}%${h.input_text ? ' • "' + escapeHtml(h.input_text.substring(0, 60)) + (h.input_text.length > 60 ? '...' : '') + '"' : ''}</p>
-                    </div>
-                    <div class="hi-meta">
-                        <div class="hi-badge ${h.input_type === 'text' ? 'hi-badge-text' : 'hi-badge-face'}">${h.input_type === 'text' ? '✏️ Text' : '📸 Face'}</div>
-                        <div class="hi-time">${timeStr}</div>
-                    </div>
-                </div>
-            `;
-        }).join('');
+    historyCursor = history?.next_cursor || null;
+    const items = history?.items || [];
+    if (items.length > 0) {
+        document.getElementById('historyList').innerHTML = items.map(renderHistoryItem).join('') + renderHistoryMore();
     } else {
         document.getElementById('historyList').innerHTML = `
             <div style="text-align:center;padding:60px 20px;color:var(--text-3)">
@@ -300,6 +391,54 @@ async function loadHistory() {
     }
 }
 
+function renderHistoryItem(h) {
+    const dt = new Date(h.created_at);
+    const timeStr = dt.toLocaleDateString() + ' ' + dt.toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' });
+    return `
+        <div class="history-item" onclick="toggleHistoryTracks(${h.id}, this)">
+            <div class="hi-emoji">${EMOTION_EMOJIS[h.detected_emotion] || '🎵'}</div>
+            <div class="hi-info">
+                <h4>${h.detected_emotion}</h4>
+                <p>${h.mood} • Confidence: ${Math.round((h.confidence || 0) * 100)}%${h.input_text ? ' • "' + escapeHtml(h.input_text.substring(0, 60)) + (h.input_text.length > 60 ? '...' : '') + '"' : ''}</p>
+            </div>
+            <div class="hi-meta">
+                <div class="hi-badge ${h.input_type === 'text' ? 'hi-badge-text' : 'hi-badge-face'}">${h.input_type === 'text' ? '✏️ Text' : '📸 Face'}</div>
+                <div class="hi-time">${timeStr}</div>
+            </div>
+        </div>
+    `;
+}
+
+function renderHistoryMore() {
+    return historyCursor ? `<button class="history-more" onclick="loadMoreHistory(this)">Load more</button>` : '';
+}
+
+async function loadMoreHistory(btn) {
+    btn.disabled = true;
+    const page = await api('/api/history?cursor=' + encodeURIComponent(historyCursor));
+    historyCursor = page?.next_cursor || null;
+    btn.outerHTML = (page?.items || []).map(renderHistoryItem).join('') + renderHistoryMore();
+}
+
+// Tracks are only fetched when a session is opened
+async function toggleHistoryTracks(id, item) {
+    const open = item.nextElementSibling;
+    if (open?.classList.contains('history-tracks')) {
+        open.remove();
+        return;
+    }
+    const detail = await api('/api/history/' + id);
+    if (!detail || detail.error) return;
+    const tracks = detail.tracks || [];
+    item.insertAdjacentHTML('afterend', `
+        <div class="history-tracks">
+            ${tracks.length ? tracks.map(t => `
+                <a href="${safeUrl(t.url)}" target="_blank" rel="noopener">${escapeHtml(t.name)} <span>— ${escapeHtml(t.artist)}</span></a>
+            `).join('') : '<p>No tracks saved for this session.</p>'}
+        </div>
+    `);
+}
+
 // ===== AUTH =====
 function checkAuth() {
     api('/api/auth/status').then(data => {
@@ -0,0 +1,174 @@
+"""
+Aggregates behind /api/stats, kept current by triggers on `sessions`.
+
+Reading stats touches a handful of small tables instead of scanning the
+whole session history. rebuild() recomputes everything from `sessions`.
+"""
+
+TABLES = '''
+    CREATE TABLE IF NOT EXISTS stats_totals (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        sessions INTEGER NOT NULL DEFAULT 0,
+        confidence_sum REAL NOT NULL DEFAULT 0,
+        confidence_count INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS stats_by_emotion (
+        emotion TEXT PRIMARY KEY,
+        count INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS stats_by_input_type (
+        input_type TEXT PRIMARY KEY,
+        count INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS stats_daily (
+        day TEXT PRIMARY KEY,
+        count INTEGER NOT NULL DEFAULT 0,
+        confidence_sum REAL NOT NULL DEFAULT 0,
+        confidence_count INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS stats_hourly (
+        hour TEXT NOT NULL,
+        emotion TEXT NOT NULL,
+        input_type TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        confidence_sum REAL NOT NULL DEFAULT 0,
+        confidence_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (hour, emotion, input_type)
+    );
+'''
+
+AGGREGATE_TABLES = ['stats_totals', 'stats_by_emotion', 'stats_by_input_type', 'stats_daily', 'stats_hourly']
+
+WINDOWS = {'last_24h': '-23 hours', 'last_7d': '-167 hours'}
+
+
+def _apply(row, sign):
+    """Trigger statements adding (sign=1) or removing (sign=-1) one session row."""
+    created = f"COALESCE({row}.created_at, CURRENT_TIMESTAMP)"
+    conf = f"{sign} * COALESCE({row}.confidence, 0)"
+    has_conf = f"{sign} * ({row}.confidence IS NOT NULL)"
+    return f'''
+        UPDATE stats_totals SET sessions = sessions + {sign},
+            confidence_sum = confidence_sum + {conf},
+            confidence_count = confidence_count + {has_conf}
+        WHERE id = 1;
+        INSERT INTO stats_by_emotion (emotion, count) VALUES ({row}.detected_emotion, {sign})
+            ON CONFLICT(emotion) DO UPDATE SET count = count + {sign};
+        INSERT INTO stats_by_input_type (input_type, count) VALUES ({row}.input_type, {sign})
+            ON CONFLICT(input_type) DO UPDATE SET count = count + {sign};
+        INSERT INTO stats_daily (day, count, confidence_sum, confidence_count)
+            VALUES (date({created}), {sign}, {conf}, {has_conf})
+            ON CONFLICT(day) DO UPDATE SET count = count + {sign},
+                confidence_sum = confidence_sum + {conf},
+                confidence_count = confidence_count + {has_conf};
+        INSERT INTO stats_hourly (hour, emotion, input_type, count, confidence_sum, confidence_count)
+            VALUES (strftime('%Y-%m-%d %H:00:00', {created}), {row}.detected_emotion, {row}.input_type,
+                    {sign}, {conf}, {has_conf})
+            ON CONFLICT(hour, emotion, input_type) DO UPDATE SET count = count + {sign},
+                confidence_sum = confidence_sum + {conf},
+                confidence_count = confidence_count + {has_conf};
+    '''
+
+
+TRIGGERS = f'''
+    CREATE TRIGGER IF NOT EXISTS sessions_stats_insert AFTER INSERT ON sessions BEGIN
+        {_apply('NEW', 1)}
+    END;
+    CREATE TRIGGER IF NOT EXISTS sessions_stats_delete AFTER DELETE ON sessions BEGIN
+        {_apply('OLD', -1)}
+    END;
+    CREATE TRIGGER IF NOT EXISTS sessions_stats_update
+    AFTER UPDATE OF detected_emotion, input_type, confidence, created_at ON sessions BEGIN
+        {_apply('OLD', -1)}
+        {_apply('NEW', 1)}
+    END;
+'''
+
+
+def install(conn):
+    """Create aggregate tables and triggers; backfill them the first time."""
+    existed = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='stats_totals'").fetchone()
+    conn.executescript(TABLES + TRIGGERS)
+    conn.execute('INSERT OR IGNORE INTO stats_totals (id) VALUES (1)')
+    conn.commit()
+    if not existed:
+        rebuild(conn)
+
+
+def rebuild(conn):
+    """Recompute every aggregate from `sessions` in one transaction."""
+    with conn:
+        conn.execute('BEGIN IMMEDIATE')
+        for table in AGGREGATE_TABLES:
+            conn.execute(f'DELETE FROM {table}')
+        conn.execute('''
+            INSERT INTO stats_totals (id, sessions, confidence_sum, confidence_count)
+            SELECT 1, COUNT(*), COALESCE(SUM(confidence), 0), COUNT(confidence) FROM sessions
+        ''')
+        conn.execute('''
+            INSERT INTO stats_by_emotion (emotion, count)
+            SELECT detected_emotion, COUNT(*) FROM sessions GROUP BY detected_emotion
+        ''')
+        conn.execute('''
+            INSERT INTO stats_by_input_type (input_type, count)
+            SELECT input_type, COUNT(*) FROM sessions GROUP BY input_type
+        ''')
+        conn.execute('''
+            INSERT INTO stats_daily (day, count, confidence_sum, confidence_count)
+            SELECT date(COALESCE(created_at, CURRENT_TIMESTAMP)) AS day,
+                   COUNT(*), COALESCE(SUM(confidence), 0), COUNT(confidence)
+            FROM sessions GROUP BY day
+        ''')
+        conn.execute('''
+            INSERT INTO stats_hourly (hour, emotion, input_type, count, confidence_sum, confidence_count)
+            SELECT strftime('%Y-%m-%d %H:00:00', COALESCE(created_at, CURRENT_TIMESTAMP)) AS hour,
+                   detected_emotion, input_type, COUNT(*), COALESCE(SUM(confidence), 0), COUNT(confidence)
+            FROM sessions GROUP BY hour, detected_emotion, input_type
+        ''')
+    return conn.execute('SELECT sessions FROM stats_totals WHERE id = 1').fetchone()[0]
+
+
+def _avg(total, count):
+    return round(total / count, 3) if count else 0
+
+
+def _window(conn, offset):
+    hour = "strftime('%Y-%m-%d %H:00:00', 'now', ?)"
+    totals = conn.execute(
+        f'SELECT COALESCE(SUM(count), 0), COALESCE(SUM(confidence_sum), 0), COALESCE(SUM(confidence_count), 0) '
+        f'FROM stats_hourly WHERE hour >= {hour}', (offset,)).fetchone()
+    by_emotion = conn.execute(
+        f'SELECT emotion AS detected_emotion, SUM(count) AS count FROM stats_hourly WHERE hour >= {hour} '
+        f'GROUP BY emotion HAVING SUM(count) > 0 ORDER BY count DESC', (offset,)).fetchall()
+    return {
+        'total_sessions': totals[0],
+        'by_emotion': [dict(r) for r in by_emotion],
+        'avg_confidence': _avg(totals[1], totals[2]),
+    }
+
+
+def read(conn, days=30):
+    totals = conn.execute(
+        'SELECT sessions, confidence_sum, confidence_count FROM stats_totals WHERE id = 1').fetchone()
+    total, conf_sum, conf_count = totals if totals else (0, 0, 0)
+    by_emotion = conn.execute(
+        'SELECT emotion AS detected_emotion, count FROM stats_by_emotion WHERE count > 0 ORDER BY count DESC'
+    ).fetchall()
+    by_type = conn.execute(
+        'SELECT input_type, count FROM stats_by_input_type WHERE count > 0'
+    ).fetchall()
+    by_day = conn.execute(
+        "SELECT day, count FROM stats_daily WHERE day >= date('now', ?) AND count > 0 ORDER BY day",
+        (f'-{days - 1} days',)).fetchall()
+
+    result = {
+        'total_sessions': total,
+        'by_emotion': [dict(r) for r in by_emotion],
+        'by_input_type': [dict(r) for r in by_type],
+        'avg_confidence': _avg(conf_sum, conf_count),
+        'by_day': [dict(r) for r in by_day],
+    }
+    for name, offset in WINDOWS.items():
+        result[name] = _window(conn, offset)
+    return result
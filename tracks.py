@@ -0,0 +1,179 @@
+import json
+import re
+
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS tracks (
+        id INTEGER PRIMARY KEY,
+        track_key TEXT NOT NULL,
+        fields TEXT NOT NULL,
+        name TEXT,
+        artist TEXT,
+        album TEXT,
+        preview TEXT,
+        image TEXT,
+        url TEXT,
+        duration_ms INTEGER,
+        popularity INTEGER,
+        extra_json TEXT,
+        UNIQUE (track_key, fields)
+    );
+    CREATE TABLE IF NOT EXISTS session_tracks (
+        session_id INTEGER NOT NULL,
+        position INTEGER NOT NULL,
+        track_id INTEGER NOT NULL,
+        genre TEXT,
+        overrides_json TEXT,
+        PRIMARY KEY (session_id, position)
+    ) WITHOUT ROWID;
+'''
+
+COLUMNS = ('name', 'artist', 'album', 'preview', 'image', 'url', 'duration_ms', 'popularity')
+# belong to one request (the genre a track was searched under), so they live in session_tracks only
+SESSION_COLUMNS = ('genre',)
+KEY_CACHE_SIZE = 20000
+
+SPOTIFY_TRACK_URL = re.compile(r'open\.spotify\.com/track/([A-Za-z0-9]+)')
+
+
+def track_key(track):
+    """Spotify track id when the URL has one, else the URL, else name + artist."""
+    url = track.get('url') or ''
+    match = SPOTIFY_TRACK_URL.search(url)
+    if match:
+        return 'spotify:' + match.group(1)
+    if url:
+        return url
+    return f"{track.get('name', '')}|{track.get('artist', '')}"
+
+
+def _row(track):
+    """(track_key, fields, *COLUMNS, extra_json) for one track dict."""
+    fields = ','.join(track)
+    extra = {k: v for k, v in track.items() if k not in COLUMNS and k not in SESSION_COLUMNS}
+    return ((track_key(track), fields) + tuple(track.get(c) for c in COLUMNS)
+            + (json.dumps(extra) if extra else None,))
+
+
+def _stored(row):
+    """{field: value} of a tracks row (SESSION_COLUMNS are left None)."""
+    extra = json.loads(row['extra_json']) if row['extra_json'] else {}
+    return {k: row[k] if k in COLUMNS else None if k in SESSION_COLUMNS else extra.get(k)
+            for k in row['fields'].split(',') if k}
+
+
+def _track_from_row(row):
+    track = _stored(row)
+    if row['overrides_json']:
+        track.update(json.loads(row['overrides_json']))
+    for k in SESSION_COLUMNS:
+        if k in track:
+            track[k] = row[f'session_{k}']
+    return track
+
+
+class TrackStore:
+    """
+    Writes tracks once into `tracks` and links sessions to them through
+    `session_tracks`. The first session to save a track fixes its shared
+    row; a later session whose copy differs (e.g. popularity) keeps the
+    differing fields in its own `session_tracks.overrides_json`, and the
+    search genre is always stored per session (`session_tracks.genre`), so
+    every session reloads exactly as it was returned. Used from the single
+    writer thread; remembers recently written tracks so repeated tracks
+    cost no query.
+    """
+
+    def __init__(self):
+        self._known = {}
+
+    def track_id(self, conn, track):
+        """(id of the shared row, {field: value} where `track` differs from it, or None)."""
+        row = _row(track)
+        cache_key = row[:2]
+        known = self._known.get(cache_key)
+        if known is None:
+            placeholders = ', '.join('?' * len(row))
+            conn.execute(
+                f"INSERT INTO tracks (track_key, fields, {', '.join(COLUMNS)}, extra_json) VALUES ({placeholders}) "
+                f"ON CONFLICT(track_key, fields) DO NOTHING", row)
+            stored = conn.execute(
+                f"SELECT id, fields, {', '.join(COLUMNS)}, extra_json FROM tracks WHERE track_key = ? AND fields = ?",
+                cache_key).fetchone()
+            if len(self._known) >= KEY_CACHE_SIZE:
+                self._known.clear()
+            known = self._known[cache_key] = (stored['id'], _stored(stored))
+
+        track_id, shared = known
+        overrides = {k: v for k, v in track.items() if k not in SESSION_COLUMNS and shared.get(k) != v}
+        return track_id, overrides or None
+
+    def forget(self):
+        """Drop remembered ids, e.g. after a rolled-back transaction."""
+        self._known.clear()
+
+    def save(self, conn, session_id, tracks):
+        conn.execute('DELETE FROM session_tracks WHERE session_id = ?', (session_id,))
+        rows = []
+        for position, track in enumerate(tracks):
+            track_id, overrides = self.track_id(conn, track)
+            rows.append((session_id, position, track_id, track.get('genre'),
+                         json.dumps(overrides) if overrides else None))
+        conn.executemany(
+            'INSERT INTO session_tracks (session_id, position, track_id, genre, overrides_json) VALUES (?,?,?,?,?)',
+            rows)
+
+
+def load(conn, session_id):
+    """Rebuild a session's track list exactly as it was returned by the analyze endpoints."""
+    rows = conn.execute(
+        'SELECT t.*, st.genre AS session_genre, st.overrides_json FROM session_tracks st '
+        'JOIN tracks t ON t.id = st.track_id '
+        'WHERE st.session_id = ? ORDER BY st.position', (session_id,)).fetchall()
+    return [_track_from_row(r) for r in rows]
+
+
+def session_tracks(conn, row):
+    """Tracks for a sessions row, whether or not it has been migrated off tracks_json."""
+    if row['tracks_json'] is not None:
+        return json.loads(row['tracks_json'])
+    return load(conn, row['id'])
+
+
+def upgrade(conn):
+    """Add columns that session_tracks tables created by older versions lack."""
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(session_tracks)')}
+    if 'overrides_json' not in columns:
+        conn.execute('ALTER TABLE session_tracks ADD COLUMN overrides_json TEXT')
+    if 'genre' not in columns:
+        # rows written before: the session's genre is in its overrides or the shared row
+        conn.execute('ALTER TABLE session_tracks ADD COLUMN genre TEXT')
+        conn.execute(
+            "UPDATE session_tracks SET genre = coalesce(json_extract(overrides_json, '$.genre'), "
+            "(SELECT json_extract(t.extra_json, '$.genre') FROM tracks t WHERE t.id = session_tracks.track_id))")
+
+
+def migrate(conn, batch_size=500):
+    """Move sessions.tracks_json blobs into tracks/session_tracks, one batch per transaction."""
+    store = TrackStore()
+    last_id, migrated, skipped = 0, 0, 0
+    while True:
+        rows = conn.execute(
+            'SELECT id, tracks_json FROM sessions WHERE tracks_json IS NOT NULL AND id > ? ORDER BY id LIMIT ?',
+            (last_id, batch_size)).fetchall()
+        if not rows:
+            return migrated, skipped
+        with conn:
+            for session_id, blob in rows:
+                last_id = session_id
+                try:
+                    tracks = json.loads(blob)
+                except ValueError:
+                    skipped += 1
+                    continue
+                if not isinstance(tracks, list) or not all(isinstance(t, dict) for t in tracks):
+                    skipped += 1
+                    continue
+                store.save(conn, session_id, tracks)
+                conn.execute('UPDATE sessions SET tracks_json = NULL WHERE id = ?', (session_id,))
+                migrated += 1